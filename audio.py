@@ -0,0 +1,55 @@
+import numpy  as np
+import pygame as pg
+from settings import *
+
+def square_wave(frequency, rate, volume, periods=100):
+    """
+    Returns 16-bit samples of a square wave lasting a whole number of periods, so it loops without a
+    click. The period is rounded to a whole number of samples
+    """
+    period = max(2, round(rate / frequency))
+    wave = np.where(np.arange(period) < period // 2, volume, -volume)
+    return (np.tile(wave, periods) * 32767).astype(np.int16)
+
+class Buzzer():
+    """
+    Plays a tone while the sound timer is running. The tone is a single looping buffer built once up
+    front, which is only started and stopped when the timer starts or stops, so frames where nothing
+    changes cost one comparison. The buzzer stays silent if no audio device is available. Headless
+    runs use headless.BuzzerLog in its place.
+
+    Attributes:
+        sound (Sound): Looping tone, or None if audio is unavailable.
+        on (bool)    : Whether the tone is playing.
+    """
+
+    def __init__(self, frequency=BUZZER_FREQUENCY, volume=BUZZER_VOLUME):
+        self.on = False
+        try:
+            if not pg.mixer.get_init():
+                pg.mixer.init(AUDIO_RATE, -16, 1)
+            rate, _, channels = pg.mixer.get_init()
+        except pg.error:
+            self.sound = None
+            return
+
+        samples = square_wave(frequency, rate, volume)
+        if channels > 1:
+            samples = np.repeat(samples[:, np.newaxis], channels, axis=1)
+        self.sound = pg.sndarray.make_sound(np.ascontiguousarray(samples))
+
+    def update(self, on):
+        """ Starts or stops the tone if the sound timer has started or stopped running """
+        if on == self.on:
+            return
+        self.on = on
+        if self.sound is None:
+            return
+        if on:
+            self.sound.play(loops=-1)
+        else:
+            self.sound.stop()
+
+    def stop(self):
+        """ Silences the tone """
+        self.update(False)
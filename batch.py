@@ -0,0 +1,49 @@
+import sys
+import json
+import itertools
+import headless
+import multiprocessing
+
+def make_jobs(roms, seeds, scripts, cycles, translate=False):
+    """ Returns a job for every combination of rom, seed and input script (None for no input) """
+    return [{"rom": rom, "seed": seed, "inputs": script, "cycles": cycles, "translate": translate}
+            for (rom, seed, script) in itertools.product(roms, seeds, scripts)]
+
+def run_job(job):
+    """
+    Runs a single job headlessly and returns its result. Any exception raised by the emulator, such
+    as a KeyError from an invalid opcode, is reported in the result rather than raised
+    """
+    result = dict(job)
+    machine = None
+    try:
+        script = headless.load_input_script(job["inputs"]) if job["inputs"] else ()
+        machine = headless.load_machine(job["rom"], job["translate"], seed=job["seed"])
+        result["instructions_per_second"] = headless.run_headless(machine, job["cycles"], script)
+        result["error"] = None
+    except Exception as error:
+        result["instructions_per_second"] = None
+        result["error"] = type(error).__name__ + ": " + str(error)
+
+    if machine is not None:
+        result["cycles_executed"] = machine.cycle_count
+        result["display_hash"] = machine.display_hash()
+        result["pc"] = machine.pc
+    return result
+
+def run_batch(jobs, processes=None, timeout=None):
+    """
+    Runs the jobs across a pool of processes, yielding results as each job finishes. The workers are
+    spawned rather than forked, since forking a process running other threads can deadlock the child.
+    If a timeout is given, multiprocessing.TimeoutError is raised when no result arrives within it
+    """
+    with multiprocessing.get_context("spawn").Pool(processes) as pool:
+        results = pool.imap_unordered(run_job, jobs)
+        for _ in range(len(jobs)):
+            yield results.next(timeout)
+
+def write_results(jobs, output=sys.stdout, processes=None):
+    """ Runs the jobs, writing each result as a line of JSON as soon as it is available """
+    for result in run_batch(jobs, processes):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
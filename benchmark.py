@@ -0,0 +1,170 @@
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import cpu
+import headless
+import translator
+from time     import perf_counter
+from timeit   import Timer
+from settings import *
+
+# Roms benchmarked and the keys each game is played with by the benchmark input script
+BENCHMARK_ROMS = {
+    "pong.ch8"     : [1, 4],
+    "breakout.ch8" : [4, 6],
+    "tetris.ch8"   : [4, 5, 6, 7]
+}
+
+# Opcode microbenchmarks, as (name, opcode, CPU options). Each opcode runs with V0 to VC set to
+# 0x00 to 0xC0, VD and VE set near the bottom right corner of the screen and I set to 0x300
+OPCODE_BENCHMARKS = [
+    ("00E0", 0x00E0, {}),
+    ("00E0 packed", 0x00E0, {"packed_display": True}),
+    ("1NNN", 0x1300, {}),
+    ("3XNN", 0x3312, {}),
+    ("6XNN", 0x6312, {}),
+    ("7XNN", 0x7312, {}),
+    ("8XY0", 0x8120, {}),
+    ("8XY4", 0x8124, {}),
+    ("8XY5", 0x8125, {}),
+    ("8XY6", 0x8126, {}),
+    ("ANNN", 0xA300, {}),
+    ("CXNN", 0xC3FF, {}),
+    ("DXYN N=1", 0xD121, {}),
+    ("DXYN N=5", 0xD125, {}),
+    ("DXYN N=15", 0xD12F, {}),
+    ("DXYN N=15 wrapping", 0xDEDF, {}),
+    ("DXYN N=15 packed", 0xD12F, {"packed_display": True}),
+    ("DXYN N=15 wrapping packed", 0xDEDF, {"packed_display": True}),
+    ("EX9E", 0xE09E, {}),
+    ("FX07", 0xF307, {}),
+    ("FX1E", 0xF31E, {}),
+    ("FX29", 0xF129, {}),
+    ("FX33", 0xF333, {}),
+    ("FX55 X=F", 0xFF55, {}),
+    ("FX65 X=F", 0xFF65, {})
+]
+
+# Engine benchmarks, as programs loaded at 0x200 and run on both the interpreter and the translator
+# at the default timer rate. The loop changes V0 every iteration, so it never idles
+ENGINE_BENCHMARKS = {
+    "arithmetic loop" : bytes.fromhex("7001810482138324640583447501" "1200")
+}
+
+def input_script(keys, cycles, hold=CYCLES_PER_FRAME * 30):
+    """ Builds an input script which holds each of the keys in turn for hold cycles """
+    script = []
+    for (i, start) in enumerate(range(0, cycles, hold)):
+        key = keys[i % len(keys)]
+        script.append((start, key, True))
+        script.append((start + hold - 1, key, False))
+    return script
+
+def benchmark_rom(rom, cycles, seed, translate):
+    """
+    Runs the rom headlessly for the given number of cycles with scripted input, then again through
+    the frontend (on a dummy video driver) to measure time per frame and time spent drawing
+    """
+    script = input_script(BENCHMARK_ROMS[rom], cycles)
+    machine = headless.load_machine(rom, translate, seed=seed)
+    instructions_per_second = headless.run_headless(machine, cycles, script)
+
+    # PyGame is only imported here, and never opens a real window
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import chip8
+    frontend = chip8.Chip8(rom, False, translate, seed=seed)
+
+    frames = cycles // CYCLES_PER_FRAME
+    events = iter(sorted(script))
+    event = next(events, None)
+    draw_time = 0.0
+    start = perf_counter()
+    for frame in range(frames):
+        # Keypad changes are applied at the start of each frame, as the frontend does
+        while event is not None and event[0] < (frame + 1) * CYCLES_PER_FRAME:
+            frontend.cpu.set_key(event[1], event[2])
+            event = next(events, None)
+        headless.run_cycles(frontend.cpu, CYCLES_PER_FRAME)
+
+        draw_start = perf_counter()
+        frontend.draw()
+        draw_time += perf_counter() - draw_start
+    frame_time = perf_counter() - start
+
+    return {
+        "instructions_per_second" : instructions_per_second,
+        "display_hash"            : machine.display_hash(),
+        "frame_ms"                : 1000 * frame_time / frames,
+        "draw_ms"                 : 1000 * draw_time / frames
+    }
+
+def benchmark_opcode(opcode, options, number):
+    """ Returns the best time, in nanoseconds, of the predecoded operation for the opcode """
+    machine = cpu.Cpu(seed=0, **options)
+    machine.V[:] = bytes(i << 4 for i in range(16))
+    machine.V[0xD] = HEIGHT - 4
+    machine.V[0xE] = WIDTH - 4
+    machine.I = 0x300
+    machine.memory[0x200] = opcode >> 8
+    machine.memory[0x201] = opcode & 0xFF
+    machine.opcode, operation, _ = machine.decode(0x200)
+    return 1e9 * min(Timer(operation).repeat(repeat=3, number=number)) / number
+
+def benchmark_engine(program, cycles):
+    """ Returns the instructions per second of the program on the interpreter and the translator """
+    results = {}
+    for (name, engine) in (("interpreter", cpu.Cpu), ("translator", translator.TranslatingCpu)):
+        machine = engine(seed=0)
+        machine.memory[0x200 : 0x200 + len(program)] = program
+        start = perf_counter()
+        headless.run_cycles(machine, cycles)
+        results[name] = cycles / (perf_counter() - start)
+    results["speedup"] = results["translator"] / results["interpreter"]
+    return results
+
+def git_commit():
+    """ Returns the current git commit, if the benchmark is run from a git checkout """
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(cycles, seed, translate, number):
+    """ Runs the rom benchmarks and opcode microbenchmarks and returns the results """
+    results = {
+        "commit"    : git_commit(),
+        "python"    : platform.python_version(),
+        "cycles"    : cycles,
+        "seed"      : seed,
+        "translate" : translate,
+        "roms"      : {},
+        "engines"   : {},
+        "opcodes"   : {}
+    }
+    for rom in BENCHMARK_ROMS:
+        results["roms"][rom] = benchmark_rom(rom, cycles, seed, translate)
+    for (name, program) in ENGINE_BENCHMARKS.items():
+        results["engines"][name] = benchmark_engine(program, cycles)
+    for (name, opcode, options) in OPCODE_BENCHMARKS:
+        results["opcodes"][name] = benchmark_opcode(opcode, options, number)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chip-8 Emulator Benchmarks")
+    parser.add_argument("-c", "--cycles", type=int, metavar=" ", default=200000, help="Cycles to run each rom for")
+    parser.add_argument("-s", "--seed", type=int, metavar=" ", default=0, help="Random Number Generator Seed")
+    parser.add_argument("-n", "--number", type=int, metavar=" ", default=20000, help="Calls per opcode microbenchmark")
+    parser.add_argument("-t", "--translate", action='store_true', help="Enables Basic Block Translation")
+    parser.add_argument("-o", "--output", type=str, metavar=" ", help="JSON file to write results to")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.cycles, args.seed, args.translate, args.number)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=4)
+    else:
+        json.dump(results, sys.stdout, indent=4)
+        print("")
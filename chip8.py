@@ -1,13 +1,78 @@
+import audio
 import cpu
+import debugger
+import headless
+import movie
+import rewind
+import translator
+import os
+import random
 import sys
 import pygame as pg
 import numpy  as np
 from settings import *
 
+def dirty_rects(changed):
+    """
+    Returns rects covering the changed pixels of a display sized mask, one for each run of
+    consecutive rows containing changes, spanning the changed columns within it
+    """
+    rows = np.flatnonzero(changed.any(axis=0))
+    runs = np.split(rows, np.flatnonzero(np.diff(rows) > 1) + 1) if len(rows) else []
+
+    rects = []
+    for run in runs:
+        top, bottom = run[0], run[-1] + 1
+        cols = np.flatnonzero(changed[:, top:bottom].any(axis=1))
+        rects.append(pg.Rect(cols[0], top, cols[-1] + 1 - cols[0], bottom - top))
+    return rects
+
+def state_path(rom, slot):
+    """ Returns the file a rom's save slot is stored in """
+    return os.path.join(SAVE_DIR, rom + "." + str(slot) + ".state")
+
+def write_state(machine, path):
+    """ Writes the machine state to a file """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as state:
+        state.write(machine.save_state())
+
+def read_state(machine, path):
+    """ Restores the machine state from a file, returning False if it doesn't exist """
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as state:
+        machine.load_state(state.read())
+    return True
+
 class Chip8():
 
-    def __init__(self, rom, fullscreen):
+    def __init__(self, rom, fullscreen, translate=False, packed_display=False, seed=None, record=None):
         """ Initialise the emulator """
+        # Recorded runs need a seed, so replays draw the same random numbers
+        if record and seed is None:
+            seed = random.randrange(1 << 31)
+
+        self.setup_frontend(rom, fullscreen)
+
+        # Create the CPU, load the fontset and game rom
+        engine = translator.TranslatingCpu if translate else cpu.Cpu
+        self.cpu = engine(packed_display=packed_display, seed=seed)
+        self.cpu.load_file_to_memory("fontset.bin", 0x050)
+        self.cpu.load_file_to_memory("roms/" + rom, 0x200)
+
+        # Per-frame history, stepped back through while the rewind key is held
+        self.rewind_buffer = rewind.RewindBuffer(self.cpu)
+
+        # Movie of the keypad input, saved to the record path when recording stops
+        self.movie = movie.MovieRecorder(self.cpu, rom, seed, self.cycles_per_frame) if record else None
+        self.movie_path = record
+
+        # Debugger, which costs nothing until a breakpoint is armed. The CPU isn't run while paused
+        self.debugger = debugger.Debugger(self.cpu)
+
+    def setup_frontend(self, rom, fullscreen):
+        """ Sets up the window, buzzer and keypad, everything but the machine itself """
         # General PyGame setup
         pg.init()
         pg.display.set_caption(TITLE)
@@ -18,16 +83,26 @@ class Chip8():
         else:
             self.screen = pg.display.set_mode((WIDTH * PIXEL_DIM, HEIGHT * PIXEL_DIM))
 
-        # 2D numpy array containing (R, G, B) values for each pixel
-        self.pixels = np.zeros((WIDTH, HEIGHT, 3))
+        # Colour scale of each combination of planes a pixel can be lit in, and the phosphor decay
+        self.palette = np.array(PLANE_COLOURS, dtype=np.float32) / 255
         self.pixel_decay = 20
 
-        # Create the CPU, load the fontset and game rom
-        self.cpu = cpu.Cpu()
-        self.cpu.load_file_to_memory("fontset.bin", 0x050)
-        self.cpu.load_file_to_memory("roms/" + rom, 0x200)
+        # Per-pixel buffers, allocated for the display resolution and reallocated when it changes
+        self.resize(WIDTH, HEIGHT)
+
+        # Save state slot used by the save and load hotkeys
+        self.rom = rom
+        self.save_slot = 0
 
+        self.rewinding = False
         self.cycles_per_frame = CYCLES_PER_FRAME
+        self.movie = None
+
+        # Server streaming the display to spectators, if one is attached
+        self.spectators = None
+
+        # Tone played while the sound timer is running
+        self.buzzer = audio.Buzzer()
 
         # Keypad index translates PyGame key values to Chip-8 key values
         # Keys shown below as they appear on a standard keyboard
@@ -42,16 +117,37 @@ class Chip8():
         """ Run the game. Begins the game loop """
         self.playing = True
         while self.playing:
+            # While FX0A has halted the CPU, sleep on the event queue until a key arrives rather
+            # than spinning. Frames still pass, so the timers keep ticking
+            if (self.cpu.halted or self.debugger.paused) and not self.rewinding:
+                self.wait_for_event()
             self.clock.tick(FPS)
 
-            # Run the specified number of cycles within the current frame
-            cycles_left = self.cycles_per_frame
-            while cycles_left > 0:
-                self.events()
-                self.cpu.execute_cycle()
-                cycles_left -= 1
+            # Poll input once per frame, then run the frame's cycles in a single batch. While
+            # rewinding, step back a frame instead. Frames are cut short by the debugger stopping
+            self.events()
+            if self.rewinding:
+                self.rewind_buffer.rewind()
+                if self.movie:
+                    self.movie.truncate()
+            elif self.debugger.paused is None:
+                try:
+                    headless.run_cycles(self.cpu, self.cycles_per_frame)
+                except debugger.Break as hit:
+                    self.debugger.paused = hit
+                    print("Debugger Stopped:", hit)
+                self.rewind_buffer.push()
 
+            self.buzzer.update(self.cpu.sound_timer > 0)
             self.draw()
+            if self.spectators:
+                self.spectators.publish(self.cpu.display_bytes(), self.cpu.hires)
+
+    def wait_for_event(self):
+        """ Blocks for up to a frame until an event arrives, leaving it queued for events """
+        event = pg.event.wait(1000 // FPS)
+        if event.type != pg.NOEVENT:
+            pg.event.post(event)
 
     def events(self):
         """ Listens for events bound to terminating the game or keypad inputs """
@@ -60,17 +156,21 @@ class Chip8():
                 self.quit()
             if event.type == pg.KEYDOWN and event.key == pg.K_ESCAPE:
                 self.quit()
+            if event.type == pg.VIDEOEXPOSE or event.type == pg.WINDOWEXPOSED:
+                self.full_redraw = True
             if event.type == pg.KEYDOWN and event.key in self.keypad_index:
-                self.cpu.keypad[self.keypad_index[event.key]] = 1
+                self.set_key(self.keypad_index[event.key], True)
             if event.type == pg.KEYUP and event.key in self.keypad_index:
-                self.cpu.keypad[self.keypad_index[event.key]] = 0
+                self.set_key(self.keypad_index[event.key], False)
             if event.type == pg.KEYDOWN and event.key == pg.K_UP:
                 self.cycles_per_frame += 1
+                self.set_timer_rate()
                 print("Cycles/Frame Increased to:", self.cycles_per_frame)
             if event.type == pg.KEYDOWN and event.key == pg.K_DOWN:
                 self.cycles_per_frame -= 1
                 if self.cycles_per_frame < 1:
                     self.cycles_per_frame = 1
+                self.set_timer_rate()
                 print("Cycles/Frame Decreased to:", self.cycles_per_frame)
             if event.type == pg.KEYDOWN and event.key == pg.K_RIGHT:
                 self.pixel_decay += 10
@@ -80,35 +180,166 @@ class Chip8():
                 if self.pixel_decay < 10:
                     self.pixel_decay = 10
                 print("Pixel Decay Factor Decreased to:", self.pixel_decay)
+            if event.type == pg.KEYDOWN and event.key == pg.K_BACKSPACE:
+                self.rewinding = True
+            if event.type == pg.KEYUP and event.key == pg.K_BACKSPACE:
+                self.rewinding = False
+            if event.type == pg.KEYDOWN and event.key == pg.K_F5:
+                self.save_state()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F9:
+                self.load_state()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F6:
+                self.toggle_pause()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F7:
+                self.step()
+            if event.type == pg.KEYDOWN and event.key == pg.K_F8:
+                self.toggle_breakpoint()
+            if event.type == pg.KEYDOWN and event.key == pg.K_PAGEUP:
+                self.save_slot = (self.save_slot + 1) % SAVE_SLOTS
+                print("Save Slot Changed to:", self.save_slot)
+            if event.type == pg.KEYDOWN and event.key == pg.K_PAGEDOWN:
+                self.save_slot = (self.save_slot - 1) % SAVE_SLOTS
+                print("Save Slot Changed to:", self.save_slot)
+
+    def set_key(self, key, pressed):
+        """ Sets whether a key is pressed, recording it if a movie is being recorded """
+        self.cpu.set_key(key, pressed)
+        if self.movie:
+            self.movie.record_key(key, pressed)
+
+    def stop_recording(self):
+        """ Saves the movie being recorded and stops recording """
+        self.movie.save(self.movie_path)
+        self.movie = None
+        print("Movie Saved to:", self.movie_path)
+
+    def toggle_pause(self):
+        """ Pauses the CPU where it is, or continues it after a pause or a debugger stop """
+        if self.debugger.paused is None:
+            self.debugger.pause()
+            print("Paused at:", hex(self.cpu.pc).upper())
+        else:
+            self.debugger.resume()
+            print("Continued")
+
+    def step(self):
+        """ Executes a single instruction while paused, printing the registers after it """
+        if self.debugger.paused is None:
+            return
+        hit = self.debugger.step()
+        if hit is None:
+            self.debugger.pause()
+        else:
+            print("Debugger Stopped:", hit)
+        self.cpu.print_registers()
+        print("PC: " + hex(self.cpu.pc).upper())
+
+    def toggle_breakpoint(self):
+        """ Adds a breakpoint at the current pc, or removes the one there """
+        if self.debugger.toggle_breakpoint(self.cpu.pc):
+            print("Breakpoint Added at:", hex(self.cpu.pc).upper())
+        else:
+            print("Breakpoint Removed at:", hex(self.cpu.pc).upper())
+
+    def save_state(self):
+        """ Saves the machine state to the current save slot """
+        write_state(self.cpu, state_path(self.rom, self.save_slot))
+        print("State Saved to Slot:", self.save_slot)
+
+    def load_state(self):
+        """ Restores the machine state from the current save slot, if it has been saved to """
+        if not read_state(self.cpu, state_path(self.rom, self.save_slot)):
+            print("No State Saved in Slot:", self.save_slot)
+            return
+        # The loaded state can't be reached by replaying the movie, so it ends here
+        if self.movie:
+            self.stop_recording()
+        self.set_timer_rate()
+        print("State Loaded from Slot:", self.save_slot)
+
+    def set_timer_rate(self):
+        """ Keeps the timers ticking once per frame after the cycles per frame changes """
+        self.cpu.cycles_per_timer_tick = self.cycles_per_frame
+        self.cpu.timer_countdown = min(self.cpu.timer_countdown, self.cycles_per_frame)
+        if self.movie:
+            self.movie.record_rate(self.cycles_per_frame)
+
+    def resize(self, width, height):
+        """
+        Allocates the buffers drawing works in for a display resolution, scaling its pixels so the
+        display still fills the screen. The whole screen is redrawn on the next frame
+        """
+        self.scale = PIXEL_DIM * WIDTH // width
+
+        # Phosphor intensity (0 to 255) of each pixel, the planes it was last lit in, the colour
+        # scale of those planes and the (R, G, B) values they are converted to. All are preallocated
+        # and updated in place every frame
+        self.intensity = np.zeros((width, height), dtype=np.int16)
+        self.previous_intensity = np.zeros((width, height), dtype=np.int16)
+        self.lit_planes = np.zeros((width, height), dtype=np.uint8)
+        self.previous_lit_planes = np.zeros((width, height), dtype=np.uint8)
+        self.colours = np.zeros((width, height, 3), dtype=np.float32)
+        self.pixels = np.zeros((width, height, 3), dtype=np.uint8)
+
+        # Frame the pixel values are copied into before being scaled onto the screen. It's reused
+        # every frame, and the whole screen is only redrawn when the window needs repainting
+        self.frame = pg.Surface((width, height)).convert(self.screen)
+        self.full_redraw = True
 
     def draw(self):
-        """ Draws the updated sprites to the screen """
-        # Simulate phosphor display
-        for i in range(WIDTH):
-            for j in range(HEIGHT):
-                if self.pixels[i][j][0] != 0:
-                    curr_val = self.pixels[i][j][0]
-                    self.pixels[i][j] = tuple(max(curr_val - (255 - curr_val + self.pixel_decay), 0) for _ in range(3))
-
-        # Converts display (binary) to pixel values (R, G, B)
-        for i in range(WIDTH):
-            for j in range(HEIGHT):
-                if self.cpu.display[i][j] == 1:
-                    self.pixels[i][j] = WHITE
-
-        # Clear the screen
-        self.screen.fill(BG_COLOUR)
-
-        # Draw the pixels to the screen
-        next_frame = pg.Surface((WIDTH, HEIGHT))
-        pg.surfarray.blit_array(next_frame, self.pixels)
-        next_frame = pg.transform.scale(next_frame, (WIDTH * PIXEL_DIM, HEIGHT * PIXEL_DIM))
-        self.screen.blit(next_frame, (0, 0))
-
-        # Draws the image in the double buffer to the screen
-        pg.display.flip()
+        """
+        Draws the pixels which changed since the last frame to the screen, returning the rects of
+        the screen updated. Frames where nothing changed aren't presented at all
+        """
+        display = self.cpu.get_display()
+        if display.shape != self.intensity.shape:
+            self.resize(*display.shape)
+
+        # Simulate phosphor display. Each lit pixel's intensity falls by (255 - intensity + decay)
+        intensity = self.intensity
+        np.copyto(self.previous_intensity, intensity)
+        np.copyto(self.previous_lit_planes, self.lit_planes)
+        np.multiply(intensity, 2, out=intensity)
+        np.subtract(intensity, 255 + self.pixel_decay, out=intensity)
+        np.maximum(intensity, 0, out=intensity)
+
+        # Pixels which are on in any plane of the display are lit at full intensity, in the colour of
+        # the planes they're on in. Fading pixels keep the colour they were last lit in
+        np.putmask(intensity, display, 255)
+        np.putmask(self.lit_planes, display, display)
+
+        # Only the pixels whose intensity or colour changed, whether drawn by the CPU or fading, are
+        # redrawn
+        if self.full_redraw:
+            self.screen.fill(BG_COLOUR)
+            rects = [self.frame.get_rect()]
+            self.full_redraw = False
+        else:
+            changed = (intensity != self.previous_intensity) | (self.lit_planes != self.previous_lit_planes)
+            rects = dirty_rects(changed)
+        if not rects:
+            return []
+
+        # Converts intensities to pixel values (R, G, B)
+        np.take(self.palette, self.lit_planes, axis=0, out=self.colours)
+        np.multiply(intensity[:, :, np.newaxis], self.colours, out=self.pixels, casting="unsafe")
+        pg.surfarray.blit_array(self.frame, self.pixels)
+
+        # Scale each dirty rect of the frame straight onto the screen, then present just those rects
+        updated = []
+        for rect in rects:
+            scaled = pg.Rect(rect.x * self.scale, rect.y * self.scale, rect.w * self.scale, rect.h * self.scale)
+            pg.transform.scale(self.frame.subsurface(rect), scaled.size, self.screen.subsurface(scaled))
+            updated.append(scaled)
+        pg.display.update(updated)
+        return updated
 
     def quit(self):
-        """ Terminates the program """
+        """ Terminates the program, saving the movie being recorded """
+        if self.movie:
+            self.stop_recording()
+        if self.spectators:
+            self.spectators.stop()
+        self.buzzer.stop()
         pg.quit()
         sys.exit()
@@ -1,66 +1,178 @@
-import pygame   as pg
 import bit_math as bm
 import numpy    as np
+import os
 from settings import *
-from random   import randint
-from time     import time
+from array     import array
+from random    import Random
+from functools import partial
+from hashlib   import sha1
+from struct    import Struct
+
+# Column and row offsets of sprite pixels, used when sprites wrap around the screen edges
+SPRITE_COLUMNS = np.arange(16)
+SPRITE_ROWS    = np.arange(16)
+
+# Bitmask of every XO-CHIP plane
+ALL_PLANES = (1 << PLANES) - 1
+
+# Save state layout. A state is the header, registers, memory, packed display and RNG state. The
+# packed display holds one or more planes at the resolution given in the registers
+STATE_MAGIC     = b"C8ST"
+STATE_VERSION   = 3
+STATE_HEADER    = Struct(">4sB")
+STATE_REGISTERS = Struct(">16sHH16HBBBIIQ?b16sH?B")
+STATE_RNG       = Struct(">I625I?d")
+
+# Longest loop body, in instructions, which is checked for idling when decoding a backward jump
+IDLE_LOOP_LIMIT = 16
+
+def unpack_display(data, width, height):
+    """
+    Unpacks a display packed as Cpu.display_bytes returns it into a width x height array, where each
+    pixel is the bitmask of the planes it is lit in
+    """
+    planes = np.unpackbits(np.frombuffer(data, dtype=np.uint8)).reshape(-1, height, width)
+    display = planes[0].T.copy()
+    for (plane, pixels) in enumerate(planes[1:], 1):
+        display |= pixels.T << plane
+    return display
+
+class IdleLoop(Exception):
+    """ Raised by a backward jump once the CPU is found spinning in a loop with no side effects """
+
+    def __init__(self, address, length):
+        super().__init__(address, length)
+        self.address = address
+        self.length = length
+
+class Halt(Exception):
+    """ Raised by FX0A once it has halted the CPU to wait for a key, ending the run early """
+
+def idle_safe(opcode):
+    """
+    Returns True if the opcode only writes registers and its effects depend only on the registers,
+    timers, keypad and memory, so repeating it from the same state always does the same thing
+    """
+    msb = opcode >> 12
+    if msb == 0x8:
+        return opcode & 0x000F in (0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0xE)
+    if msb == 0xE:
+        return opcode & 0x00FF in (0x9E, 0xA1)
+    if msb == 0xF:
+        return opcode & 0x00FF in (0x07, 0x1E, 0x29, 0x65)
+    return msb in (0x3, 0x4, 0x5, 0x6, 0x7, 0x9, 0xA)
 
 class Cpu():
     """
     This class emulates the execution behaviour of the Chip-8 CPU.
 
     Attributes:
-        memory ([int]): 4KB (4096 bytes) addressable memory (0x000 to 0xFFF).
+        memory (bytearray): 4KB (4096 bytes) addressable memory (0x000 to 0xFFF).
 
         opcode (int): Current opcode the CPU is executing
 
-        V ([int]): 16 general purpose 8-bit registers. VF is used as a carry/no borrow flag
+        V (bytearray): 16 general purpose 8-bit registers. VF is used as a carry/no borrow flag
         I (int)  : 16-bit register used to store memory addresses.
 
         delay_timer (int): Description of parameter `delay_timer`.
         sound_timer (int): Description of parameter `sound_timer`.
 
+        cycles_per_timer_tick (int): Number of emulated cycles between timer decrements. Timers are
+                                     driven by emulated cycles rather than wall-clock time, so runs
+                                     behave identically at any speed.
+        timer_countdown (int)      : Cycles left until the next timer decrement.
+
         pc (int): Program counter. Programs start at 0x200 in memory.
 
-        stack ([int]): Stack of 16 16-bit values, used to save pc when returning from subroutines.
+        rng (Random): Random number generator used by CXNN. Seeding it makes runs reproducible.
+
+        cycle_count (int) : Total number of cycles run, including cycles passed idle while halted.
+        halted (bool)     : Set while the CPU has stopped executing, in which case run returns early.
+        key_register (int): Register FX0A stores the next key pressed in, or None if not waiting.
+
+        stack (array): Stack of 16 16-bit values, used to save pc when returning from subroutines.
         sp (int)     : Points to the topmost level of the stack
 
-        keypad ([int]): Contains the state of keys on the keypad. A non-zero value represents a
+        keypad (bytearray): Contains the state of keys on the keypad. A non-zero value represents a
                         pressed key.
 
+        hires (bool) : Whether SUPER-CHIP's HIRES_WIDTH x HIRES_HEIGHT mode is on, in place of the
+                       WIDTH x HEIGHT mode.
+        width (int)  : Width of the display in the current mode.
+        height (int) : Height of the display in the current mode.
+        planes (int) : Bitmask of the XO-CHIP planes drawn to, cleared and scrolled. Plane 1 only
+                       unless changed by FN01.
+        row_mask (int): Mask of the bits of a packed display row in the current mode.
+
+        display (np.ndarray): width x height array of pixels, each the bitmask of the planes it is lit
+                              in. None if the display is packed.
+        display_rows ([int]): Packed display of plane 1, one int per row with the leftmost pixel as
+                              the MSB. Only used if packed_display is set.
+        display_planes ([[int]]): Packed display rows of every plane, starting with display_rows.
+        packed_display (bool): Whether the packed display is used in place of the array.
+
         operation_lookup (dict): Contains functions for each opcode, indexed by the most significant
                                  bit (MSB). For operations which share their MSB, this dictionary
                                  links to additional dictionary for further decoding.
+
+        decode_cache (dict): Maps memory addresses to predecoded (opcode, operation, advance) entries
+                             so each instruction is only decoded once. Entries are invalidated when
+                             memory is written through the Cpu.
+        decoder (function)  : Decodes an address into a decode_cache entry on a cache miss. Normally
+                              decode, but can be swapped for an instrumented decoder with set_decoder.
+
+        idle_state (tuple): Registers, timer and keypad seen at the last backward jump over a loop
+                            with no side effects. Seeing the same state again means the CPU may be
+                            spinning, waiting on a timer or key, and the loop is checked for idling.
     """
 
-    def __init__(self):
+    __slots__ = (
+        "memory", "opcode", "V", "I", "delay_timer", "sound_timer", "cycles_per_timer_tick",
+        "timer_countdown", "pc", "rng", "cycle_count", "halted", "key_register", "stack", "sp", "keypad",
+        "hires", "width", "height", "planes", "row_mask", "packed_display", "display", "display_rows",
+        "display_planes", "operation_lookup", "system_operation_lookup", "arithmetic_operation_lookup",
+        "misc_operation_lookup", "decode_cache", "decoder", "idle_state"
+    )
+
+    def __init__(self, packed_display=False, cycles_per_timer_tick=CYCLES_PER_TIMER_TICK, seed=None):
         # Memory
-        self.memory = [0] * 4096
+        self.memory = bytearray(4096)
 
         # Current Opcode
         self.opcode = 0
 
         # Registers
-        self.V = [0] * 16
+        self.V = bytearray(16)
         self.I = 0
 
         # Timers
         self.delay_timer = 0
         self.sound_timer = 0
-        self.last_timer_decrement = time()
+        self.cycles_per_timer_tick = cycles_per_timer_tick
+        self.timer_countdown = cycles_per_timer_tick
 
         # Program Counter
         self.pc = 0x200
 
+        # Random Number Generator
+        self.rng = Random(seed)
+
+        # Execution State
+        self.cycle_count = 0
+        self.halted = False
+        self.key_register = None
+
         # Stack
-        self.stack = [0] * 16
+        self.stack = array("H", bytes(32))
         self.sp = 0
 
         # Keypad
-        self.keypad = [0] * 16
+        self.keypad = bytearray(16)
 
         # Display
-        self.display = np.zeros((WIDTH, HEIGHT))
+        self.packed_display = packed_display
+        self.planes = 1
+        self.set_resolution(False)
 
         # Operation Lookup Table
         self.operation_lookup = {
@@ -81,6 +193,19 @@ class Cpu():
             0xE: self.key_operation,
             0xF: self.misc_operation
         }
+        if packed_display:
+            self.operation_lookup[0xD] = self.display_sprite_packed
+
+        # System Operation Lookup, indexed by the whole opcode. 00CN and 00DN are decoded separately
+        self.system_operation_lookup = {
+            0x00E0: self.clear_display,
+            0x00EE: self.return_from_subroutine,
+            0x00FB: self.scroll_display_right,
+            0x00FC: self.scroll_display_left,
+            0x00FD: self.exit_interpreter,
+            0x00FE: self.low_resolution,
+            0x00FF: self.high_resolution
+        }
 
         # Arithmetic Operation Lookup
         self.arithmetic_operation_lookup = {
@@ -97,6 +222,7 @@ class Cpu():
 
         # Miscellaneous Operation Lookup
         self.misc_operation_lookup = {
+            0x01: self.select_planes ,
             0x07: self.move_delay_timer_into_reg ,
             0x0A: self.wait_for_keypress ,
             0x15: self.move_reg_into_delay_timer ,
@@ -108,35 +234,251 @@ class Cpu():
             0x65: self.load_memory_into_regs
         }
 
-    def execute_cycle(self):
-        # Fetch opcode and increment pc
-        self.opcode = (self.memory[self.pc] << 8) + self.memory[self.pc + 1]
+        # Predecoded Instruction Cache
+        self.decode_cache = {}
+        self.decoder = self.decode
 
-        # Decode and execute opcode
-        operation = self.opcode >> 12
-        self.operation_lookup[operation]()
+        # Idle Loop Detection
+        self.idle_state = None
+
+    def execute_cycle(self):
+        # Fetch the predecoded opcode, decoding it on its first execution
+        entry = self.decode_cache.get(self.pc)
+        if entry is None:
+            entry = self.decoder(self.pc)
+
+        # Execute opcode. Single steps never skip ahead through idle loops
+        self.opcode, operation, advance = entry
+        try:
+            operation()
+        except IdleLoop:
+            pass
+        except Halt:
+            # FX0A advances pc itself before halting
+            advance = False
 
         # Don't increment pc if a jump occured since we want to preserve the address we jumped to
-        if operation != 0x1 and operation != 0x2:
+        if advance:
             self.pc += 2
 
-        # Decrement timers
-        self.decrement_timers()
+        # Decrement timers once every cycles_per_timer_tick cycles
+        self.cycle_count += 1
+        self.timer_countdown -= 1
+        if self.timer_countdown <= 0:
+            self.decrement_timers()
+
+    def run(self, cycles):
+        """
+        Executes up to the given number of cycles in a tight loop and returns the number executed.
+        Returns early only if the CPU halts, after which idle can be used to let the rest of the
+        cycles pass. Cycles are run in batches which end at timer ticks, so
+        the timers are only checked once per batch. Whole iterations of idle loops are skipped up to
+        the end of each batch, crediting their cycles without executing them.
+        """
+        decode_cache = self.decode_cache
+        decode = self.decoder
+
+        executed = 0
+        idle = None
+        while executed < cycles and not self.halted:
+            batch = min(cycles - executed, self.timer_countdown)
+
+            # A loop which was idle when the last batch ended is checked again after the timer tick
+            done = 0
+            if idle is not None:
+                done = self.skip_idle_loop(idle, batch)
+                idle = None
+
+            while done < batch:
+                try:
+                    for done in range(done, batch):
+                        entry = decode_cache.get(self.pc)
+                        if entry is None:
+                            entry = decode(self.pc)
+
+                        self.opcode, operation, advance = entry
+                        operation()
+
+                        if advance:
+                            self.pc += 2
+                    done = batch
+                except IdleLoop as loop:
+                    # The jump completed, and every iteration after it would repeat the same cycles
+                    idle = loop
+                    done += 1 + (batch - done - 1) // loop.length * loop.length
+                except Halt:
+                    # FX0A completed and halted the CPU, ending the batch early
+                    done = batch = done + 1
+                except Exception:
+                    # Count the cycles completed before the failing instruction, then let it propagate
+                    self.cycle_count += done
+                    self.timer_countdown -= done
+                    raise
+
+            executed += batch
+            self.cycle_count += batch
+            self.timer_countdown -= batch
+            if self.timer_countdown <= 0:
+                self.decrement_timers()
+
+        return executed
+
+    def decode(self, address):
+        """
+        Decodes the opcode at address into an (opcode, operation, advance) entry and caches it.
+        Operations sharing an MSB are resolved to their final function with operands bound.
+        """
+        opcode = (self.memory[address] << 8) + self.memory[address + 1]
+        msb = opcode >> 12
+        x = (opcode & 0x0F00) >> 8
+        y = (opcode & 0x00F0) >> 4
+
+        if msb == 0x0:
+            if opcode & 0xFFF0 == 0x00C0:
+                operation = partial(self.scroll_display_down, opcode & 0x000F)
+            elif opcode & 0xFFF0 == 0x00D0:
+                operation = partial(self.scroll_display_up, opcode & 0x000F)
+            else:
+                operation = self.system_operation_lookup.get(opcode, self.no_operation)
+        elif msb == 0x8:
+            operation = partial(self.arithmetic_operation_lookup[opcode & 0x000F], x, y)
+        elif msb == 0xF:
+            operation = partial(self.misc_operation_lookup[opcode & 0x00FF], x)
+        elif msb == 0x1 and self.decoder == self.decode and self.idle_candidate(address, opcode & 0x0FFF):
+            operation = partial(self.jump_to_address_idle, address)
+        else:
+            operation = self.operation_lookup[msb]
+
+        entry = (opcode, operation, msb != 0x1 and msb != 0x2)
+        self.decode_cache[address] = entry
+        return entry
+
+    def set_decoder(self, decoder):
+        """
+        Switches the function used to decode instructions and empties the decode cache, so every
+        instruction is decoded again by the new decoder. Instrumentation wraps operations this way,
+        keeping the normal dispatch path free of any checks.
+        """
+        self.decoder = decoder
+        self.decode_cache.clear()
+
+    def instrumented(self):
+        """ Returns True if an instrumented decoder is in use """
+        return self.decoder != self.decode
+
+    def idle_candidate(self, address, target):
+        """
+        Returns True if the jump at address closes a short loop from target whose instructions have
+        no side effects, so it can be checked for idling. Instrumented CPUs never skip loops, since
+        the skipped instructions wouldn't be recorded
+        """
+        length = address - target
+        if length < 0 or length > 2 * IDLE_LOOP_LIMIT or length % 2:
+            return False
+        memory = self.memory
+        return all(idle_safe((memory[i] << 8) + memory[i + 1]) for i in range(target, address, 2))
+
+    def measure_idle_loop(self, address):
+        """
+        Runs one iteration of the loop from pc to the jump at address, and returns its length in
+        cycles if it leaves the registers unchanged (so every later iteration repeats it), or 0 if
+        it doesn't. The registers, pc and opcode are restored either way
+        """
+        V, I, pc, opcode = bytes(self.V), self.I, self.pc, self.opcode
+        length = 1
+        try:
+            while self.pc != address:
+                entry = self.decode_cache.get(self.pc)
+                if entry is None:
+                    entry = self.decode(self.pc)
+
+                # Skips leaving the loop end it, as does memory changed since the jump was decoded
+                self.opcode, operation, _ = entry
+                if not pc <= self.pc < address or not idle_safe(self.opcode):
+                    return 0
+                operation()
+                self.pc += 2
+                length += 1
+            return length if self.V == V and self.I == I else 0
+        except Exception:
+            # The instruction will raise again when it's really executed
+            return 0
+        finally:
+            self.V[:] = V
+            self.I, self.pc, self.opcode = I, pc, opcode
+
+    def skip_idle_loop(self, loop, cycles):
+        """
+        Returns the number of cycles of whole iterations of an idle loop which fit within cycles,
+        if the CPU is still spinning in it from the top, or 0 if it isn't
+        """
+        if self.pc != ((self.memory[loop.address] << 8) + self.memory[loop.address + 1]) & 0x0FFF:
+            return 0
+        length = self.measure_idle_loop(loop.address)
+        return cycles // length * length if length else 0
+
+    def invalidate_cache(self, address, length):
+        """ Drops predecoded entries overlapping the memory range [address, address + length) """
+        for i in range(address - 1, address + length):
+            self.decode_cache.pop(i, None)
+
+    def clear_cache(self):
+        """ Drops every predecoded entry, used when all of memory is replaced """
+        self.decode_cache.clear()
 
     ####################
     # Opcode Functions #
     ####################
 
+    def no_operation(self):
+        """ 0NNN - Calls machine code routine at NNN. Not supported, so treated as a no-op """
+        pass
+
     def clear_or_return(self):
-        """ Decodes clear and return opcodes (MSB of 0) further and calls relevant function """
-        if self.opcode == 0x00E0:
-            self.clear_display()
-        if self.opcode == 0x00EE:
-            self.return_from_subroutine()
+        """ Decodes system opcodes (MSB of 0) further and calls relevant function """
+        if self.opcode & 0xFFF0 == 0x00C0:
+            self.scroll_display_down(self.opcode & 0x000F)
+        elif self.opcode & 0xFFF0 == 0x00D0:
+            self.scroll_display_up(self.opcode & 0x000F)
+        else:
+            self.system_operation_lookup.get(self.opcode, self.no_operation)()
 
     def clear_display(self):
-        """ 00E0 - Clear display """
-        self.display = np.zeros((WIDTH, HEIGHT))
+        """ 00E0 - Clear the selected planes of the display """
+        if self.packed_display:
+            for plane in self.selected_planes():
+                plane[:] = [0] * self.height
+        else:
+            np.bitwise_and(self.display, ~self.planes & 0xFF, out=self.display)
+
+    def scroll_display_down(self, n):
+        """ 00CN - Scrolls the selected planes of the display down N pixels (SUPER-CHIP) """
+        self.scroll_display(0, n)
+
+    def scroll_display_up(self, n):
+        """ 00DN - Scrolls the selected planes of the display up N pixels (XO-CHIP) """
+        self.scroll_display(0, -n)
+
+    def scroll_display_right(self):
+        """ 00FB - Scrolls the selected planes of the display right 4 pixels (SUPER-CHIP) """
+        self.scroll_display(4, 0)
+
+    def scroll_display_left(self):
+        """ 00FC - Scrolls the selected planes of the display left 4 pixels (SUPER-CHIP) """
+        self.scroll_display(-4, 0)
+
+    def exit_interpreter(self):
+        """ 00FD - Exits the interpreter, halting the CPU for good (SUPER-CHIP) """
+        self.halted = True
+        raise Halt()
+
+    def low_resolution(self):
+        """ 00FE - Switches to the WIDTH x HEIGHT mode, clearing the display (SUPER-CHIP) """
+        self.set_resolution(False)
+
+    def high_resolution(self):
+        """ 00FF - Switches to the HIRES_WIDTH x HIRES_HEIGHT mode, clearing the display (SUPER-CHIP) """
+        self.set_resolution(True)
 
     def return_from_subroutine(self):
         """ 00EE - Return from subroutine """
@@ -147,6 +489,21 @@ class Cpu():
         """ 1NNN - Jumps to address NNN """
         self.pc = (self.opcode & 0x0FFF)
 
+    def jump_to_address_idle(self, address):
+        """
+        1NNN - Jumps to address NNN, raising IdleLoop if the loop this jump closes is found to be
+        spinning. The loop is only measured once the same state is seen twice in a row
+        """
+        self.pc = (self.opcode & 0x0FFF)
+        state = (address, bytes(self.V), self.I, self.delay_timer, bytes(self.keypad))
+        if state != self.idle_state:
+            self.idle_state = state
+            return
+
+        length = self.measure_idle_loop(address)
+        if length:
+            raise IdleLoop(address, length)
+
     def jump_to_subroutine(self):
         """ 2NNN - Calls subroutine NNN """
         self.stack[self.sp] = self.pc
@@ -251,12 +608,14 @@ class Cpu():
         """ CXNN - Sets VX to bitwise and of NN and random number (0 to 255) """
         reg = (self.opcode & 0x0F00) >> 8
         val = self.opcode & 0x00FF
-        self.V[reg] = randint(0, 255) & val
+        self.V[reg] = self.rng.randint(0, 255) & val
 
     def display_sprite(self):
         """
         DXYN - Draws a sprite at coordinate (VX, VY) of width 8 pixels and height N. Each row of
-        8 pixels is read as bit-coded starting from address I. VF set if a pixel changes from 0 to 1
+        8 pixels is read as bit-coded starting from address I. VF set if a pixel changes from 0 to 1.
+        In the HIRES mode, DXY0 draws a 16 x 16 sprite of 2 bytes per row. Each selected plane is
+        drawn with its own sprite, read one after another
         """
         self.V[0xF] = 0
 
@@ -264,16 +623,66 @@ class Cpu():
         row = self.V[(self.opcode & 0x00F0) >> 4]
         height = self.opcode & 0x000F
         width  = 8
+        if height == 0 and self.hires:
+            height = width = 16
+
+        # Sprites which don't wrap around the screen edges can use a (faster) slice of the display
+        if col + width <= self.width and row + height <= self.height:
+            region = (slice(col, col + width), slice(row, row + height))
+        else:
+            region = np.ix_((col + SPRITE_COLUMNS[:width]) % self.width, (row + SPRITE_ROWS[:height]) % self.height)
+
+        address = self.I
+        size = height * width // 8
+        self.check_memory_range(size * bin(self.planes).count("1"))
+        for plane in range(PLANES):
+            if not self.planes & (1 << plane):
+                continue
+
+            # Unpack all sprite rows at once into an array indexed the same way as the display [dx][dy]
+            sprite_bytes = np.frombuffer(self.memory, dtype=np.uint8, count=size, offset=address)
+            sprite = np.unpackbits(sprite_bytes).reshape(height, width).T
+            if plane:
+                sprite <<= plane
+            address += size
+
+            pixels = self.display[region]
+            if (pixels & sprite).any():
+                self.V[0xF] = 1
+            self.display[region] = pixels ^ sprite
+
+    def display_sprite_packed(self):
+        """ DXYN - Draws a sprite as display_sprite does, but onto the packed display rows """
+        self.V[0xF] = 0
 
-        for dy in range(height):
-            for dx in range(width):
-                x = (col + dx) % WIDTH
-                y = (row + dy) % HEIGHT
-
-                if self.display[x][y] == 1 and bm.extract_bit((width - 1) - dx, self.memory[self.I + dy]) == 1:
-                    self.V[0xF] = 1
+        col = self.V[(self.opcode & 0x0F00) >> 8] % self.width
+        row = self.V[(self.opcode & 0x00F0) >> 4]
+        height = self.opcode & 0x000F
+        width  = 8
+        if height == 0 and self.hires:
+            height = width = 16
+
+        memory = self.memory
+        address = self.I
+        shift = self.width - width
+        collision = 0
+        planes = self.selected_planes()
+        self.check_memory_range(height * width // 8 * len(planes))
+        for rows in planes:
+            for dy in range(height):
+                # Place the sprite row at the left edge, then rotate it right to col so it wraps around
+                if width == 8:
+                    bits = memory[address] << shift
+                else:
+                    bits = ((memory[address] << 8) | memory[address + 1]) << shift
+                bits = ((bits >> col) | (bits << (self.width - col))) & self.row_mask
+                y = (row + dy) % self.height
+                collision |= rows[y] & bits
+                rows[y] ^= bits
+                address += width // 8
 
-                self.display[x][y] = int(self.display[x][y]) ^ int(bm.extract_bit((width - 1) - dx, self.memory[self.I + dy]))
+        if collision:
+            self.V[0xF] = 1
 
     def key_operation(self):
         """ Decodes keypad opcodes (MSB of E) and calls relevant function """
@@ -303,13 +712,20 @@ class Cpu():
         reg = (self.opcode & 0x0F00) >> 8
         self.misc_operation_lookup[operation](reg)
 
+    def select_planes(self, planes):
+        """ FN01 - Selects the planes drawn to, cleared and scrolled, as the bitmask N (XO-CHIP) """
+        self.planes = planes & ALL_PLANES
+
     def move_delay_timer_into_reg(self, reg):
         """ FX07 - Sets VX to delay timer """
         self.V[reg] = self.delay_timer
 
     def wait_for_keypress(self, reg):
-        """ FX0A - Waits for keypress and stores it in register VX """
-        pass
+        """ FX0A - Halts the CPU until a key is pressed, which set_key then stores in register VX """
+        self.key_register = reg
+        self.halted = True
+        self.pc += 2
+        raise Halt()
 
     def move_reg_into_delay_timer(self, reg):
         """ FX15 - Sets delay timer to VX """
@@ -327,41 +743,222 @@ class Cpu():
         """ FX29 - Sets I to the location of the sprite for the character in VX """
         self.I = 0x050 + 5 * self.V[reg]
 
+    def check_memory_range(self, length):
+        """
+        Raises IndexError if the length bytes from I run beyond memory, which slice assignment
+        would otherwise silently resize memory or V to fit
+        """
+        if self.I + length > len(self.memory):
+            raise IndexError("Access of " + str(length) + " bytes from I = " + hex(self.I).upper() + " is beyond memory")
+
     def store_bcd_into_memory(self, reg):
         """ FX33 - Sets I to the binary-coded decimal of VX """
-        digits = [int(d) for d in str(self.V[reg]).zfill(3)]
-        self.memory[self.I : self.I + 3] = digits
+        self.check_memory_range(3)
+        value = self.V[reg]
+        self.memory[self.I : self.I + 3] = (value // 100, value // 10 % 10, value % 10)
+        self.invalidate_cache(self.I, 3)
 
     def store_regs_into_memory(self, reg):
         """ FX55 - Stores V0 to VX (including VX) in memory starting at address I """
-        for i in range(reg + 1):
-            self.memory[self.I + i] = self.V[i]
+        self.check_memory_range(reg + 1)
+        self.memory[self.I : self.I + reg + 1] = self.V[: reg + 1]
+        self.invalidate_cache(self.I, reg + 1)
 
     def load_memory_into_regs(self, reg):
         """ FX65 - Fills V0 to VX (including VX) with values from memory starting at address I """
-        for i in range(reg + 1):
-            self.V[i] = self.memory[self.I + i]
+        self.check_memory_range(reg + 1)
+        self.V[: reg + 1] = self.memory[self.I : self.I + reg + 1]
 
     ##################
     # Misc Functions #
     ##################
 
     def decrement_timers(self):
-        now = time()
-        if now - self.last_timer_decrement >= 1.0/60:
-            if self.delay_timer > 0:
-                self.delay_timer -= 1
+        """ Ticks the delay and sound timers and restarts the countdown to the next tick """
+        if self.delay_timer > 0:
+            self.delay_timer -= 1
+
+        if self.sound_timer > 0:
+            self.sound_timer -= 1
+
+        self.timer_countdown = self.cycles_per_timer_tick
+
+    def set_resolution(self, hires):
+        """ Switches between the WIDTH x HEIGHT and HIRES_WIDTH x HIRES_HEIGHT modes with a blank display """
+        self.hires = hires
+        self.width, self.height = (HIRES_WIDTH, HIRES_HEIGHT) if hires else (WIDTH, HEIGHT)
+        self.row_mask = (1 << self.width) - 1
+        if self.packed_display:
+            self.display = None
+            self.display_planes = [[0] * self.height for _ in range(PLANES)]
+            self.display_rows = self.display_planes[0]
+        else:
+            self.display = np.zeros((self.width, self.height), dtype=np.uint8)
+            self.display_planes = self.display_rows = None
+
+    def selected_planes(self):
+        """ Returns the packed display rows of each selected plane """
+        return [rows for (plane, rows) in enumerate(self.display_planes) if self.planes & (1 << plane)]
+
+    def scroll_display(self, dx, dy):
+        """ Moves the pixels of the selected planes by (dx, dy), dropping those moved off the display """
+        if self.packed_display:
+            for rows in self.selected_planes():
+                if dy > 0:
+                    rows[:] = [0] * dy + rows[: self.height - dy]
+                elif dy < 0:
+                    rows[:] = rows[-dy:] + [0] * -dy
+                if dx > 0:
+                    rows[:] = [bits >> dx for bits in rows]
+                elif dx < 0:
+                    rows[:] = [(bits << -dx) & self.row_mask for bits in rows]
+            return
+
+        # Shift the selected planes with slices of the whole display, whatever its resolution
+        moved = self.display & self.planes
+        self.display ^= moved
+        source = (slice(max(-dx, 0), self.width - max(dx, 0)), slice(max(-dy, 0), self.height - max(dy, 0)))
+        target = (slice(max(dx, 0), self.width - max(-dx, 0)), slice(max(dy, 0), self.height - max(-dy, 0)))
+        self.display[target] |= moved[source]
+
+    def idle(self, cycles):
+        """ Lets cycles pass without executing any, as they do while halted, still ticking the timers """
+        self.cycle_count += cycles
+        while cycles >= self.timer_countdown:
+            cycles -= self.timer_countdown
+            self.decrement_timers()
+        self.timer_countdown -= cycles
+
+    def set_key(self, key, pressed):
+        """
+        Sets whether a key is pressed. Pressing a key while FX0A is waiting stores it in VX and
+        resumes execution
+        """
+        self.keypad[key] = 1 if pressed else 0
+        if pressed and self.key_register is not None:
+            self.V[self.key_register] = key
+            self.key_register = None
+            self.halted = False
 
-            if self.sound_timer > 0:
-                self.sound_timer -= 1
+    def get_display(self):
+        """
+        Returns the display as a width x height array of plane bitmasks, unpacking it if the display
+        is packed
+        """
+        if not self.packed_display:
+            return self.display
+        return unpack_display(self.display_bytes(), self.width, self.height)
 
-            self.last_timer_decrement = now
+    def display_bytes(self):
+        """
+        Returns the display packed row by row with the leftmost pixel as the MSB. Planes other than
+        plane 1 follow it in order, up to the last one with any pixels lit
+        """
+        if self.packed_display:
+            planes = self.display_planes
+            row_bytes = self.width // 8
+            while len(planes) > 1 and not any(planes[-1]):
+                planes = planes[:-1]
+            return b"".join(row.to_bytes(row_bytes, "big") for rows in planes for row in rows)
+
+        display = self.display
+        if display.max() <= 1:
+            return np.packbits(display.T).tobytes()
+        planes = [(display >> plane) & 1 for plane in range(PLANES)]
+        while len(planes) > 1 and not planes[-1].any():
+            planes.pop()
+        return b"".join(np.packbits(pixels.T).tobytes() for pixels in planes)
+
+    def display_hash(self):
+        """ Returns a hex digest of the packed display """
+        return sha1(self.display_bytes()).hexdigest()
+
+    def set_display_bytes(self, data):
+        """
+        Replaces the display with one packed row by row at the current resolution, as returned by
+        display_bytes
+        """
+        if self.packed_display:
+            row_bytes = self.width // 8
+            plane_bytes = row_bytes * self.height
+            for (plane, rows) in enumerate(self.display_planes):
+                start = plane * plane_bytes
+                rows[:] = [int.from_bytes(data[i : i + row_bytes], "big")
+                           for i in range(start, start + plane_bytes, row_bytes)]
+        else:
+            self.display[:] = unpack_display(data, self.width, self.height)
 
     def load_file_to_memory(self, rom, start_address):
+        """ Reads the file straight into memory at start_address. Raises ValueError if it doesn't fit """
+        size = os.path.getsize(rom)
+        if size > len(self.memory) - start_address:
+            raise ValueError(rom + " is " + str(size) + " bytes, too large to load at " + hex(start_address).upper())
         with open(rom, "rb") as game:
-            data = game.read()
-            for i in range(len(data)):
-                self.memory[start_address + i] = data[i]
+            length = game.readinto(memoryview(self.memory)[start_address:])
+        self.invalidate_cache(start_address, length)
+
+    def memory_view(self):
+        """ Returns a read-only view of memory, so tools can inspect it without copying """
+        return memoryview(self.memory).toreadonly()
+
+    ###################
+    # State Functions #
+    ###################
+
+    def save_state(self):
+        """ Returns the whole machine state as a compact, versioned binary blob """
+        return b"".join((STATE_HEADER.pack(STATE_MAGIC, STATE_VERSION), self.pack_registers(),
+                         self.memory, self.display_bytes(), self.pack_rng()))
+
+    def load_state(self, state):
+        """ Restores the machine state from a blob returned by save_state """
+        magic, version = STATE_HEADER.unpack_from(state)
+        if magic != STATE_MAGIC or version != STATE_VERSION:
+            raise ValueError("Not a version " + str(STATE_VERSION) + " Chip-8 save state")
+
+        offset = STATE_HEADER.size
+        self.unpack_registers(state[offset : offset + STATE_REGISTERS.size])
+        offset += STATE_REGISTERS.size
+        self.memory[:] = state[offset : offset + len(self.memory)]
+        offset += len(self.memory)
+        self.set_display_bytes(state[offset : len(state) - STATE_RNG.size])
+        self.unpack_rng(state[len(state) - STATE_RNG.size:])
+
+        self.clear_cache()
+
+    def pack_registers(self):
+        """ Returns the registers, stack, timers, execution state and keypad packed as bytes """
+        return STATE_REGISTERS.pack(bytes(self.V), self.I, self.pc, *self.stack, self.sp,
+                                    self.delay_timer, self.sound_timer, self.cycles_per_timer_tick,
+                                    self.timer_countdown, self.cycle_count, self.halted,
+                                    -1 if self.key_register is None else self.key_register,
+                                    bytes(self.keypad), self.opcode, self.hires, self.planes)
+
+    def unpack_registers(self, data):
+        """ Restores the values packed by pack_registers """
+        values = STATE_REGISTERS.unpack(data)
+        self.V[:] = values[0]
+        self.I, self.pc = values[1:3]
+        self.stack[:] = array("H", values[3:19])
+        (self.sp, self.delay_timer, self.sound_timer, self.cycles_per_timer_tick,
+         self.timer_countdown, self.cycle_count, self.halted) = values[19:26]
+        self.key_register = None if values[26] < 0 else values[26]
+        self.keypad[:] = values[27]
+        self.opcode = values[28]
+        if values[29] != self.hires:
+            self.set_resolution(values[29])
+        self.planes = values[30]
+
+    def pack_rng(self):
+        """ Returns the random number generator state packed as bytes """
+        version, internal_state, gauss_next = self.rng.getstate()
+        return STATE_RNG.pack(version, *internal_state, gauss_next is not None, gauss_next or 0.0)
+
+    def unpack_rng(self, data):
+        """ Restores the random number generator state packed by pack_rng """
+        values = STATE_RNG.unpack(data)
+        gauss_next = values[-1] if values[-2] else None
+        self.rng.setstate((values[0], values[1:-2], gauss_next))
 
     ####################
     # Debug Functions #
@@ -370,6 +967,7 @@ class Cpu():
     def insert_to_memory(self, value, address):
         print("Inserting " + hex(value).upper() + " at memory[" + hex(address).upper() + "]")
         self.memory[address] = value
+        self.invalidate_cache(address, 1)
 
     def print_program_memory(self, length):
         print([hex(x).upper() for x in self.memory[0x200:0x200 + length]])
@@ -380,9 +978,10 @@ class Cpu():
         print("I : " + hex(self.I).upper())
 
     def print_display(self):
-        for row in range(HEIGHT):
-            for col in range(WIDTH):
-                if self.display[col][row] == 0:
+        display = self.get_display()
+        for row in range(self.height):
+            for col in range(self.width):
+                if display[col][row] == 0:
                     print("_", end = "")
                 else:
                     print("#", end = "")
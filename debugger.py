@@ -0,0 +1,353 @@
+import cmd
+import headless
+from settings import *
+from tracer   import REGISTER_NAMES
+
+class Break(Exception):
+    """
+    Raised before the instruction at pc executes when a breakpoint, watchpoint or register condition
+    is hit, ending the run early. The instruction hasn't executed, so the CPU is left as it was
+    before it.
+
+    Attributes:
+        pc (int)    : Address of the instruction the CPU stopped at.
+        reason (str): Description of what was hit.
+    """
+
+    def __init__(self, pc, reason):
+        super().__init__(pc, reason)
+        self.pc = pc
+        self.reason = reason
+
+    def __str__(self):
+        return self.reason + " at " + hex(self.pc).upper()
+
+def register_value(cpu, register):
+    """ Returns the value of a register, numbered as in trace register changes """
+    if register < 16:
+        return cpu.V[register]
+    return (cpu.I, cpu.delay_timer, cpu.sound_timer, cpu.sp)[register - 16]
+
+def memory_access(cpu, opcode):
+    """
+    Returns the (address, length, write) range of RAM the opcode will access from the CPU's current
+    state, or None if it doesn't access RAM. Instruction fetches aren't counted
+    """
+    family = opcode & 0xF0FF
+    x = (opcode & 0x0F00) >> 8
+    if family == 0xF033:
+        return (cpu.I, 3, True)
+    if family == 0xF055:
+        return (cpu.I, x + 1, True)
+    if family == 0xF065:
+        return (cpu.I, x + 1, False)
+    if opcode >> 12 == 0xD:
+        height = opcode & 0x000F
+        size = 32 if height == 0 and cpu.hires else height
+        planes = bin(cpu.planes & ((1 << PLANES) - 1)).count("1")
+        return (cpu.I, size * planes, False)
+    return None
+
+def accesses_memory(opcode):
+    """ Returns True if the opcode may read or write RAM """
+    return opcode >> 12 == 0xD or opcode & 0xF0FF in (0xF033, 0xF055, 0xF065)
+
+class Debugger():
+    """
+    Stops the CPU at PC breakpoints, at reads or writes of watched RAM ranges and when registers
+    change. Checks are made by swapping in a decoder which wraps the operations that need them, as
+    Profiler does, and only while something is armed. With nothing armed the CPU's normal dispatch
+    is restored, so an attached debugger costs nothing until it's used. Only the instructions which
+    could hit are wrapped: those at breakpoints, and those accessing RAM while a watchpoint is armed.
+    Register conditions have to be checked before every instruction.
+
+    Every check is made before the instruction executes, raising Break from Cpu.run. Watchpoints
+    stop at the instruction about to access the range, and register conditions at the instruction
+    after the one which changed the register. Stepping or continuing skips the checks on the
+    instruction the CPU stopped at, so it can move on.
+
+    Attributes:
+        cpu (Cpu): CPU being debugged.
+
+        breakpoints (set) : pc addresses to stop at.
+        watchpoints (list): (address, length, read, write) RAM ranges to stop on accesses to.
+        conditions (dict) : Maps register numbers to the value to stop at, or None to stop at any
+                            change.
+        last (dict)       : Value of each register with a condition when it was last checked.
+
+        decoder (function): Decoder which was in use when the debugger was armed, or None if it
+                            isn't armed.
+        resume_pc (int)   : Address whose checks are skipped once when resuming, or None.
+        paused (Break)    : What the CPU last stopped at, or None if it's running.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.breakpoints = set()
+        self.watchpoints = []
+        self.conditions = {}
+        self.last = {}
+        self.decoder = None
+        self.resume_pc = None
+        self.paused = None
+
+    def armed(self):
+        """ Returns True if any breakpoint, watchpoint or register condition is set """
+        return bool(self.breakpoints or self.watchpoints or self.conditions)
+
+    def update(self):
+        """
+        Swaps in the instrumented decoder if anything is armed, or restores the wrapped decoder if
+        nothing is. Every instruction is decoded again, so changes take effect immediately
+        """
+        self.resume_pc = None
+        if self.armed():
+            if self.decoder is None:
+                self.decoder = self.cpu.decoder
+            self.last = {register: register_value(self.cpu, register) for register in self.conditions}
+            self.cpu.set_decoder(self.decode)
+        elif self.decoder is not None:
+            self.cpu.set_decoder(self.decoder)
+            self.decoder = None
+
+    def add_breakpoint(self, address):
+        """ Stops the CPU before it executes the instruction at address """
+        self.breakpoints.add(address)
+        self.update()
+
+    def remove_breakpoint(self, address):
+        """ Removes the breakpoint at address, if there is one """
+        self.breakpoints.discard(address)
+        self.update()
+
+    def toggle_breakpoint(self, address):
+        """ Adds a breakpoint at address, or removes it if there is one. Returns True if added """
+        if address in self.breakpoints:
+            self.remove_breakpoint(address)
+            return False
+        self.add_breakpoint(address)
+        return True
+
+    def add_watchpoint(self, address, length=1, read=True, write=True):
+        """ Stops the CPU before any instruction which reads or writes RAM in [address, address + length) """
+        self.watchpoints.append((address, length, read, write))
+        self.update()
+
+    def remove_watchpoint(self, address):
+        """ Removes the watchpoints starting at address """
+        self.watchpoints = [watch for watch in self.watchpoints if watch[0] != address]
+        self.update()
+
+    def add_condition(self, register, value=None):
+        """ Stops the CPU once a register changes, or once it changes to value if one is given """
+        self.conditions[register] = value
+        self.update()
+
+    def remove_condition(self, register):
+        """ Removes the condition on a register, if there is one """
+        self.conditions.pop(register, None)
+        self.update()
+
+    def decode(self, address):
+        """ Decodes the address with the wrapped decoder, wrapping the operation if it could hit """
+        entry = self.decoder(address)
+        opcode, operation, advance = entry
+        breakpoint = address in self.breakpoints
+        watched = bool(self.watchpoints) and accesses_memory(opcode)
+        if not (breakpoint or watched or self.conditions):
+            return entry
+
+        cpu = self.cpu
+
+        def checked():
+            if self.resume_pc == address:
+                self.resume_pc = None
+            else:
+                if self.conditions:
+                    self.check_conditions(address)
+                if breakpoint:
+                    raise Break(address, "Breakpoint")
+                if watched:
+                    self.check_watchpoints(address, memory_access(cpu, opcode))
+            operation()
+
+        entry = (opcode, checked, advance)
+        cpu.decode_cache[address] = entry
+        return entry
+
+    def check_conditions(self, address):
+        """ Raises Break if a register has met its condition since it was last checked """
+        for (register, value) in self.conditions.items():
+            current = register_value(self.cpu, register)
+            if current == self.last[register]:
+                continue
+            self.last[register] = current
+            if value is None or current == value:
+                raise Break(address, REGISTER_NAMES[register] + " Changed to " + hex(current).upper())
+
+    def check_watchpoints(self, address, access):
+        """ Raises Break if an (address, length, write) access overlaps a watched range """
+        start, length, write = access
+        for (watch_start, watch_length, read, watch_write) in self.watchpoints:
+            if (watch_write if write else read) and start < watch_start + watch_length and watch_start < start + length:
+                kind = "Write" if write else "Read"
+                raise Break(address, kind + " of " + hex(start).upper() + "-" + hex(start + length - 1).upper())
+
+    def resume(self):
+        """ Lets the CPU move on from the instruction it stopped at """
+        if self.paused is not None and self.paused.pc == self.cpu.pc:
+            self.resume_pc = self.cpu.pc
+        self.paused = None
+
+    def run(self, cycles):
+        """
+        Continues running for up to the given number of cycles, letting any left once the CPU halts
+        pass idle. Returns the Break the CPU stopped at, or None if it ran every cycle
+        """
+        self.resume()
+        try:
+            headless.run_cycles(self.cpu, cycles)
+        except Break as hit:
+            self.paused = hit
+        return self.paused
+
+    def step(self):
+        """ Executes the single instruction at pc, returning the Break it stopped at, if any """
+        return self.run(1)
+
+    def pause(self):
+        """ Stops the CPU where it is, as though a breakpoint had been hit """
+        self.paused = Break(self.cpu.pc, "Paused")
+
+class DebuggerConsole(cmd.Cmd):
+    """
+    Console driving a Debugger from standard input. Addresses, lengths and register values are
+    hexadecimal, counts of steps and cycles are decimal.
+
+    Attributes:
+        debugger (Debugger): Debugger being driven.
+        cycles (int)       : Cycles left to run, which continue never runs past.
+    """
+
+    intro = "Chip-8 Debugger. Type help for a list of commands"
+    prompt = "(chip8) "
+
+    def __init__(self, debugger, cycles, stdin=None, stdout=None):
+        super().__init__(stdin=stdin, stdout=stdout)
+        if stdin is not None:
+            self.use_rawinput = False
+        self.debugger = debugger
+        self.cycles = cycles
+
+    def emptyline(self):
+        """ Repeats nothing, unlike Cmd's default of repeating the last command """
+
+    def default(self, line):
+        self.stdout.write("Unknown command: " + line + "\n")
+
+    def onecmd(self, line):
+        # Bad operands print an error rather than ending the console
+        try:
+            return super().onecmd(line)
+        except (ValueError, IndexError, KeyError):
+            self.stdout.write("Invalid arguments: " + line + "\n")
+            return False
+
+    def print_location(self):
+        cpu = self.debugger.cpu
+        opcode = (cpu.memory[cpu.pc] << 8) + cpu.memory[cpu.pc + 1]
+        self.stdout.write("PC: " + hex(cpu.pc).upper() + "  Opcode: " + hex(opcode).upper()
+                          + "  Cycle: " + str(cpu.cycle_count) + "\n")
+
+    def execute(self, cycles):
+        cpu = self.debugger.cpu
+        start = cpu.cycle_count
+        hit = self.debugger.run(min(cycles, self.cycles))
+        self.cycles -= cpu.cycle_count - start
+        if hit is not None:
+            self.stdout.write(str(hit) + "\n")
+        elif self.cycles <= 0:
+            self.stdout.write("Ran all Cycles\n")
+        self.print_location()
+
+    def do_break(self, arg):
+        """ break ADDRESS: Stops before the instruction at ADDRESS executes """
+        self.debugger.add_breakpoint(int(arg, 16))
+
+    def do_delete(self, arg):
+        """ delete ADDRESS: Removes the breakpoint at ADDRESS """
+        self.debugger.remove_breakpoint(int(arg, 16))
+
+    def do_watch(self, arg):
+        """ watch ADDRESS [LENGTH] [r|w|rw]: Stops before RAM in the range is read or written """
+        args = arg.split()
+        length = int(args[1], 16) if len(args) > 1 else 1
+        mode = args[2] if len(args) > 2 else "rw"
+        if not mode or set(mode) - set("rw"):
+            raise ValueError(mode)
+        self.debugger.add_watchpoint(int(args[0], 16), length, "r" in mode, "w" in mode)
+
+    def do_unwatch(self, arg):
+        """ unwatch ADDRESS: Removes the watchpoints starting at ADDRESS """
+        self.debugger.remove_watchpoint(int(arg, 16))
+
+    def do_when(self, arg):
+        """ when REGISTER [VALUE]: Stops once REGISTER (V0-VF, I, DT, ST or SP) changes, or changes to VALUE """
+        args = arg.split()
+        register = REGISTER_NAMES.index(args[0].upper())
+        self.debugger.add_condition(register, int(args[1], 16) if len(args) > 1 else None)
+
+    def do_unwhen(self, arg):
+        """ unwhen REGISTER: Removes the condition on REGISTER """
+        self.debugger.remove_condition(REGISTER_NAMES.index(arg.strip().upper()))
+
+    def do_step(self, arg):
+        """ step [COUNT]: Executes COUNT instructions, 1 by default """
+        for _ in range(int(arg) if arg else 1):
+            if self.cycles <= 0 or self.debugger.run(1) is not None:
+                break
+            self.cycles -= 1
+        if self.debugger.paused is not None:
+            self.stdout.write(str(self.debugger.paused) + "\n")
+        self.print_location()
+
+    def do_continue(self, arg):
+        """ continue [CYCLES]: Runs until something is hit, for at most CYCLES cycles """
+        self.execute(int(arg) if arg else self.cycles)
+
+    def do_registers(self, arg):
+        """ registers: Prints the registers """
+        cpu = self.debugger.cpu
+        values = [register_value(cpu, register) for register in range(len(REGISTER_NAMES))]
+        self.stdout.write("  ".join(name + ": " + hex(value).upper() for (name, value) in zip(REGISTER_NAMES, values)) + "\n")
+        self.print_location()
+
+    def do_memory(self, arg):
+        """ memory ADDRESS [LENGTH]: Prints LENGTH bytes of RAM from ADDRESS, 16 by default """
+        args = arg.split()
+        address = int(args[0], 16)
+        length = int(args[1], 16) if len(args) > 1 else 16
+        data = self.debugger.cpu.memory[address : address + length]
+        for offset in range(0, len(data), 16):
+            self.stdout.write(hex(address + offset).upper() + ": " + data[offset : offset + 16].hex(" ").upper() + "\n")
+
+    def do_list(self, arg):
+        """ list: Prints the armed breakpoints, watchpoints and register conditions """
+        debugger = self.debugger
+        for address in sorted(debugger.breakpoints):
+            self.stdout.write("Breakpoint " + hex(address).upper() + "\n")
+        for (address, length, read, write) in debugger.watchpoints:
+            mode = ("r" if read else "") + ("w" if write else "")
+            self.stdout.write("Watchpoint " + hex(address).upper() + " Length " + hex(length).upper() + " " + mode + "\n")
+        for (register, value) in debugger.conditions.items():
+            self.stdout.write("When " + REGISTER_NAMES[register] + (" = " + hex(value).upper() if value is not None else " Changes") + "\n")
+
+    def do_quit(self, arg):
+        """ quit: Ends the run """
+        return True
+
+    do_b = do_break
+    do_s = do_step
+    do_c = do_continue
+    do_q = do_quit
+    do_EOF = do_quit
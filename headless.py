@@ -0,0 +1,124 @@
+import cpu
+import translator
+import os
+import json
+from time import perf_counter
+
+def rom_path(rom):
+    """ Resolves a rom name to a file, looking in the roms directory if it isn't a path itself """
+    if os.path.isfile(rom):
+        return rom
+    return os.path.join("roms", rom)
+
+def load_machine(rom, translate=False, **options):
+    """
+    Creates a CPU with the fontset and game rom loaded. No PyGame setup is performed. Any options
+    are passed to the CPU constructor
+    """
+    engine = translator.TranslatingCpu if translate else cpu.Cpu
+    machine = engine(**options)
+    machine.load_file_to_memory("fontset.bin", 0x050)
+    machine.load_file_to_memory(rom_path(rom), 0x200)
+    return machine
+
+def load_input_script(path):
+    """
+    Loads a scripted input file. Scripts are JSON lists of [cycle, key, pressed] keypad events, where
+    cycle is counted from the start of the run
+    """
+    with open(path) as script:
+        return [tuple(event) for event in json.load(script)]
+
+def run_script(machine, cycles, script, buzzer=None):
+    """
+    Runs the machine for the given number of cycles, applying each scripted keypad event once its
+    cycle is reached. Cycles spent halted waiting for a key pass idle. Returns the number of cycles
+    run
+    """
+    start = machine.cycle_count
+    for (cycle, key, pressed) in sorted(script):
+        if cycle >= cycles:
+            break
+        run_cycles(machine, start + cycle - machine.cycle_count, buzzer)
+        machine.set_key(key, pressed)
+    run_cycles(machine, start + cycles - machine.cycle_count, buzzer)
+    return machine.cycle_count - start
+
+def run_cycles(machine, cycles, buzzer=None):
+    """
+    Runs the machine for the given number of cycles, letting any left once it halts pass idle. If a
+    buzzer is given, the cycles are run a timer tick at a time and it's updated after each one, so
+    it sees the sound timer start at the first tick after the FX18 which set it
+    """
+    if buzzer is None:
+        machine.idle(cycles - machine.run(cycles))
+        return
+    while cycles > 0:
+        batch = min(cycles, machine.timer_countdown)
+        machine.idle(batch - machine.run(batch))
+        buzzer.update(machine.sound_timer > 0)
+        cycles -= batch
+
+def run_headless(machine, cycles, script=(), buzzer=None):
+    """
+    Runs the machine at full speed for the given number of cycles with no display, audio or event
+    loop. Keypad input is taken from the script, if one is given, and the buzzer is recorded by the
+    BuzzerLog, if one is given. Returns the instructions executed per second
+    """
+    start = perf_counter()
+    executed = run_script(machine, cycles, script, buzzer)
+    elapsed = perf_counter() - start
+
+    return executed / elapsed if elapsed > 0 else float("inf")
+
+def print_report(machine, instructions_per_second, buzzer=None):
+    """
+    Prints the final display hash, registers and instructions per second of a headless run, and the
+    buzzer intervals if a BuzzerLog is given
+    """
+    print("Display Hash: " + machine.display_hash())
+    machine.print_registers()
+    print("PC: " + hex(machine.pc).upper())
+    print("Instructions/Second: " + str(int(instructions_per_second)))
+    if buzzer is not None:
+        buzzer.stop()
+        print("Buzzer Intervals, Accurate to a Timer Tick of " + str(machine.cycles_per_timer_tick) + " Cycles:")
+        for (start, end) in buzzer.intervals:
+            print("Buzzer On: Cycles " + str(start) + " to " + str(end))
+
+class BuzzerLog():
+    """
+    Stands in for the Buzzer in headless mode, recording the cycles the tone would play between
+    instead of playing it. As the frontend updates the Buzzer once per frame, it's updated once per
+    timer tick rather than per instruction. Intervals start at the first tick after the FX18 which
+    started the sound timer, so they're only accurate to one tick. They end exactly, since the timer
+    only stops on a tick.
+
+    Attributes:
+        cpu (Cpu): CPU whose cycle count the intervals are taken from.
+
+        intervals (list): (start, end) cycles of each interval the tone played for.
+        start (int)     : Cycle the tone started at, or None if it isn't playing.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.intervals = []
+        self.start = None
+
+    @property
+    def on(self):
+        """ Whether the tone is playing """
+        return self.start is not None
+
+    def update(self, on):
+        """ Starts or ends an interval if the sound timer has started or stopped running """
+        if on and self.start is None:
+            self.start = self.cpu.cycle_count
+        elif not on and self.start is not None:
+            self.intervals.append((self.start, self.cpu.cycle_count))
+            self.start = None
+
+    def stop(self):
+        """ Ends the interval being recorded, if any """
+        self.update(False)
@@ -1,16 +1,171 @@
-import chip8
 import sys
+import atexit
 import argparse
+import profiler
+import tracer
 
-# Process command line arguments
+COMMANDS = ("run", "batch", "replay")
+
+# Process command line arguments. The run command is assumed if no command is given
 # -r argument specifies game file
 # -f argument enables fullscreen
+# -t argument enables the translating (basic block) execution engine
+# -p argument enables the packed (one int per row) display
+# -s argument runs the CPU in a separate process from the display, sharing frames through shared memory
+# --headless runs the rom for --cycles cycles without PyGame and prints the final state
+# --seed seeds the random number generator, --inputs gives a scripted input file for headless runs
+# --break arms PC breakpoints at the given hex addresses. --debug drives a headless run from a
+# debugger console, as do breakpoints given to a headless run
+# --buzzer reports the cycles the buzzer would have sounded between in a headless run, to a timer tick
+# --profile records opcode and address statistics, written to the given JSON file on exit and
+# summarised on the console
+# --trace streams a binary record of every executed instruction to the given file. --trace-sample
+# records only every Nth instruction, --trace-ring keeps only the last N, written on exit
+# --record saves the keypad input of a windowed run to the given movie file on exit
+# --spectate streams the display of a windowed run to spectators on the given host:port or Unix socket
+# The batch command runs every combination of --roms, --seeds and --inputs headlessly across a pool
+# of processes, writing a line of JSON per job as it finishes
+# The replay command replays a movie headlessly at full speed, checking each frame against a
+# --golden file of display hashes, or writing the golden file with --update
 parser = argparse.ArgumentParser(description="Chip-8 Emulator")
-parser.add_argument("-r", "--rom", type=str, metavar=" ", required=True, help="Name of Chip-8 Rom File")
-parser.add_argument("-f", "--fullscreen", action='store_true', help="Enables Fullscreen")
-args = parser.parse_args()
-
-# Run the emulator
-chip8 = chip8.Chip8(args.rom, args.fullscreen)
-while True:
-    chip8.run()
+subparsers = parser.add_subparsers(dest="command")
+
+run_parser = subparsers.add_parser("run", help="Run a Chip-8 Rom")
+run_parser.add_argument("-r", "--rom", type=str, metavar=" ", required=True, help="Name of Chip-8 Rom File")
+run_parser.add_argument("-f", "--fullscreen", action='store_true', help="Enables Fullscreen")
+run_parser.add_argument("-t", "--translate", action='store_true', help="Enables Basic Block Translation")
+run_parser.add_argument("-p", "--packed", action='store_true', help="Enables the Packed Display")
+run_parser.add_argument("-s", "--split", action='store_true', help="Runs Emulation and Display in Separate Processes")
+run_parser.add_argument("--headless", action='store_true', help="Runs without a display, audio or event loop")
+run_parser.add_argument("--cycles", type=int, metavar=" ", default=1000000, help="Cycles to run in headless mode")
+run_parser.add_argument("--seed", type=int, metavar=" ", help="Random Number Generator Seed")
+run_parser.add_argument("--inputs", type=str, metavar=" ", help="Scripted Input File for headless mode")
+run_parser.add_argument("--break", type=lambda address: int(address, 16), nargs="+", metavar=" ", default=[], dest="breaks", help="Hex Addresses of Breakpoints")
+run_parser.add_argument("--debug", action='store_true', help="Runs a headless run from the Debugger Console")
+run_parser.add_argument("--buzzer", action='store_true', help="Reports Buzzer Intervals in headless mode")
+run_parser.add_argument("--profile", type=str, metavar=" ", help="JSON File to write profiling statistics to")
+run_parser.add_argument("--trace", type=str, metavar=" ", help="File to write an execution trace to")
+run_parser.add_argument("--trace-sample", type=int, metavar=" ", default=1, help="Trace every Nth instruction")
+run_parser.add_argument("--trace-ring", type=int, metavar=" ", help="Keep only the last N trace records")
+run_parser.add_argument("--record", type=str, metavar=" ", help="Movie File to record keypad input to")
+run_parser.add_argument("--spectate", type=str, metavar=" ", help="host:port or Unix Socket to stream the display to")
+
+batch_parser = subparsers.add_parser("batch", help="Run many Chip-8 Roms headlessly")
+batch_parser.add_argument("--roms", type=str, nargs="+", metavar=" ", required=True, help="Chip-8 Rom Files")
+batch_parser.add_argument("--seeds", type=int, nargs="+", metavar=" ", default=[0], help="Random Number Generator Seeds")
+batch_parser.add_argument("--inputs", type=str, nargs="+", metavar=" ", default=[None], help="Scripted Input Files")
+batch_parser.add_argument("--cycles", type=int, metavar=" ", default=1000000, help="Cycles to run each job for")
+batch_parser.add_argument("--processes", type=int, metavar=" ", help="Number of processes (defaults to one per core)")
+batch_parser.add_argument("-t", "--translate", action='store_true', help="Enables Basic Block Translation")
+batch_parser.add_argument("-o", "--output", type=str, metavar=" ", help="JSON lines file to write results to")
+
+replay_parser = subparsers.add_parser("replay", help="Replay a recorded Chip-8 movie headlessly")
+replay_parser.add_argument("movie", type=str, help="Movie File to replay")
+replay_parser.add_argument("--golden", type=str, metavar=" ", help="Golden File of per-frame display hashes")
+replay_parser.add_argument("--update", action='store_true', help="Writes the golden file instead of checking it")
+replay_parser.add_argument("-t", "--translate", action='store_true', help="Enables Basic Block Translation")
+replay_parser.add_argument("-p", "--packed", action='store_true', help="Enables the Packed Display")
+
+def start_profiler(machine):
+    """ Attaches a profiler to the CPU if requested, writing its statistics on exit """
+    if args.profile:
+        machine_profiler = profiler.Profiler(machine)
+        machine_profiler.attach()
+        atexit.register(machine_profiler.dump, args.profile)
+        atexit.register(machine_profiler.print_report)
+
+def start_tracer(machine):
+    """ Attaches a tracer to the CPU if requested, closing the trace on exit """
+    if args.trace:
+        path = None if args.trace_ring else args.trace
+        machine_tracer = tracer.Tracer(machine, path, args.trace_sample, args.trace_ring)
+        machine_tracer.attach()
+        if args.trace_ring:
+            atexit.register(machine_tracer.dump, args.trace)
+        atexit.register(machine_tracer.close)
+
+# Guarded so the processes spawned by the batch command and -s can import this module
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in COMMANDS + ("-h", "--help"):
+        sys.argv.insert(1, "run")
+    args = parser.parse_args()
+
+    if args.command == "batch":
+        import batch
+        jobs = batch.make_jobs(args.roms, args.seeds, args.inputs, args.cycles, args.translate)
+        if args.output:
+            with open(args.output, "w") as output:
+                batch.write_results(jobs, output, args.processes)
+        else:
+            batch.write_results(jobs, processes=args.processes)
+    elif args.command == "replay":
+        # Replay the movie at full speed, PyGame is never imported
+        import movie
+        from time import perf_counter
+        recording = movie.read_movie(args.movie)
+        machine = movie.load_movie_machine(recording, args.translate, packed_display=args.packed)
+        start = perf_counter()
+        if args.update:
+            movie.write_golden(movie.replay(machine, recording), args.golden)
+            print("Golden File Written:", args.golden)
+            divergence = None
+        elif args.golden:
+            divergence = movie.check_golden(machine, recording, movie.read_golden(args.golden))
+        else:
+            divergence = None
+            for _ in movie.replay(machine, recording):
+                pass
+        elapsed = perf_counter() - start
+
+        print("Replayed " + str(machine.cycle_count) + " of " + str(recording.length) + " Cycles in "
+              + str(round(elapsed, 3)) + " Seconds")
+        if divergence is not None:
+            frame, expected, actual = divergence
+            print("Diverged from Golden File at Frame:", frame)
+            print("Expected: " + (expected.hex() if expected else "(end of golden file)"))
+            print("Actual: " + (actual.hex() if actual else "(end of movie)"))
+            sys.exit(1)
+        if args.golden and not args.update:
+            print("All Frames Match Golden File")
+    elif args.headless:
+        # Run the rom at full speed, PyGame is never imported
+        import headless
+        script = headless.load_input_script(args.inputs) if args.inputs else ()
+        machine = headless.load_machine(args.rom, args.translate, packed_display=args.packed, seed=args.seed)
+        start_profiler(machine)
+        start_tracer(machine)
+        if args.debug or args.breaks:
+            import debugger
+            machine_debugger = debugger.Debugger(machine)
+            for address in args.breaks:
+                machine_debugger.add_breakpoint(address)
+            debugger.DebuggerConsole(machine_debugger, args.cycles).cmdloop()
+        else:
+            buzzer = headless.BuzzerLog(machine) if args.buzzer else None
+            instructions_per_second = headless.run_headless(machine, args.cycles, script, buzzer)
+            headless.print_report(machine, instructions_per_second, buzzer)
+    elif args.split:
+        if args.record or args.spectate or args.breaks:
+            parser.error("--record, --spectate and --break are not supported with -s")
+        # Run the emulator with the CPU in its own process, which profiles it itself
+        import split
+        chip8 = split.SplitChip8(args.rom, args.fullscreen, args.translate, args.packed, args.seed, args.profile)
+        while True:
+            chip8.run()
+    else:
+        # Run the emulator
+        import chip8
+        chip8 = chip8.Chip8(args.rom, args.fullscreen, args.translate, args.packed, args.seed, args.record)
+        start_profiler(chip8.cpu)
+        start_tracer(chip8.cpu)
+        for address in args.breaks:
+            chip8.debugger.add_breakpoint(address)
+        if args.spectate:
+            import spectate
+            chip8.spectators = spectate.server_for_address(args.spectate)
+            try:
+                chip8.spectators.start()
+            except OSError as error:
+                parser.error("can't spectate on {}: {}".format(args.spectate, error))
+        while True:
+            chip8.run()
@@ -0,0 +1,187 @@
+import headless
+from collections import deque, namedtuple
+from hashlib     import sha1
+from itertools   import zip_longest
+from struct      import Struct
+
+# Movie file layout. The header gives the seed, the cycles per frame at the start, the length in
+# cycles, the number of keypad events and timer rate changes and the length of the rom name. It's
+# followed by the rom name, the keypad events and then the timer rate changes
+MOVIE_MAGIC   = b"C8MV"
+MOVIE_VERSION = 1
+MOVIE_HEADER  = Struct(">4sBqIQIIH")
+KEY_EVENT     = Struct(">IB")
+RATE_CHANGE   = Struct(">QI")
+
+# Golden file layout. The header gives the number of frames, followed by the leading bytes of the
+# SHA-1 digest of each frame's packed display
+GOLDEN_MAGIC       = b"C8GD"
+GOLDEN_VERSION     = 1
+GOLDEN_HEADER      = Struct(">4sBI")
+GOLDEN_DIGEST_SIZE = 8
+
+# A recorded run. keys are [cycle, key, pressed] events as in input scripts, rates are
+# [cycle, cycles per frame] changes. Cycles are counted from the start of the run
+Movie = namedtuple("Movie", ["rom", "seed", "cycles_per_frame", "length", "keys", "rates"])
+
+class MovieRecorder():
+    """
+    Records the keypad events and timer rate changes of a run, stamped with the cycle they were
+    applied at, so the run can be replayed exactly from its seed. When the CPU is rewound, events
+    from the abandoned frames are dropped.
+
+    Attributes:
+        cpu (Cpu): CPU whose input is recorded.
+
+        rom (str)             : Rom the CPU is running.
+        seed (int)            : Seed of the CPU's random number generator.
+        cycles_per_frame (int): Cycles per frame when recording started.
+        start_cycle (int)     : Cycle count of the CPU when recording started.
+
+        keys (list) : Recorded (cycle, key, pressed) events.
+        rates (list): Recorded (cycle, cycles per frame) changes.
+    """
+
+    def __init__(self, cpu, rom, seed, cycles_per_frame):
+        self.cpu = cpu
+        self.rom = rom
+        self.seed = seed
+        self.cycles_per_frame = cycles_per_frame
+        self.start_cycle = cpu.cycle_count
+        self.keys = []
+        self.rates = []
+
+    def cycle(self):
+        """ Returns the cycle the CPU is at, counted from the start of the recording """
+        return self.cpu.cycle_count - self.start_cycle
+
+    def record_key(self, key, pressed):
+        """ Records a key being pressed or released """
+        self.keys.append((self.cycle(), key, bool(pressed)))
+
+    def record_rate(self, cycles_per_frame):
+        """ Records a change to the cycles per frame, which the timers tick once every """
+        self.rates.append((self.cycle(), cycles_per_frame))
+
+    def truncate(self):
+        """ Drops the events from the current cycle on, after the CPU has been rewound """
+        cycle = self.cycle()
+        self.keys = [event for event in self.keys if event[0] < cycle]
+        self.rates = [change for change in self.rates if change[0] < cycle]
+
+    def movie(self):
+        """ Returns the run recorded so far as a Movie """
+        return Movie(self.rom, self.seed, self.cycles_per_frame, self.cycle(), list(self.keys), list(self.rates))
+
+    def save(self, path):
+        """ Writes the run recorded so far to a movie file """
+        write_movie(self.movie(), path)
+
+def write_movie(movie, path):
+    """ Writes a Movie to a file """
+    rom = movie.rom.encode()
+    with open(path, "wb") as output:
+        output.write(MOVIE_HEADER.pack(MOVIE_MAGIC, MOVIE_VERSION, movie.seed, movie.cycles_per_frame,
+                                       movie.length, len(movie.keys), len(movie.rates), len(rom)))
+        output.write(rom)
+
+        # Keypad events are stored as the cycles since the previous event and the key, with its top
+        # bit set if pressed
+        previous = 0
+        for (cycle, key, pressed) in movie.keys:
+            output.write(KEY_EVENT.pack(cycle - previous, key | (0x80 if pressed else 0)))
+            previous = cycle
+        for change in movie.rates:
+            output.write(RATE_CHANGE.pack(*change))
+
+def read_movie(path):
+    """ Reads a Movie from a file """
+    with open(path, "rb") as movie:
+        data = movie.read()
+    magic, version, seed, cycles_per_frame, length, key_count, rate_count, rom_length = MOVIE_HEADER.unpack_from(data)
+    if magic != MOVIE_MAGIC or version != MOVIE_VERSION:
+        raise ValueError("Not a version " + str(MOVIE_VERSION) + " Chip-8 movie")
+
+    offset = MOVIE_HEADER.size
+    rom = data[offset : offset + rom_length].decode()
+    offset += rom_length
+
+    keys = []
+    cycle = 0
+    for (delta, code) in KEY_EVENT.iter_unpack(data[offset : offset + key_count * KEY_EVENT.size]):
+        cycle += delta
+        keys.append((cycle, code & 0x0F, bool(code & 0x80)))
+    offset += key_count * KEY_EVENT.size
+    rates = list(RATE_CHANGE.iter_unpack(data[offset : offset + rate_count * RATE_CHANGE.size]))
+
+    return Movie(rom, seed, cycles_per_frame, length, keys, rates)
+
+def load_movie_machine(movie, translate=False, **options):
+    """ Creates a CPU with the movie's rom loaded and its random number generator seeded """
+    return headless.load_machine(movie.rom, translate, seed=movie.seed, **options)
+
+def set_timer_rate(machine, cycles_per_frame):
+    """ Keeps the timers ticking once per frame, as Chip8.set_timer_rate does """
+    machine.cycles_per_timer_tick = cycles_per_frame
+    machine.timer_countdown = min(machine.timer_countdown, cycles_per_frame)
+
+def replay(machine, movie):
+    """
+    Replays a movie on a machine as fast as possible, applying each event once its cycle is reached.
+    Yields the packed display at the end of each frame. Frames are cut short where an event falls
+    inside them, which only happens if the movie wasn't recorded a frame at a time
+    """
+    keys, rates = deque(movie.keys), deque(movie.rates)
+    cycles_per_frame = movie.cycles_per_frame
+    set_timer_rate(machine, cycles_per_frame)
+
+    cycle = 0
+    while cycle < movie.length:
+        while keys and keys[0][0] <= cycle:
+            _, key, pressed = keys.popleft()
+            machine.set_key(key, pressed)
+        while rates and rates[0][0] <= cycle:
+            cycles_per_frame = rates.popleft()[1]
+            set_timer_rate(machine, cycles_per_frame)
+
+        end = min(cycle + cycles_per_frame, movie.length)
+        if keys:
+            end = min(end, keys[0][0])
+        if rates:
+            end = min(end, rates[0][0])
+        headless.run_cycles(machine, end - cycle)
+        cycle = end
+        yield machine.display_bytes()
+
+def frame_digest(frame):
+    """ Returns the digest of a packed display stored in golden files """
+    return sha1(frame).digest()[:GOLDEN_DIGEST_SIZE]
+
+def write_golden(frames, path):
+    """ Writes the digests of packed displays, such as those replay yields, to a golden file """
+    digests = b"".join(frame_digest(frame) for frame in frames)
+    with open(path, "wb") as output:
+        output.write(GOLDEN_HEADER.pack(GOLDEN_MAGIC, GOLDEN_VERSION, len(digests) // GOLDEN_DIGEST_SIZE))
+        output.write(digests)
+
+def read_golden(path):
+    """ Returns the list of frame digests in a golden file """
+    with open(path, "rb") as golden:
+        data = golden.read()
+    magic, version, count = GOLDEN_HEADER.unpack_from(data)
+    if magic != GOLDEN_MAGIC or version != GOLDEN_VERSION:
+        raise ValueError("Not a version " + str(GOLDEN_VERSION) + " Chip-8 golden file")
+    digests = data[GOLDEN_HEADER.size:]
+    return [digests[i : i + GOLDEN_DIGEST_SIZE] for i in range(0, count * GOLDEN_DIGEST_SIZE, GOLDEN_DIGEST_SIZE)]
+
+def check_golden(machine, movie, golden):
+    """
+    Replays a movie, comparing each frame against the golden digests. Stops at the first frame
+    which differs, returning (frame, expected digest, actual digest), or returns None if every frame
+    matches. If the replay and golden file differ in length, the missing digest is None
+    """
+    frames = (frame_digest(frame) for frame in replay(machine, movie))
+    for (index, (expected, actual)) in enumerate(zip_longest(golden, frames)):
+        if expected != actual:
+            return (index, expected, actual)
+    return None
@@ -0,0 +1,125 @@
+import json
+from collections import defaultdict
+from time        import perf_counter
+
+def opcode_family(opcode):
+    """ Returns the name of the family an opcode belongs to, e.g. 0xD125 -> "DXYN" """
+    msb = opcode >> 12
+    if msb == 0x0:
+        if opcode & 0xFFE0 == 0x00C0:
+            return "00" + hex(opcode >> 4)[2:].upper() + "N"
+        if opcode in (0x00E0, 0x00EE, 0x00FB, 0x00FC, 0x00FD, 0x00FE, 0x00FF):
+            return hex(opcode)[2:].upper().zfill(4)
+        return "0NNN"
+    if msb == 0x8:
+        return "8XY" + hex(opcode & 0x000F)[2:].upper()
+    if opcode & 0xF0FF == 0xF001:
+        return "FN01"
+    if msb == 0xE or msb == 0xF:
+        return hex(msb)[2:].upper() + "X" + hex(opcode & 0x00FF)[2:].upper().zfill(2)
+    return ["", "1NNN", "2NNN", "3XNN", "4XNN", "5XY0", "6XNN", "7XNN", "",
+            "9XY0", "ANNN", "BNNN", "CXNN", "DXYN"][msb]
+
+class Profiler():
+    """
+    Records execution counts and cumulative host time for each opcode family and each pc address,
+    sprite draws per frame (timer tick) and FX07 reads made while the delay timer is still running.
+
+    Recording works by swapping in an instrumented decoder which wraps each predecoded operation, so
+    a CPU without a profiler attached pays nothing for it.
+
+    Attributes:
+        cpu (Cpu)         : CPU being profiled.
+        decoder (function): Decoder in use when the profiler was attached, which it wraps.
+
+        families (dict) : Maps opcode families to [count, seconds] lists.
+        addresses (dict): Maps pc addresses to [count, seconds] lists.
+
+        sprite_draws (dict): Maps frame numbers to the number of DXYN opcodes executed in that frame.
+        timer_waits (dict) : Maps pc addresses to the number of FX07 reads made while the delay
+                             timer was non-zero, which usually means the rom is busy-waiting on it.
+    """
+
+    def __init__(self, cpu):
+        self.cpu = cpu
+        self.decoder = None
+        self.families = defaultdict(lambda: [0, 0.0])
+        self.addresses = defaultdict(lambda: [0, 0.0])
+        self.sprite_draws = defaultdict(int)
+        self.timer_waits = defaultdict(int)
+
+    def attach(self):
+        """ Starts recording """
+        self.decoder = self.cpu.decoder
+        self.cpu.set_decoder(self.decode)
+
+    def detach(self):
+        """ Stops recording and restores the decoder the profiler wrapped """
+        self.cpu.set_decoder(self.decoder)
+
+    def decode(self, address):
+        """ Decodes the address with the wrapped decoder, wrapping the operation to record its execution """
+        opcode, operation, advance = self.decoder(address)
+        family = opcode_family(opcode)
+        family_stats = self.families[family]
+        address_stats = self.addresses[address]
+        cpu = self.cpu
+
+        def profiled():
+            start = perf_counter()
+            operation()
+            elapsed = perf_counter() - start
+            family_stats[0] += 1
+            family_stats[1] += elapsed
+            address_stats[0] += 1
+            address_stats[1] += elapsed
+
+        def profiled_sprite():
+            profiled()
+            self.sprite_draws[cpu.cycle_count // cpu.cycles_per_timer_tick] += 1
+
+        def profiled_timer_read():
+            if cpu.delay_timer > 0:
+                self.timer_waits[address] += 1
+            profiled()
+
+        if family == "DXYN":
+            wrapped = profiled_sprite
+        elif family == "FX07":
+            wrapped = profiled_timer_read
+        else:
+            wrapped = profiled
+
+        entry = (opcode, wrapped, advance)
+        self.cpu.decode_cache[address] = entry
+        return entry
+
+    def stats(self):
+        """ Returns the recorded statistics as a dictionary """
+        draws = list(self.sprite_draws.values())
+        return {
+            "families" : {family: {"count": count, "seconds": seconds}
+                          for (family, (count, seconds)) in self.families.items()},
+            "addresses" : {hex(address): {"count": count, "seconds": seconds}
+                           for (address, (count, seconds)) in sorted(self.addresses.items())},
+            "sprite_draws" : {
+                "frames"    : len(draws),
+                "mean"      : sum(draws) / len(draws) if draws else 0,
+                "max"       : max(draws, default=0)
+            },
+            "timer_waits" : {hex(address): count for (address, count) in sorted(self.timer_waits.items())}
+        }
+
+    def dump(self, path):
+        """ Writes the recorded statistics to a JSON file """
+        with open(path, "w") as output:
+            json.dump(self.stats(), output, indent=4)
+
+    def print_report(self, limit=10):
+        """ Prints the opcode families and addresses which took the most host time """
+        print("Opcode Family  Count      Seconds")
+        for (family, (count, seconds)) in sorted(self.families.items(), key=lambda item: -item[1][1])[:limit]:
+            print(family.ljust(15) + str(count).ljust(11) + "{:.6f}".format(seconds))
+        print("Address        Count      Seconds")
+        for (address, (count, seconds)) in sorted(self.addresses.items(), key=lambda item: -item[1][1])[:limit]:
+            print(hex(address).upper().ljust(15) + str(count).ljust(11) + "{:.6f}".format(seconds))
@@ -0,0 +1,143 @@
+import cpu
+import numpy as np
+from collections import deque
+from settings    import *
+
+# Offsets of the memory and display within a save state. The display runs up to the RNG state,
+# which ends the state
+MEMORY_OFFSET  = cpu.STATE_HEADER.size + cpu.STATE_REGISTERS.size
+DISPLAY_OFFSET = MEMORY_OFFSET + 4096
+RNG_SIZE       = cpu.STATE_RNG.size
+
+# Approximate bookkeeping cost, in bytes, of each stored frame on top of its data
+FRAME_OVERHEAD = 200
+
+def keyframe_hires(keyframe):
+    """ Returns whether the display of a save state is in the HIRES mode """
+    return cpu.STATE_REGISTERS.unpack_from(keyframe, cpu.STATE_HEADER.size)[29]
+
+class RewindBuffer():
+    """
+    Ring buffer of per-frame machine states kept within a memory budget. States are stored in groups,
+    each starting with a full save state (the keyframe). Every other frame in the group is stored as
+    a delta against that keyframe: its registers, the memory bytes and display rows which differ from
+    the keyframe, and the RNG state if it has changed. Frames whose display has a different resolution
+    or number of planes to the keyframe's store the whole display instead of its rows. Once the budget
+    is exceeded the oldest groups are dropped.
+
+    Attributes:
+        cpu (Cpu): CPU whose states are recorded and restored.
+
+        max_bytes (int)        : Memory budget for stored states.
+        keyframe_interval (int): Number of frames in each group, including its keyframe.
+
+        groups (deque): [keyframe, [deltas]] groups, oldest first.
+        size (int)    : Approximate number of bytes used by stored states.
+    """
+
+    def __init__(self, cpu, max_bytes=REWIND_MEMORY_LIMIT, keyframe_interval=REWIND_KEYFRAME_INTERVAL):
+        self.cpu = cpu
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+        self.groups = deque()
+        self.size = 0
+
+    def __len__(self):
+        """ Returns the number of frames stored """
+        return sum(1 + len(deltas) for (_, deltas) in self.groups)
+
+    def push(self):
+        """ Records the current machine state as the latest frame """
+        if not self.groups or len(self.groups[-1][1]) + 1 >= self.keyframe_interval:
+            keyframe = self.cpu.save_state()
+            self.groups.append([keyframe, []])
+            self.size += len(keyframe) + FRAME_OVERHEAD
+        else:
+            delta = self.delta(self.groups[-1][0])
+            self.groups[-1][1].append(delta)
+            self.size += self.delta_size(delta)
+
+        # Drop the oldest groups once over budget, always keeping the latest one
+        while self.size > self.max_bytes and len(self.groups) > 1:
+            self.size -= self.group_size(self.groups.popleft())
+
+    def rewind(self):
+        """
+        Steps back one frame, restoring the state recorded before the latest one. Returns False if
+        there is no earlier frame to step back to
+        """
+        if len(self.groups) == 1 and not self.groups[0][1]:
+            return False
+
+        # Drop the latest frame
+        keyframe, deltas = self.groups[-1]
+        if deltas:
+            delta = deltas.pop()
+            self.size -= self.delta_size(delta)
+        else:
+            self.groups.pop()
+            self.size -= len(keyframe) + FRAME_OVERHEAD
+
+        # Restore the frame before it
+        keyframe, deltas = self.groups[-1]
+        self.cpu.load_state(keyframe)
+        if deltas:
+            self.apply(keyframe, deltas[-1])
+        return True
+
+    def delta(self, keyframe):
+        """ Returns the current machine state as a delta against the keyframe """
+        memory = np.frombuffer(self.cpu.memory, dtype=np.uint8)
+        key_memory = np.frombuffer(keyframe, dtype=np.uint8, count=len(memory), offset=MEMORY_OFFSET)
+        changed = np.flatnonzero(memory != key_memory)
+
+        display_bytes = self.cpu.display_bytes()
+        same_shape = (len(display_bytes) == len(keyframe) - DISPLAY_OFFSET - RNG_SIZE
+                      and self.cpu.hires == keyframe_hires(keyframe))
+        if same_shape:
+            row_bytes = self.cpu.width // 8
+            display = np.frombuffer(display_bytes, dtype=np.uint8).reshape(-1, row_bytes)
+            key_display = np.frombuffer(keyframe, dtype=np.uint8, count=display.size,
+                                        offset=DISPLAY_OFFSET).reshape(-1, row_bytes)
+            changed_rows = np.flatnonzero((display != key_display).any(axis=1))
+            rows, row_data = changed_rows.astype(np.uint8).tobytes(), display[changed_rows].tobytes()
+        else:
+            rows, row_data = None, display_bytes
+
+        rng = self.cpu.pack_rng()
+        if rng == keyframe[-RNG_SIZE:]:
+            rng = None
+
+        return (self.cpu.pack_registers(),
+                changed.astype(np.uint16).tobytes(), memory[changed].tobytes(),
+                rows, row_data, rng)
+
+    def apply(self, keyframe, delta):
+        """ Applies a delta to a CPU which has just been restored to the delta's keyframe """
+        registers, addresses, values, rows, row_data, rng = delta
+        self.cpu.unpack_registers(registers)
+
+        memory = np.frombuffer(self.cpu.memory, dtype=np.uint8)
+        memory[np.frombuffer(addresses, dtype=np.uint16)] = np.frombuffer(values, dtype=np.uint8)
+
+        if rows is None:
+            self.cpu.set_display_bytes(row_data)
+        elif rows:
+            row_bytes = self.cpu.width // 8
+            display = np.frombuffer(keyframe[DISPLAY_OFFSET : -RNG_SIZE], dtype=np.uint8)
+            display = display.reshape(-1, row_bytes).copy()
+            changed_rows = np.frombuffer(row_data, dtype=np.uint8).reshape(-1, row_bytes)
+            display[np.frombuffer(rows, dtype=np.uint8)] = changed_rows
+            self.cpu.set_display_bytes(display.tobytes())
+
+        if rng is not None:
+            self.cpu.unpack_rng(rng)
+
+    def delta_size(self, delta):
+        """ Returns the approximate number of bytes used by a delta """
+        return sum(len(data) for data in delta if data is not None) + FRAME_OVERHEAD
+
+    def group_size(self, group):
+        """ Returns the approximate number of bytes used by a group """
+        keyframe, deltas = group
+        return len(keyframe) + FRAME_OVERHEAD + sum(self.delta_size(delta) for delta in deltas)
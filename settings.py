@@ -1,12 +1,30 @@
 TITLE = "Chip 8 Emulator"
 FPS = 60
 CYCLES_PER_FRAME = 10
+CYCLES_PER_TIMER_TICK = CYCLES_PER_FRAME
 
 WIDTH = 64
 HEIGHT = 32
+HIRES_WIDTH = 128
+HIRES_HEIGHT = 64
+PLANES = 2
 PIXEL_DIM = 10
 
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
 BG_COLOUR = BLACK
+
+PLANE_COLOURS = (BG_COLOUR, WHITE, (255, 102, 0), (102, 34, 0))
+
+SAVE_DIR = "saves"
+SAVE_SLOTS = 10
+
+REWIND_MEMORY_LIMIT = 16 * 1024 * 1024
+REWIND_KEYFRAME_INTERVAL = 60
+
+AUDIO_RATE = 44100
+BUZZER_FREQUENCY = 440
+BUZZER_VOLUME = 0.25
+
+JOIN_TIMEOUT = 5
@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import zlib
+import numpy as np
+from settings import *
+from struct   import Struct
+
+# Message layout. Each message is a header giving its kind, whether the frame is HIRES, the frame
+# sequence number and the payload length, followed by the zlib compressed payload. Keyframes carry
+# the whole display packed as Cpu.display_bytes returns it. Deltas carry the number of changed rows,
+# their indices and each row XORed with the same row of the frame the spectator last received
+MESSAGE_HEADER = Struct(">BBQI")
+ROW_COUNT      = Struct(">H")
+KEYFRAME       = 1
+DELTA          = 2
+
+def row_bytes(hires):
+    """ Returns the number of bytes in each packed display row at a resolution """
+    return (HIRES_WIDTH if hires else WIDTH) // 8
+
+def encode_keyframe(sequence, frame, hires):
+    """ Returns a message carrying a whole frame """
+    payload = zlib.compress(frame)
+    return MESSAGE_HEADER.pack(KEYFRAME, hires, sequence, len(payload)) + payload
+
+def encode_delta(sequence, previous, frame, hires):
+    """ Returns a message carrying the rows of a frame which differ from the previous frame """
+    size = row_bytes(hires)
+    rows = np.frombuffer(frame, dtype=np.uint8).reshape(-1, size)
+    changes = rows ^ np.frombuffer(previous, dtype=np.uint8).reshape(-1, size)
+    changed = np.flatnonzero(changes.any(axis=1))
+    payload = zlib.compress(ROW_COUNT.pack(len(changed)) + changed.astype(np.uint8).tobytes()
+                            + changes[changed].tobytes())
+    return MESSAGE_HEADER.pack(DELTA, hires, sequence, len(payload)) + payload
+
+def decode(kind, hires, payload, previous):
+    """ Returns the frame a message's payload carries, given the frame received before it """
+    data = zlib.decompress(payload)
+    if kind == KEYFRAME:
+        return data
+
+    size = row_bytes(hires)
+    count = ROW_COUNT.unpack_from(data)[0]
+    changed = np.frombuffer(data, dtype=np.uint8, count=count, offset=ROW_COUNT.size)
+    changes = np.frombuffer(data, dtype=np.uint8, offset=ROW_COUNT.size + count).reshape(-1, size)
+    rows = np.frombuffer(previous, dtype=np.uint8).reshape(-1, size).copy()
+    rows[changed] ^= changes
+    return rows.tobytes()
+
+async def read_frames(reader):
+    """ Yields the (sequence, hires, frame) of each message a spectator receives """
+    frame = None
+    while True:
+        try:
+            header = await reader.readexactly(MESSAGE_HEADER.size)
+        except asyncio.IncompleteReadError:
+            return
+        kind, hires, sequence, length = MESSAGE_HEADER.unpack(header)
+        frame = decode(kind, hires, await reader.readexactly(length), frame)
+        yield (sequence, bool(hires), frame)
+
+def server_for_address(address):
+    """ Returns a SpectatorServer for a host:port address, or a Unix socket path otherwise """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return SpectatorServer(host, int(port))
+    return SpectatorServer(path=address)
+
+class SpectatorServer():
+    """
+    Streams the display to any number of spectators over a local TCP or Unix socket. The server runs
+    an asyncio event loop in a background thread. publish only hands the latest frame to that loop,
+    so the emulation loop never waits on the network. Each spectator is sent a keyframe when it
+    connects, then deltas against the last frame it received. A spectator which can't keep up skips
+    the frames published while it was being written to, rather than slowing anything else down.
+
+    Attributes:
+        host (str): Host to listen on for TCP spectators, or None to listen on a Unix socket.
+        port (int): TCP port to listen on, 0 to pick any free port. Set to the bound port once started.
+        path (str): Unix socket path, used when host is None.
+
+        loop (AbstractEventLoop): Event loop running the server, once started.
+        thread (Thread)         : Thread running the event loop.
+        started (Event)         : Set once the server is listening, or has failed to.
+        error (Exception)       : Raised by the server thread while starting, re-raised by start.
+        stopping (asyncio.Event): Set on the event loop when the server is stopped.
+
+        latest (tuple)   : (sequence, hires, frame) of the latest frame, only touched by the loop.
+        published (bytes): Latest frame passed to publish, used to skip unchanged frames.
+        sequence (int)   : Number of frames published.
+        waiting (set)    : Events of the connected spectators, set when a new frame is available.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, path=None):
+        self.host = host if path is None else None
+        self.port = port
+        self.path = path
+        self.loop = None
+        self.thread = None
+        self.started = threading.Event()
+        self.error = None
+        self.latest = None
+        self.published = None
+        self.sequence = 0
+        self.waiting = set()
+
+    def start(self):
+        """ Starts the server thread, returning once it is listening. Raises if it fails to listen """
+        self.thread = threading.Thread(target=self.listen, daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.error is not None:
+            self.thread.join(JOIN_TIMEOUT)
+            self.loop = None
+            raise self.error
+
+    def stop(self):
+        """ Disconnects every spectator and stops the server thread """
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+            self.thread.join(JOIN_TIMEOUT)
+            self.loop = None
+
+    def listen(self):
+        """ Runs the server on the thread, storing any error for start so it never waits forever """
+        try:
+            asyncio.run(self.serve())
+        except Exception as error:
+            if self.started.is_set():
+                raise
+            self.error = error
+        finally:
+            self.started.set()
+
+    def publish(self, frame, hires=False):
+        """ Hands a frame, packed as Cpu.display_bytes returns it, to the server if it has changed """
+        if frame == self.published:
+            return
+        self.published = frame
+        self.sequence += 1
+        self.loop.call_soon_threadsafe(self.update, (self.sequence, hires, frame))
+
+    def update(self, latest):
+        """ Stores the latest frame and wakes every spectator. Runs on the event loop """
+        self.latest = latest
+        for event in self.waiting:
+            event.set()
+
+    async def serve(self):
+        """ Listens for spectators until stop is called """
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        if self.host is None:
+            server = await asyncio.start_unix_server(self.stream, self.path)
+        else:
+            server = await asyncio.start_server(self.stream, self.host, self.port)
+            self.port = server.sockets[0].getsockname()[1]
+        self.started.set()
+
+        async with server:
+            await self.stopping.wait()
+            for event in self.waiting:
+                event.set()
+
+    async def stream(self, reader, writer):
+        """ Sends frames to a spectator until it disconnects or the server stops """
+        event = asyncio.Event()
+        self.waiting.add(event)
+        if self.latest is not None:
+            event.set()
+
+        sent = None
+        try:
+            while True:
+                await event.wait()
+                event.clear()
+                if self.stopping.is_set():
+                    break
+
+                # Only the latest frame is sent, however many were published since the last one
+                sequence, hires, frame = self.latest
+                if sent is None or sent[1] != hires or len(sent[2]) != len(frame):
+                    writer.write(encode_keyframe(sequence, frame, hires))
+                else:
+                    writer.write(encode_delta(sequence, sent[2], frame, hires))
+                sent = self.latest
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.waiting.discard(event)
+            writer.close()
+
+async def watch(address):
+    """ Connects to a server as a spectator, printing each frame received """
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        reader, writer = await asyncio.open_connection(host, int(port))
+    else:
+        reader, writer = await asyncio.open_unix_connection(address)
+
+    async for (sequence, hires, frame) in read_frames(reader):
+        width, height = (HIRES_WIDTH, HIRES_HEIGHT) if hires else (WIDTH, HEIGHT)
+        pixels = np.unpackbits(np.frombuffer(frame, dtype=np.uint8)).reshape(-1, width)[:height]
+        print("\n".join("".join("#" if pixel else "_" for pixel in row) for row in pixels))
+        print("Frame:", sequence)
+    writer.close()
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Chip-8 Spectator")
+    parser.add_argument("address", type=str, help="host:port or Unix Socket of the server")
+    args = parser.parse_args()
+    asyncio.run(watch(args.address))
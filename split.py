@@ -0,0 +1,275 @@
+import chip8
+import cpu
+import headless
+import profiler
+import rewind
+import multiprocessing
+import numpy as np
+from settings        import *
+from multiprocessing import shared_memory
+from time            import perf_counter, sleep
+
+# Largest packed display, every plane at the HIRES resolution
+FRAME_BYTES = HIRES_HEIGHT * HIRES_WIDTH // 8 * PLANES
+
+# Indices of the control words. The frontend writes the first six, the emulator the last two
+CONTROL_RUNNING          = 0
+CONTROL_CYCLES           = 1
+CONTROL_REWINDING        = 2
+CONTROL_COMMAND          = 3
+CONTROL_COMMAND_SEQUENCE = 4
+CONTROL_SLOT             = 5
+CONTROL_HALTED           = 6
+CONTROL_SOUND_TIMER      = 7
+CONTROL_WORDS            = 8
+
+# Commands sent from the frontend to the emulator
+COMMAND_SAVE = 1
+COMMAND_LOAD = 2
+
+class SharedState():
+    """
+    Display, keypad and control words shared between the emulator and frontend processes. Frames
+    are published under a sequence lock: the emulator makes the sequence odd while writing a frame
+    and even once it's written, so the frontend can tell when a read was torn and keep its last
+    frame rather than wait. Neither process ever blocks the other.
+
+    Attributes:
+        memory (SharedMemory): Shared memory block all the arrays below are views into.
+
+        sequence (np.ndarray)  : Frame sequence number, odd while a frame is being written.
+        frame_info (np.ndarray): Whether the latest frame is HIRES, and its length in bytes.
+        frame (np.ndarray)     : Latest frame, the display packed row by row.
+        keypad (np.ndarray)  : Key states, written by the frontend.
+        control (np.ndarray) : Control words, indexed by the CONTROL constants.
+    """
+
+    def __init__(self, name=None):
+        size = 16 + FRAME_BYTES + 16 + 4 * CONTROL_WORDS
+        self.memory = shared_memory.SharedMemory(name=name, create=name is None, size=size)
+        buffer = self.memory.buf
+        self.sequence = np.ndarray(1, dtype=np.uint64, buffer=buffer, offset=0)
+        self.frame_info = np.ndarray(2, dtype=np.uint32, buffer=buffer, offset=8)
+        self.frame = np.ndarray(FRAME_BYTES, dtype=np.uint8, buffer=buffer, offset=16)
+        self.keypad = np.ndarray(16, dtype=np.uint8, buffer=buffer, offset=16 + FRAME_BYTES)
+        self.control = np.ndarray(CONTROL_WORDS, dtype=np.uint32, buffer=buffer, offset=32 + FRAME_BYTES)
+
+    def publish(self, frame, hires=False):
+        """ Writes a frame, packed as Cpu.display_bytes returns it """
+        self.sequence[0] += 1
+        self.frame_info[:] = (hires, len(frame))
+        self.frame[: len(frame)] = np.frombuffer(frame, dtype=np.uint8)
+        self.sequence[0] += 1
+
+    def read(self, frame):
+        """
+        Copies the latest frame into the given array and returns its (sequence number, hires,
+        length), or None if the frame was being written at the time
+        """
+        start = int(self.sequence[0])
+        if start % 2:
+            return None
+        hires, length = (int(value) for value in self.frame_info)
+        frame[:length] = self.frame[:length]
+        return (start, bool(hires), length) if int(self.sequence[0]) == start else None
+
+    def close(self, unlink=False):
+        """ Releases the views and detaches from the shared memory, destroying it if unlink is set """
+        self.sequence = self.frame_info = self.frame = self.keypad = self.control = None
+        self.memory.close()
+        if unlink:
+            self.memory.unlink()
+
+def emulate(name, rom, translate=False, packed_display=False, seed=None, profile=None):
+    """
+    Emulator process. Runs a frame of cycles FPS times a second, applying the shared keypad and
+    control words and publishing each frame, until the frontend clears the running word
+    """
+    shared = SharedState(name)
+    control = shared.control
+    machine = headless.load_machine(rom, translate, packed_display=packed_display, seed=seed)
+    rewind_buffer = rewind.RewindBuffer(machine)
+    if profile:
+        machine_profiler = profiler.Profiler(machine)
+        machine_profiler.attach()
+
+    keypad = np.zeros(16, dtype=np.uint8)
+    command_sequence = 0
+    next_frame = perf_counter()
+    while control[CONTROL_RUNNING]:
+        # Apply the keys which changed since the last frame
+        for key in np.flatnonzero(shared.keypad != keypad):
+            keypad[key] = shared.keypad[key]
+            machine.set_key(key, keypad[key])
+
+        # Keep the timers ticking once per frame, as Chip8.set_timer_rate does
+        cycles = int(control[CONTROL_CYCLES])
+        machine.cycles_per_timer_tick = cycles
+        machine.timer_countdown = min(machine.timer_countdown, cycles)
+
+        if control[CONTROL_COMMAND_SEQUENCE] != command_sequence:
+            command_sequence = control[CONTROL_COMMAND_SEQUENCE]
+            run_command(machine, rom, int(control[CONTROL_COMMAND]), int(control[CONTROL_SLOT]))
+
+        if control[CONTROL_REWINDING]:
+            rewind_buffer.rewind()
+        else:
+            headless.run_cycles(machine, cycles)
+            rewind_buffer.push()
+
+        control[CONTROL_HALTED] = machine.halted
+        control[CONTROL_SOUND_TIMER] = machine.sound_timer
+        shared.publish(machine.display_bytes(), machine.hires)
+
+        # Sleep until the next frame is due. Frames which overrun aren't caught up on
+        next_frame += 1 / FPS
+        delay = next_frame - perf_counter()
+        if delay > 0:
+            sleep(delay)
+        else:
+            next_frame = perf_counter()
+
+    if profile:
+        machine_profiler.dump(profile)
+        machine_profiler.print_report()
+    shared.close()
+
+def run_command(machine, rom, command, slot):
+    """ Saves or loads the machine state in a save slot, as the frontend's hotkeys do """
+    path = chip8.state_path(rom, slot)
+    if command == COMMAND_SAVE:
+        chip8.write_state(machine, path)
+        print("State Saved to Slot:", slot)
+    elif command == COMMAND_LOAD:
+        if chip8.read_state(machine, path):
+            print("State Loaded from Slot:", slot)
+        else:
+            print("No State Saved in Slot:", slot)
+
+class SharedCpu():
+    """
+    Stands in for the Cpu in the frontend process, reading frames from and writing keys to shared
+    memory.
+
+    Attributes:
+        shared (SharedState): State shared with the emulator process.
+
+        frame (np.ndarray)  : Last frame read, packed row by row.
+        display (np.ndarray): Last complete frame, unpacked into an array of plane bitmasks.
+        sequence (int)      : Sequence number of the last complete frame.
+    """
+
+    def __init__(self, shared):
+        self.shared = shared
+        self.frame = np.zeros(FRAME_BYTES, dtype=np.uint8)
+        self.display = np.zeros((WIDTH, HEIGHT), dtype=np.uint8)
+        self.sequence = None
+
+    @property
+    def halted(self):
+        """ Whether the emulated CPU is halted waiting for a key """
+        return bool(self.shared.control[CONTROL_HALTED])
+
+    @property
+    def sound_timer(self):
+        """ The emulated CPU's sound timer, as of the last frame """
+        return int(self.shared.control[CONTROL_SOUND_TIMER])
+
+    def get_display(self):
+        """ Returns the latest complete frame as an array of plane bitmasks, as Cpu.get_display does """
+        read = self.shared.read(self.frame)
+        if read is not None and read[0] != self.sequence:
+            self.sequence, hires, length = read
+            if length == 0:
+                # Nothing has been published yet
+                return self.display
+            width, height = (HIRES_WIDTH, HIRES_HEIGHT) if hires else (WIDTH, HEIGHT)
+            display = cpu.unpack_display(self.frame[:length], width, height)
+            if display.shape == self.display.shape:
+                self.display[:] = display
+            else:
+                self.display = display
+        return self.display
+
+    def set_key(self, key, pressed):
+        """ Sets whether a key is pressed, which the emulator applies at the start of its next frame """
+        self.shared.keypad[key] = 1 if pressed else 0
+
+class SplitChip8(chip8.Chip8):
+    """
+    Frontend which runs the Cpu in a separate emulator process, so emulation and drawing each get a
+    core and a slow frame on one side never stalls the other. The display, keypad and hotkeys are
+    passed between the processes through a SharedState.
+
+    Attributes:
+        shared (SharedState): State shared with the emulator process.
+        emulator (Process)  : The emulator process.
+    """
+
+    def __init__(self, rom, fullscreen, translate=False, packed_display=False, seed=None, profile=None):
+        # The machine lives in the emulator process, so only the frontend is set up here
+        self.setup_frontend(rom, fullscreen)
+
+        self.shared = SharedState()
+        self.shared.control[CONTROL_RUNNING] = 1
+        self.shared.control[CONTROL_CYCLES] = self.cycles_per_frame
+        # PyGame is already running its own threads, so the emulator is spawned rather than forked
+        context = multiprocessing.get_context("spawn")
+        self.emulator = context.Process(target=emulate, daemon=True,
+                                        args=(self.shared.memory.name, rom, translate, packed_display, seed, profile))
+        self.emulator.start()
+
+        # The CPU and its rewind history live in the emulator process, which can't be debugged
+        self.cpu = SharedCpu(self.shared)
+        self.rewind_buffer = None
+        self.debugger = None
+
+    def run(self):
+        """ Run the frontend. Handles events and draws the latest frame, once per frame """
+        self.playing = True
+        while self.playing:
+            if self.cpu.halted and not self.rewinding:
+                self.wait_for_event()
+            self.clock.tick(FPS)
+
+            # The frame last published would be shown forever once the emulator has died
+            if not self.emulator.is_alive():
+                print("Emulator Stopped with Exit Code:", self.emulator.exitcode)
+                self.quit()
+
+            self.events()
+            self.shared.control[CONTROL_REWINDING] = self.rewinding
+            self.buzzer.update(self.cpu.sound_timer > 0)
+            self.draw()
+
+    def send_command(self, command):
+        """ Asks the emulator to run a command on the current save slot """
+        control = self.shared.control
+        control[CONTROL_COMMAND] = command
+        control[CONTROL_SLOT] = self.save_slot
+        control[CONTROL_COMMAND_SEQUENCE] += 1
+
+    def save_state(self):
+        """ Saves the machine state to the current save slot """
+        self.send_command(COMMAND_SAVE)
+
+    def load_state(self):
+        """ Restores the machine state from the current save slot, if it has been saved to """
+        self.send_command(COMMAND_LOAD)
+
+    def toggle_pause(self):
+        """ The debugger hotkeys need the CPU in this process """
+        print("The Debugger is not Supported with -s")
+
+    step = toggle_breakpoint = toggle_pause
+
+    def set_timer_rate(self):
+        """ Passes the cycles per frame to the emulator, which keeps the timers ticking once per frame """
+        self.shared.control[CONTROL_CYCLES] = self.cycles_per_frame
+
+    def quit(self):
+        """ Stops the emulator process, then terminates the program """
+        self.shared.control[CONTROL_RUNNING] = 0
+        self.emulator.join(1)
+        self.shared.close(unlink=True)
+        super().quit()
@@ -0,0 +1,74 @@
+import os
+import unittest
+import numpy as np
+from settings import *
+
+# The buzzer is tested on a dummy audio driver, so no sound is played
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import audio
+import cpu
+import headless
+
+class Test_Audio(unittest.TestCase):
+    """ Test file containing unit tests for audio.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.buzzer = audio.Buzzer()
+
+    def tearDown(self):
+        """ Cleanup performed after each test """
+        self.buzzer.stop()
+
+    def test_buzzer_sound(self):
+        # The tone is built once, lasting whole periods of the mixer's rate
+        rate, _, channels = audio.pg.mixer.get_init()
+        samples = audio.pg.sndarray.array(self.buzzer.sound)
+        self.assertEqual(len(samples) % round(rate / BUZZER_FREQUENCY), 0)
+        self.assertFalse(self.buzzer.on)
+
+    def test_square_wave(self):
+        samples = audio.square_wave(441, 44100, 0.5, periods=3)
+        self.assertEqual(samples.dtype, np.int16)
+        self.assertEqual(len(samples), 300)
+        self.assertTrue(np.array_equal(samples[:100], samples[100:200]))
+        self.assertTrue((samples[:50] == 16383).all())
+        self.assertTrue((samples[50:100] == -16383).all())
+
+    def test_buzzer_transitions(self):
+        played = []
+        self.buzzer.sound = Recorder(played)
+
+        # The tone is only started and stopped when the timer starts or stops running
+        for on in (False, True, True, True, False, False, True):
+            self.buzzer.update(on)
+        self.assertEqual(played, ["play", "stop", "play"])
+        self.buzzer.stop()
+        self.assertEqual(played, ["play", "stop", "play", "stop"])
+
+    def test_buzzer_log(self):
+        machine = cpu.Cpu(seed=0)
+        # Sets the sound timer to 3, then spins
+        machine.memory[0x200:0x206] = bytes([0x63, 0x03, 0xF3, 0x18, 0x12, 0x04])
+        machine.cycles_per_timer_tick = machine.timer_countdown = 100
+        log = headless.BuzzerLog(machine)
+        headless.run_cycles(machine, 1000, log)
+        log.stop()
+        # The timer is set on cycle 2, but the interval starts at the first tick after it
+        self.assertEqual(log.intervals, [(100, 300)])
+        self.assertFalse(log.on)
+
+class Recorder():
+    """ Stands in for a Sound, recording the calls made to it """
+
+    def __init__(self, played):
+        self.played = played
+
+    def play(self, loops=0):
+        self.played.append("play")
+
+    def stop(self):
+        self.played.append("stop")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+import batch
+
+class Test_Batch(unittest.TestCase):
+    """ Test file containing unit tests for batch.py """
+
+    def test_make_jobs(self):
+        jobs = batch.make_jobs(["pong.ch8", "breakout.ch8"], [1, 2, 3], [None], 100)
+        self.assertEqual(len(jobs), 6)
+        self.assertEqual(jobs[0], {"rom": "pong.ch8", "seed": 1, "inputs": None, "cycles": 100, "translate": False})
+
+    def test_run_job(self):
+        result = batch.run_job(batch.make_jobs(["pong.ch8"], [1], [None], 1000)[0])
+        self.assertIsNone(result["error"])
+        self.assertEqual(result["cycles_executed"], 1000)
+        self.assertEqual(len(result["display_hash"]), 40)
+
+    def test_run_job_error(self):
+        # V0 = 1, then the invalid opcode 0xF0FF
+        with tempfile.NamedTemporaryFile(suffix=".ch8", delete=False) as rom:
+            rom.write(bytes([0x60, 0x01, 0xF0, 0xFF]))
+        try:
+            result = batch.run_job(batch.make_jobs([rom.name], [0], [None], 1000)[0])
+        finally:
+            os.remove(rom.name)
+        self.assertEqual(result["error"], "KeyError: 255")
+        self.assertEqual(result["cycles_executed"], 1)
+        self.assertEqual(result["pc"], 0x202)
+
+    def test_run_batch(self):
+        jobs = batch.make_jobs(["pong.ch8", "breakout.ch8"], [1, 2], [None], 1000)
+        results = list(batch.run_batch(jobs, processes=2, timeout=60))
+        self.assertEqual(len(results), 4)
+        serial = [batch.run_job(job)["display_hash"] for job in jobs]
+        self.assertEqual(sorted(result["display_hash"] for result in results), sorted(serial))
+
+if __name__ == "__main__":
+    unittest.main()
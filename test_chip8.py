@@ -0,0 +1,114 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from settings import *
+
+# The frontend is tested on dummy video and audio drivers, so no window is opened or sound played
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import chip8
+import movie
+
+class Test_Chip8(unittest.TestCase):
+    """ Test file containing unit tests for chip8.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.chip8 = chip8.Chip8("pong.ch8", False, seed=0)
+
+    def test_dirty_rects(self):
+        changed = np.zeros((WIDTH, HEIGHT), dtype=bool)
+        self.assertEqual(chip8.dirty_rects(changed), [])
+        changed[3][4] = changed[10][5] = True
+        changed[60][20] = changed[0][31] = True
+        rects = chip8.dirty_rects(changed)
+        self.assertEqual([tuple(rect) for rect in rects], [(3, 4, 8, 2), (60, 20, 1, 1), (0, 31, 1, 1)])
+
+    def test_draw_full_then_dirty(self):
+        rects = self.chip8.draw()
+        self.assertEqual([tuple(rect) for rect in rects], [(0, 0, WIDTH * PIXEL_DIM, HEIGHT * PIXEL_DIM)])
+        self.assertEqual(self.chip8.draw(), [])
+
+        self.chip8.cpu.display[2][3] = 1
+        rects = self.chip8.draw()
+        self.assertEqual([tuple(rect) for rect in rects], [(2 * PIXEL_DIM, 3 * PIXEL_DIM, PIXEL_DIM, PIXEL_DIM)])
+        self.assertEqual(self.chip8.screen.get_at((2 * PIXEL_DIM + 1, 3 * PIXEL_DIM + 1))[:3], WHITE)
+
+        # The pixel fades out over the following frames, then nothing is presented
+        self.chip8.cpu.display[2][3] = 0
+        frames = 0
+        while self.chip8.draw():
+            frames += 1
+        self.assertGreater(frames, 1)
+        self.assertEqual(self.chip8.screen.get_at((2 * PIXEL_DIM + 1, 3 * PIXEL_DIM + 1))[:3], BLACK)
+
+    def test_draw_matches_full_redraw(self):
+        self.chip8.draw()
+        for _ in range(50):
+            self.chip8.cpu.run(CYCLES_PER_FRAME * 4)
+            self.chip8.draw()
+        dirty = chip8.pg.surfarray.array3d(self.chip8.screen)
+
+        # Redraw the same frame in full by restoring the intensities it was drawn from
+        np.copyto(self.chip8.intensity, self.chip8.previous_intensity)
+        self.chip8.full_redraw = True
+        self.chip8.draw()
+        self.assertTrue(np.array_equal(dirty, chip8.pg.surfarray.array3d(self.chip8.screen)))
+
+    def test_draw_hires_planes(self):
+        self.chip8.draw()
+        machine = self.chip8.cpu
+        machine.high_resolution()
+        machine.display[2][3] = 1
+        machine.display[5][3] = 2
+        rects = self.chip8.draw()
+        self.assertEqual(self.chip8.scale, PIXEL_DIM // 2)
+        self.assertEqual([tuple(rect) for rect in rects], [(0, 0, WIDTH * PIXEL_DIM, HEIGHT * PIXEL_DIM)])
+        scale = self.chip8.scale
+        self.assertEqual(self.chip8.screen.get_at((2 * scale + 1, 3 * scale + 1))[:3], PLANE_COLOURS[1])
+        self.assertEqual(self.chip8.screen.get_at((5 * scale + 1, 3 * scale + 1))[:3], PLANE_COLOURS[2])
+
+        # A pixel lit in another plane changes colour while staying at full intensity
+        machine.display[2][3] = 3
+        rects = self.chip8.draw()
+        self.assertEqual([tuple(rect) for rect in rects], [(2 * scale, 3 * scale, scale, scale)])
+        self.assertEqual(self.chip8.screen.get_at((2 * scale + 1, 3 * scale + 1))[:3], PLANE_COLOURS[3])
+
+    def test_record_movie(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "test.movie")
+            recorder = chip8.Chip8("pong.ch8", False, seed=0, record=path)
+            self.assertIsNotNone(recorder.movie.seed)
+            recorder.cpu.idle(30)
+            chip8.pg.event.post(chip8.pg.event.Event(chip8.pg.KEYDOWN, key=chip8.pg.K_q))
+            chip8.pg.event.post(chip8.pg.event.Event(chip8.pg.KEYDOWN, key=chip8.pg.K_UP))
+            recorder.events()
+            self.assertEqual(recorder.cpu.keypad[4], 1)
+            recorder.cpu.idle(30)
+            recorder.stop_recording()
+
+            recording = movie.read_movie(path)
+            self.assertEqual((recording.rom, recording.seed, recording.length), ("pong.ch8", 0, 60))
+            self.assertEqual(recording.keys, [(30, 4, True)])
+            self.assertEqual(recording.rates, [(30, CYCLES_PER_FRAME + 1)])
+            self.assertIsNone(recorder.movie)
+
+    def test_debugger_hotkeys(self):
+        # F6 pauses, F7 steps an instruction while paused, F8 toggles a breakpoint at pc
+        for key in (chip8.pg.K_F6, chip8.pg.K_F7, chip8.pg.K_F8):
+            chip8.pg.event.post(chip8.pg.event.Event(chip8.pg.KEYDOWN, key=key))
+        self.chip8.events()
+        self.assertEqual(self.chip8.debugger.paused.pc, 0x202)
+        self.assertEqual((self.chip8.cpu.cycle_count, self.chip8.debugger.breakpoints), (1, {0x202}))
+        self.assertTrue(self.chip8.cpu.instrumented())
+
+        # Continuing moves past the breakpoint it's paused at
+        self.chip8.toggle_pause()
+        self.assertIsNone(self.chip8.debugger.paused)
+        self.assertIsNone(self.chip8.debugger.run(10))
+        self.chip8.debugger.remove_breakpoint(0x202)
+        self.assertFalse(self.chip8.cpu.instrumented())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,3 +1,5 @@
+import os
+import tempfile
 import unittest
 import cpu
 import numpy as np
@@ -238,9 +240,151 @@ class Test_Cpu(unittest.TestCase):
         self.cpu.generate_random_number()
         self.assertTrue(self.cpu.V[0x0] >= 0 and self.cpu.V[0x0] <= 255)
 
-    @unittest.SkipTest
     def test_display_sprite(self):
-        pass
+        self.cpu.I = 0x300
+        self.cpu.memory[0x300:0x302] = [0b11000011, 0b00111100]
+        self.cpu.V[0x0] = 10
+        self.cpu.V[0x1] = 5
+        self.cpu.opcode = concat_hex([0xD, 0x0, 0x1, 0x2])
+        self.cpu.display_sprite()
+        expected = np.zeros((WIDTH, HEIGHT))
+        for dx in (0, 1, 6, 7):
+            expected[10 + dx][5] = 1
+        for dx in range(2, 6):
+            expected[10 + dx][6] = 1
+        self.assertTrue(np.array_equal(self.cpu.display, expected))
+        self.assertEqual(self.cpu.V[0xF], 0)
+        self.cpu.display_sprite()
+        self.assertTrue(np.array_equal(self.cpu.display, np.zeros((WIDTH, HEIGHT))))
+        self.assertEqual(self.cpu.V[0xF], 1)
+
+    def test_display_sprite_wrap_around(self):
+        self.cpu.I = 0x300
+        self.cpu.memory[0x300:0x302] = [0xFF, 0x81]
+        self.cpu.V[0x0] = WIDTH - 4
+        self.cpu.V[0x1] = HEIGHT - 1
+        self.cpu.opcode = concat_hex([0xD, 0x0, 0x1, 0x2])
+        self.cpu.display_sprite()
+        for dx in range(8):
+            self.assertEqual(self.cpu.display[(WIDTH - 4 + dx) % WIDTH][HEIGHT - 1], 1)
+        self.assertEqual(self.cpu.display[WIDTH - 4][0], 1)
+        self.assertEqual(self.cpu.display[3][0], 1)
+        self.assertEqual(self.cpu.display.sum(), 10)
+        self.assertEqual(self.cpu.V[0xF], 0)
+
+    def test_display_sprite_packed(self):
+        packed = cpu.Cpu(packed_display=True)
+        for machine in (self.cpu, packed):
+            machine.I = 0x300
+            machine.memory[0x300:0x30F] = list(range(0x11, 0xFF, 0x0F))
+        for (col, row) in [(0, 0), (10, 5), (60, 20), (70, 30), (255, 255)]:
+            for machine in (self.cpu, packed):
+                machine.V[0x0] = col
+                machine.V[0x1] = row
+                machine.opcode = concat_hex([0xD, 0x0, 0x1, 0xF])
+                machine.operation_lookup[0xD]()
+            self.assertTrue(np.array_equal(self.cpu.display, packed.get_display()))
+            self.assertEqual(self.cpu.V[0xF], packed.V[0xF])
+            self.assertEqual(self.cpu.display_hash(), packed.display_hash())
+
+    def test_clear_display_packed(self):
+        packed = cpu.Cpu(packed_display=True)
+        rows = packed.display_rows
+        rows[3] = 0xFF
+        packed.clear_display()
+        self.assertIs(packed.display_rows, rows)
+        self.assertTrue(np.array_equal(packed.get_display(), np.zeros((WIDTH, HEIGHT))))
+
+    def test_scroll_display(self):
+        packed = cpu.Cpu(packed_display=True)
+        # Draw a 4 x 1 line at (2, 3), then scroll down 3, up 2, right 4 and left 4 twice
+        program = [0xA3, 0x00, 0x60, 0x02, 0x61, 0x03, 0xD0, 0x11,
+                   0x00, 0xC3, 0x00, 0xD2, 0x00, 0xFB, 0x00, 0xFC, 0x00, 0xFC]
+        for machine in (self.cpu, packed):
+            machine.memory[0x300] = 0xF0
+            machine.memory[0x200 : 0x200 + len(program)] = program
+        expected = [[(x, 3) for x in range(2, 6)], [(x, 6) for x in range(2, 6)], [(x, 4) for x in range(2, 6)],
+                    [(x, 4) for x in range(6, 10)], [(x, 4) for x in range(2, 6)], [(x, 4) for x in range(0, 2)]]
+        for machine in (self.cpu, packed):
+            machine.run(4)
+            for pixels in expected:
+                display = machine.get_display()
+                self.assertEqual(display.sum(), len(pixels))
+                for (x, y) in pixels:
+                    self.assertEqual(display[x][y], 1)
+                machine.run(1)
+
+    def test_exit_interpreter(self):
+        self.cpu.memory[0x200:0x204] = [0x60, 0x01, 0x00, 0xFD]
+        self.assertEqual(self.cpu.run(10), 2)
+        self.assertTrue(self.cpu.halted)
+        self.cpu.set_key(1, True)
+        self.assertTrue(self.cpu.halted)
+        self.assertEqual(self.cpu.run(10), 0)
+
+    def test_resolution(self):
+        packed = cpu.Cpu(packed_display=True)
+        # Switch to HIRES and draw a 16 x 16 sprite at (120, 60), wrapping around both edges
+        program = [0x00, 0xFF, 0xA3, 0x00, 0x60, 0x78, 0x61, 0x3C, 0xD0, 0x10, 0x00, 0xFE]
+        for machine in (self.cpu, packed):
+            machine.memory[0x300:0x320] = [0xFF, 0xFF] * 16
+            machine.memory[0x200 : 0x200 + len(program)] = program
+            machine.run(5)
+            display = machine.get_display()
+            self.assertEqual((machine.width, machine.height), (HIRES_WIDTH, HIRES_HEIGHT))
+            self.assertEqual(display.shape, (HIRES_WIDTH, HIRES_HEIGHT))
+            self.assertEqual(display.sum(), 256)
+            self.assertEqual(display[np.ix_(range(120, 128), range(60, 64))].sum(), 32)
+            self.assertEqual(display[np.ix_(range(0, 8), range(0, 12))].sum(), 96)
+            self.assertEqual(len(machine.display_bytes()), HIRES_WIDTH * HIRES_HEIGHT // 8)
+
+            machine.run(1)
+            self.assertEqual(machine.get_display().shape, (WIDTH, HEIGHT))
+            self.assertFalse(machine.get_display().any())
+        self.assertEqual(self.cpu.display_hash(), packed.display_hash())
+
+    def test_select_planes(self):
+        packed = cpu.Cpu(packed_display=True)
+        # Select both planes and draw a sprite with a row for each, then clear plane 1 only
+        program = [0xF3, 0x01, 0xA3, 0x00, 0xD0, 0x01, 0xF1, 0x01, 0x00, 0xE0]
+        for machine in (self.cpu, packed):
+            machine.memory[0x300:0x302] = [0b11000000, 0b10100000]
+            machine.memory[0x200 : 0x200 + len(program)] = program
+            machine.run(3)
+            self.assertEqual(list(machine.get_display()[0:4, 0]), [3, 1, 2, 0])
+            self.assertEqual(len(machine.display_bytes()), 2 * HEIGHT * WIDTH // 8)
+            machine.run(2)
+            self.assertEqual(machine.planes, 1)
+            self.assertEqual(list(machine.get_display()[0:4, 0]), [2, 0, 2, 0])
+        self.assertEqual(self.cpu.display_bytes(), packed.display_bytes())
+
+    def test_extended_display_packed(self):
+        # Random programs of display opcodes draw the same on the array and packed displays
+        rng = np.random.default_rng(0)
+        opcodes = [0x00E0, 0x00C0, 0x00D0, 0x00FB, 0x00FC, 0x00FE, 0x00FF, 0xF001, 0xD000, 0x6000, 0x7000]
+        for _ in range(20):
+            program = bytearray()
+            for opcode in rng.choice(opcodes, 200):
+                opcode = int(opcode)
+                if opcode in (0x00C0, 0x00D0, 0xD000):
+                    opcode |= int(rng.integers(16))
+                if opcode in (0xF001, 0xD000, 0x6000, 0x7000):
+                    opcode |= int(rng.integers(16)) << 8 if opcode != 0xF001 else int(rng.integers(4)) << 8
+                if opcode == 0xD000:
+                    opcode |= int(rng.integers(16)) << 4
+                if opcode in (0x6000, 0x7000):
+                    opcode |= int(rng.integers(256))
+                program += opcode.to_bytes(2, "big")
+
+            machines = (cpu.Cpu(), cpu.Cpu(packed_display=True))
+            for machine in machines:
+                machine.memory[0x200 : 0x200 + len(program)] = program
+                machine.I = 0x200
+                for _ in range(len(program) // 2):
+                    machine.execute_cycle()
+                    machine.V[0xF] = 0
+            self.assertEqual(machines[0].display_bytes(), machines[1].display_bytes())
+            self.assertTrue(np.array_equal(machines[0].get_display(), machines[1].get_display()))
 
     def test_skip_if_key_pressed(self):
         for key in range(16):
@@ -272,9 +416,50 @@ class Test_Cpu(unittest.TestCase):
             self.cpu.misc_operation()
             self.assertEqual(self.cpu.V[reg], 0xAB)
 
-    @unittest.SkipTest
     def test_wait_for_keypress(self):
-        pass
+        # Wait for a key into V5, then V6 = 0x12
+        self.cpu = cpu.Cpu(cycles_per_timer_tick=4)
+        self.cpu.memory[0x200:0x204] = [0xF5, 0x0A, 0x66, 0x12]
+        self.cpu.delay_timer = 5
+        self.assertEqual(self.cpu.run(10), 1)
+        self.assertTrue(self.cpu.halted)
+        self.assertEqual(self.cpu.pc, 0x202)
+        self.assertEqual(self.cpu.run(10), 0)
+
+        # Cycles pass idle while halted, ticking the timers
+        self.cpu.idle(9)
+        self.assertEqual(self.cpu.cycle_count, 10)
+        self.assertEqual(self.cpu.delay_timer, 3)
+        self.assertEqual(self.cpu.timer_countdown, 2)
+
+        # Releasing a key doesn't resume, pressing one does
+        self.cpu.set_key(0xB, False)
+        self.assertTrue(self.cpu.halted)
+        self.cpu.set_key(0xB, True)
+        self.assertFalse(self.cpu.halted)
+        self.assertEqual(self.cpu.V[5], 0xB)
+        self.assertEqual(self.cpu.keypad[0xB], 1)
+        self.assertEqual(self.cpu.run(1), 1)
+        self.assertEqual(self.cpu.V[6], 0x12)
+
+    def test_wait_for_keypress_execute_cycle(self):
+        self.cpu.memory[0x200:0x202] = [0xF5, 0x0A]
+        self.cpu.execute_cycle()
+        self.assertTrue(self.cpu.halted)
+        self.assertEqual(self.cpu.key_register, 5)
+        self.assertEqual(self.cpu.pc, 0x202)
+        self.assertEqual(self.cpu.cycle_count, 1)
+
+    def test_decrement_timers(self):
+        # Loop forever on a jump to itself while the timers run down
+        self.cpu = cpu.Cpu(cycles_per_timer_tick=4)
+        self.cpu.memory[0x200:0x202] = [0x12, 0x00]
+        self.cpu.delay_timer = 3
+        self.cpu.sound_timer = 1
+        for cycle in range(1, 17):
+            self.cpu.execute_cycle()
+            self.assertEqual(self.cpu.delay_timer, max(3 - cycle // 4, 0))
+            self.assertEqual(self.cpu.sound_timer, max(1 - cycle // 4, 0))
 
     def test_move_reg_into_delay_timer(self):
         for reg in range(15):
@@ -345,6 +530,193 @@ class Test_Cpu(unittest.TestCase):
             for i in range(reg + 1):
                 self.assertEqual(self.cpu.V[i], i)
 
+    def test_memory_range_beyond_memory(self):
+        # Ranges running past the end of memory raise, leaving memory and V their own size
+        for (opcode, length) in ((0xF033, 3), (0xF355, 4), (0xF365, 4)):
+            self.cpu.opcode = opcode
+            self.cpu.I = 4096 - length + 1
+            with self.assertRaises(IndexError):
+                self.cpu.misc_operation()
+            self.assertEqual((len(self.cpu.memory), len(self.cpu.V)), (4096, 16))
+
+            # The range ending at the last byte of memory is allowed
+            self.cpu.I -= 1
+            self.cpu.misc_operation()
+            self.assertEqual((len(self.cpu.memory), len(self.cpu.V)), (4096, 16))
+
+    def test_display_sprite_beyond_memory(self):
+        # Sprites running past the end of memory raise before anything is drawn, in both display layouts
+        for packed in (False, True):
+            self.cpu = cpu.Cpu(packed_display=packed)
+            draw = self.cpu.operation_lookup[0xD]
+            self.cpu.opcode = 0xD005
+            self.cpu.I = 4096 - 4
+            with self.assertRaises(IndexError):
+                draw()
+            self.assertFalse(self.cpu.get_display().any())
+
+            # With both XO-CHIP planes selected, the second plane's sprite follows the first
+            self.cpu.planes = 3
+            self.cpu.I = 4096 - 9
+            with self.assertRaises(IndexError):
+                draw()
+
+            # The sprite ending at the last byte of memory is allowed
+            self.cpu.I = 4096 - 10
+            draw()
+
+    def test_load_file_to_memory(self):
+        with open("fontset.bin", "rb") as fontset:
+            data = fontset.read()
+        self.cpu.load_file_to_memory("fontset.bin", 0x050)
+        self.assertEqual(bytes(self.cpu.memory[0x050 : 0x050 + len(data)]), data)
+        self.assertEqual(len(self.cpu.memory), 4096)
+
+    def test_load_file_too_large(self):
+        # A ROM which doesn't fit after the start address is rejected rather than cut off
+        directory = tempfile.mkdtemp()
+        rom = os.path.join(directory, "large.ch8")
+        with open(rom, "wb") as game:
+            game.write(bytes(range(256)) * 14 + b"\x01")
+        with self.assertRaises(ValueError):
+            self.cpu.load_file_to_memory(rom, 0x200)
+        self.assertEqual(self.cpu.memory[0x200], 0)
+
+        # A ROM filling memory exactly is loaded whole
+        with open(rom, "wb") as game:
+            game.write(bytes(range(256)) * 14)
+        self.cpu.load_file_to_memory(rom, 0x200)
+        self.assertEqual(self.cpu.memory[4095], 255)
+
+    def test_memory_view(self):
+        view = self.cpu.memory_view()
+        self.cpu.memory[0x300] = 0xAB
+        self.assertEqual(view[0x300], 0xAB)
+        with self.assertRaises(TypeError):
+            view[0x300] = 0
+
+    def test_save_and_load_state(self):
+        self.cpu = cpu.Cpu(seed=0)
+        self.cpu.load_file_to_memory("fontset.bin", 0x050)
+        self.cpu.load_file_to_memory("roms/breakout.ch8", 0x200)
+        self.cpu.run(3000)
+        state = self.cpu.save_state()
+
+        for restored in (cpu.Cpu(), cpu.Cpu(packed_display=True)):
+            restored.load_state(state)
+            self.assertEqual(restored.save_state(), state)
+            self.cpu.load_state(state)
+            self.cpu.run(3000)
+            restored.run(3000)
+            self.assertEqual(restored.save_state(), self.cpu.save_state())
+
+    def test_save_and_load_state_halted(self):
+        self.cpu.memory[0x200:0x202] = [0xF5, 0x0A]
+        self.cpu.run(1)
+        restored = cpu.Cpu()
+        restored.load_state(self.cpu.save_state())
+        self.assertTrue(restored.halted)
+        self.assertEqual(restored.key_register, 5)
+        restored.set_key(3, True)
+        self.assertEqual(restored.V[5], 3)
+        self.assertIsNone(restored.key_register)
+        self.assertIsNone(cpu.Cpu().key_register)
+
+    def test_save_and_load_state_hires(self):
+        self.cpu.memory[0x200:0x208] = [0x00, 0xFF, 0xF3, 0x01, 0xA0, 0x50, 0xD0, 0x10]
+        self.cpu.run(4)
+        state = self.cpu.save_state()
+        for restored in (cpu.Cpu(), cpu.Cpu(packed_display=True)):
+            restored.load_state(state)
+            self.assertTrue(restored.hires)
+            self.assertEqual(restored.planes, 3)
+            self.assertEqual(restored.save_state(), state)
+            self.assertTrue(np.array_equal(restored.get_display(), self.cpu.get_display()))
+
+        # Loading a CHIP-8 state switches back to the WIDTH x HEIGHT display
+        restored.load_state(cpu.Cpu().save_state())
+        self.assertEqual(restored.get_display().shape, (WIDTH, HEIGHT))
+
+    def test_load_state_invalid(self):
+        with self.assertRaises(ValueError):
+            self.cpu.load_state(b"NOPE" + self.cpu.save_state()[4:])
+
+    def test_decode_cache(self):
+        self.cpu.memory[0x200:0x204] = [0x6A, 0x12, 0x8A, 0x14]
+        self.cpu.execute_cycle()
+        self.cpu.execute_cycle()
+        self.assertEqual(self.cpu.decode_cache[0x200][0], 0x6A12)
+        self.assertEqual(self.cpu.decode_cache[0x202][0], 0x8A14)
+        self.assertEqual(self.cpu.pc, 0x204)
+
+    def test_run(self):
+        self.cpu = cpu.Cpu(seed=0)
+        stepped = cpu.Cpu(seed=0)
+        for machine in (self.cpu, stepped):
+            machine.load_file_to_memory("fontset.bin", 0x050)
+            machine.load_file_to_memory("roms/breakout.ch8", 0x200)
+        self.assertEqual(self.cpu.run(5003), 5003)
+        for _ in range(5003):
+            stepped.execute_cycle()
+        self.assertEqual(self.cpu.cycle_count, stepped.cycle_count)
+        self.assertEqual(self.cpu.pc, stepped.pc)
+        self.assertEqual(self.cpu.V, stepped.V)
+        self.assertEqual(self.cpu.delay_timer, stepped.delay_timer)
+        self.assertEqual(self.cpu.timer_countdown, stepped.timer_countdown)
+        self.assertTrue(np.array_equal(self.cpu.display, stepped.display))
+
+    def test_run_halted(self):
+        self.cpu.halted = True
+        self.assertEqual(self.cpu.run(100), 0)
+        self.assertEqual(self.cpu.pc, 0x200)
+
+    def test_run_skips_idle_loop(self):
+        # Delay timer busy-wait loop: V0 = DT, skip if V0 == 0, jump back, then jump to self forever
+        program = [0xF0, 0x07, 0x30, 0x00, 0x12, 0x00, 0x12, 0x06]
+        self.cpu = cpu.Cpu(cycles_per_timer_tick=100)
+        stepped = cpu.Cpu(cycles_per_timer_tick=100)
+        for machine in (self.cpu, stepped):
+            machine.memory[0x200:0x208] = program
+            machine.delay_timer = 5
+
+        # Count the delay timer reads the busy-wait loop really executes
+        reads = []
+        opcode, operation, advance = self.cpu.decode(0x200)
+        self.cpu.decode_cache[0x200] = (opcode, lambda: reads.append(operation()), advance)
+
+        self.assertEqual(self.cpu.run(1003), 1003)
+        for _ in range(1003):
+            stepped.execute_cycle()
+        self.assertEqual(self.cpu.cycle_count, stepped.cycle_count)
+        self.assertEqual(self.cpu.pc, stepped.pc)
+        self.assertEqual(self.cpu.pc, 0x206)
+        self.assertEqual(self.cpu.V, stepped.V)
+        self.assertEqual(self.cpu.delay_timer, stepped.delay_timer)
+        self.assertEqual(self.cpu.timer_countdown, stepped.timer_countdown)
+        self.assertLess(len(reads), 50)
+
+    def test_idle_candidate(self):
+        # V0 = DT, skip if V0 == 0, jump back
+        self.cpu.memory[0x200:0x206] = [0xF0, 0x07, 0x30, 0x00, 0x12, 0x00]
+        self.assertEqual(self.cpu.decode(0x204)[1].func, self.cpu.jump_to_address_idle)
+        # Drawing in the loop is a side effect
+        self.cpu.memory[0x202:0x204] = [0xD0, 0x01]
+        self.assertEqual(self.cpu.decode(0x204)[1], self.cpu.jump_to_address)
+        # Forward jumps don't close loops
+        self.cpu.memory[0x204:0x206] = [0x12, 0x08]
+        self.assertEqual(self.cpu.decode(0x204)[1], self.cpu.jump_to_address)
+
+    def test_decode_cache_invalidated_by_memory_write(self):
+        # V0 = 0x00, V1 = 0xE0, I = 0x206, store V0-V1 over the next instruction, which becomes 00E0
+        self.cpu.memory[0x200:0x208] = [0x61, 0xE0, 0xA2, 0x06, 0xF1, 0x55, 0x6B, 0xCC]
+        self.cpu.decode(0x206)
+        self.cpu.display[0][0] = 1
+        for _ in range(4):
+            self.cpu.execute_cycle()
+        self.assertEqual(self.cpu.V[0xB], 0x00)
+        self.assertEqual(self.cpu.display[0][0], 0)
+        self.assertEqual(self.cpu.decode_cache[0x206][0], 0x00E0)
+
 ####################
 # Helper Functions #
 ####################
@@ -0,0 +1,99 @@
+import io
+import unittest
+import cpu
+import debugger
+import profiler
+
+class Test_Debugger(unittest.TestCase):
+    """ Test file containing unit tests for debugger.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.cpu = cpu.Cpu(cycles_per_timer_tick=100)
+        self.debugger = debugger.Debugger(self.cpu)
+        # V0 = 1, V1 = 2, I = 0x300, store V0-V1, load V0-V1, V0 += 1, jump to 0x208
+        self.cpu.memory[0x200:0x20E] = bytes([0x60, 0x01, 0x61, 0x02, 0xA3, 0x00, 0xF1, 0x55,
+                                              0xF1, 0x65, 0x70, 0x01, 0x12, 0x08])
+
+    def test_armed_only_while_needed(self):
+        # An unarmed debugger leaves the normal dispatch in place, and restores it once disarmed
+        self.assertFalse(self.cpu.instrumented())
+        self.debugger.add_breakpoint(0x204)
+        self.assertTrue(self.cpu.instrumented())
+        self.debugger.remove_breakpoint(0x204)
+        self.assertFalse(self.cpu.instrumented())
+
+        # The decoder in use when armed is wrapped, so a profiler attached first keeps recording
+        machine_profiler = profiler.Profiler(self.cpu)
+        machine_profiler.attach()
+        self.debugger.add_condition(1)
+        self.assertEqual(self.debugger.run(3).pc, 0x204)
+        self.debugger.remove_condition(1)
+        self.assertEqual(self.cpu.decoder, machine_profiler.decode)
+        self.assertEqual(machine_profiler.stats()["families"]["6XNN"]["count"], 2)
+
+    def test_breakpoint(self):
+        self.debugger.add_breakpoint(0x204)
+        hit = self.debugger.run(50)
+        self.assertEqual((hit.pc, hit.reason), (0x204, "Breakpoint"))
+        self.assertEqual((self.cpu.pc, self.cpu.cycle_count, self.cpu.I), (0x204, 2, 0))
+
+        # Continuing moves past the breakpoint, running the rest of the cycles
+        self.assertIsNone(self.debugger.run(48))
+        self.assertEqual(self.cpu.cycle_count, 50)
+
+    def test_watchpoints(self):
+        self.debugger.add_watchpoint(0x301, 1, read=False)
+        hit = self.debugger.run(50)
+        self.assertEqual((hit.pc, hit.reason), (0x206, "Write of 0X300-0X301"))
+        self.assertEqual(self.cpu.memory[0x300:0x302], bytes(2))
+
+        # Read only watchpoints ignore writes, and stop before reads
+        self.debugger.remove_watchpoint(0x301)
+        self.debugger.add_watchpoint(0x300, 4, write=False)
+        hit = self.debugger.run(50)
+        self.assertEqual((hit.pc, hit.reason), (0x208, "Read of 0X300-0X301"))
+        self.assertEqual(self.cpu.memory[0x300:0x302], bytes([1, 2]))
+
+    def test_register_condition(self):
+        # Stops at the instruction after the one which changed V0 to the value
+        self.debugger.add_condition(0, 0x02)
+        hit = self.debugger.run(50)
+        self.assertEqual((hit.pc, hit.reason), (0x20C, "V0 Changed to 0X2"))
+        self.assertEqual(self.cpu.V[0], 2)
+
+        # Any change
+        self.debugger.add_condition(0)
+        hit = self.debugger.run(50)
+        self.assertEqual((hit.pc, hit.reason), (0x20A, "V0 Changed to 0X1"))
+
+    def test_step(self):
+        self.debugger.add_breakpoint(0x200)
+        self.assertEqual(self.debugger.run(1).pc, 0x200)
+        self.assertIsNone(self.debugger.step())
+        self.assertEqual((self.cpu.pc, self.cpu.V[0]), (0x202, 1))
+        self.assertIsNone(self.debugger.step())
+        self.assertEqual(self.cpu.pc, 0x204)
+
+    def test_pause_and_resume(self):
+        self.debugger.add_breakpoint(0x20A)
+        self.debugger.run(3)
+        self.debugger.pause()
+        self.assertEqual(self.debugger.paused.pc, 0x206)
+        self.assertEqual(self.debugger.run(50).pc, 0x20A)
+
+    def test_console(self):
+        commands = "break 206\ncontinue\nwhen v1 5\nwatch 300 2 q\nlist\nmemory 200 4\nstep 2\nquit\n"
+        output = io.StringIO()
+        console = debugger.DebuggerConsole(self.debugger, 100, io.StringIO(commands), output)
+        console.cmdloop()
+        lines = output.getvalue().splitlines()
+        self.assertIn("Breakpoint at 0X206", lines[1])
+        self.assertIn("Invalid arguments: watch 300 2 q", lines[3])
+        self.assertEqual(lines[4:6], ["(chip8) Breakpoint 0X206", "When V1 = 0X5"])
+        self.assertEqual(lines[6], "(chip8) 0X200: 60 01 61 02")
+        self.assertIn("PC: 0X20A", lines[7])
+        self.assertEqual(console.cycles, 95)
+
+if __name__ == "__main__":
+    unittest.main()
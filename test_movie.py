@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+import cpu
+import headless
+import movie
+from settings import *
+
+# Recorded movies and their golden files, replayed on every engine
+MOVIES = ["pong", "breakout", "tetris"]
+
+class Test_Movie(unittest.TestCase):
+    """ Test file containing unit tests for movie.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "test.movie")
+
+    def tearDown(self):
+        """ Cleanup performed after each test """
+        self.directory.cleanup()
+
+    def test_write_and_read_movie(self):
+        recording = movie.Movie("pong.ch8", 7, 10, 1000, [(0, 1, True), (30, 1, False), (30, 0xF, True)], [(50, 12)])
+        movie.write_movie(recording, self.path)
+        self.assertEqual(movie.read_movie(self.path), recording)
+
+    def test_recorder_truncates_on_rewind(self):
+        machine = cpu.Cpu()
+        recorder = movie.MovieRecorder(machine, "pong.ch8", 0, 10)
+        recorder.record_key(1, True)
+        machine.idle(20)
+        recorder.record_key(1, False)
+        recorder.record_rate(12)
+        machine.idle(20)
+        recorder.record_key(4, True)
+        machine.cycle_count = 20
+        recorder.truncate()
+        self.assertEqual(recorder.movie(), movie.Movie("pong.ch8", 0, 10, 20, [(0, 1, True)], []))
+
+    def test_replay_matches_recorded_run(self):
+        machine = headless.load_machine("breakout.ch8", seed=3)
+        recorder = movie.MovieRecorder(machine, "breakout.ch8", 3, CYCLES_PER_FRAME)
+        frames = []
+        for frame in range(600):
+            if frame % 50 == 0:
+                recorder.record_key(4 if frame % 100 else 6, True)
+                machine.set_key(4 if frame % 100 else 6, True)
+                machine.set_key(6 if frame % 100 else 4, False)
+                recorder.record_key(6 if frame % 100 else 4, False)
+            if frame == 300:
+                recorder.record_rate(12)
+                movie.set_timer_rate(machine, 12)
+            headless.run_cycles(machine, 12 if frame >= 300 else CYCLES_PER_FRAME)
+            frames.append(machine.display_bytes())
+        recorder.save(self.path)
+
+        recording = movie.read_movie(self.path)
+        replayed = list(movie.replay(movie.load_movie_machine(recording), recording))
+        self.assertEqual(replayed, frames)
+
+    def test_check_golden_finds_divergence(self):
+        recording = movie.read_movie(os.path.join("movies", "pong.movie"))
+        golden = movie.read_golden(os.path.join("movies", "pong.golden"))
+        golden[100] = bytes(movie.GOLDEN_DIGEST_SIZE)
+        machine = movie.load_movie_machine(recording)
+        frame, expected, actual = movie.check_golden(machine, recording, golden)
+        self.assertEqual((frame, expected), (100, golden[100]))
+        self.assertNotEqual(actual, expected)
+        self.assertEqual(machine.cycle_count, 101 * recording.cycles_per_frame)
+
+        machine = movie.load_movie_machine(recording)
+        frame, expected, actual = movie.check_golden(machine, recording, golden[:50])
+        self.assertEqual((frame, expected), (50, None))
+
+    def test_movies_match_golden(self):
+        for name in MOVIES:
+            recording = movie.read_movie(os.path.join("movies", name + ".movie"))
+            golden = movie.read_golden(os.path.join("movies", name + ".golden"))
+            for (translate, packed_display) in ((False, False), (True, False), (False, True)):
+                machine = movie.load_movie_machine(recording, translate, packed_display=packed_display)
+                self.assertIsNone(movie.check_golden(machine, recording, golden), name)
+                self.assertEqual(machine.cycle_count, recording.length)
+
+if __name__ == "__main__":
+    unittest.main()
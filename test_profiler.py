@@ -0,0 +1,80 @@
+import io
+import unittest
+import cpu
+import profiler
+import tracer
+from contextlib import redirect_stdout
+
+class Test_Profiler(unittest.TestCase):
+    """ Test file containing unit tests for profiler.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.cpu = cpu.Cpu(cycles_per_timer_tick=4)
+        self.profiler = profiler.Profiler(self.cpu)
+
+    def test_opcode_family(self):
+        families = {0x00E0: "00E0", 0x00EE: "00EE", 0x0123: "0NNN", 0x1234: "1NNN", 0x8124: "8XY4",
+                    0x812E: "8XYE", 0xD125: "DXYN", 0xE19E: "EX9E", 0xF307: "FX07", 0xFF55: "FX55",
+                    0x00C3: "00CN", 0x00D4: "00DN", 0x00FB: "00FB", 0x00FF: "00FF", 0xF201: "FN01"}
+        for (opcode, family) in families.items():
+            self.assertEqual(profiler.opcode_family(opcode), family)
+
+    def test_attach_records_execution(self):
+        # Delay timer busy-wait loop: V0 = DT, skip if V0 == 0, jump back
+        self.cpu.memory[0x200:0x208] = [0xF0, 0x07, 0x30, 0x00, 0x12, 0x00, 0x12, 0x06]
+        self.cpu.delay_timer = 2
+        self.profiler.attach()
+        self.cpu.run(12)
+        stats = self.profiler.stats()
+        self.assertEqual(stats["families"]["FX07"]["count"], 4)
+        self.assertEqual(stats["families"]["1NNN"]["count"], 4)
+        self.assertEqual(stats["addresses"]["0x200"]["count"], 4)
+        self.assertEqual(stats["timer_waits"], {"0x200": 3})
+        self.assertEqual(self.cpu.pc, 0x206)
+
+    def test_sprite_draws_per_frame(self):
+        self.cpu.memory[0x200:0x206] = [0xD0, 0x01, 0xD0, 0x01, 0x12, 0x00]
+        self.profiler.attach()
+        self.cpu.run(12)
+        stats = self.profiler.stats()
+        self.assertEqual(stats["sprite_draws"]["frames"], 3)
+        self.assertEqual(stats["sprite_draws"]["max"], 3)
+
+    def test_detach(self):
+        self.profiler.attach()
+        self.assertTrue(self.cpu.instrumented())
+        self.profiler.detach()
+        self.assertFalse(self.cpu.instrumented())
+        self.cpu.memory[0x200:0x202] = [0x12, 0x00]
+        self.cpu.run(10)
+        self.assertEqual(self.profiler.stats()["families"], {})
+        self.assertEqual(self.cpu.decode_cache[0x200][1].func, self.cpu.jump_to_address_idle)
+
+    def test_detach_restores_wrapped_decoder(self):
+        # A profiler attached over a tracer records alongside it, and leaves it attached on detach
+        machine_tracer = tracer.Tracer(self.cpu, ring_size=16)
+        machine_tracer.attach()
+        self.profiler.attach()
+        self.cpu.memory[0x200:0x204] = [0x60, 0x01, 0x12, 0x00]
+        self.cpu.run(4)
+        self.profiler.detach()
+        self.assertEqual(self.cpu.decoder, machine_tracer.decode)
+        self.cpu.run(4)
+        self.assertEqual(self.profiler.stats()["families"]["6XNN"]["count"], 2)
+        self.assertEqual(len(machine_tracer.ring), 8)
+
+    def test_print_report(self):
+        self.cpu.memory[0x200:0x204] = [0x60, 0x01, 0x12, 0x00]
+        self.profiler.attach()
+        self.cpu.run(4)
+        report = io.StringIO()
+        with redirect_stdout(report):
+            self.profiler.print_report()
+        lines = report.getvalue().splitlines()
+        self.assertEqual(len(lines), 6)
+        self.assertEqual({line.split()[0] for line in lines[1:3]}, {"6XNN", "1NNN"})
+        self.assertEqual({line.split()[0] for line in lines[4:]}, {"0X200", "0X202"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import cpu
+import rewind
+
+class Test_Rewind(unittest.TestCase):
+    """ Test file containing unit tests for rewind.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.cpu = cpu.Cpu(seed=0)
+        self.cpu.load_file_to_memory("fontset.bin", 0x050)
+        self.cpu.load_file_to_memory("roms/breakout.ch8", 0x200)
+
+    def test_rewind_restores_each_frame(self):
+        buffer = rewind.RewindBuffer(self.cpu, keyframe_interval=16)
+        states = []
+        for _ in range(100):
+            self.cpu.run(10)
+            # Hold down a key at times so the keypad state changes too
+            self.cpu.keypad[4] = (len(states) // 7) % 2
+            buffer.push()
+            states.append(self.cpu.save_state())
+        self.assertEqual(len(buffer), 100)
+
+        for state in reversed(states[:-1]):
+            self.assertTrue(buffer.rewind())
+            self.assertEqual(self.cpu.save_state(), state)
+        self.assertFalse(buffer.rewind())
+
+    def test_rewind_then_continue(self):
+        buffer = rewind.RewindBuffer(self.cpu, keyframe_interval=8)
+        for _ in range(20):
+            self.cpu.run(10)
+            buffer.push()
+        for _ in range(5):
+            buffer.rewind()
+        state = self.cpu.save_state()
+        self.cpu.run(10)
+        buffer.push()
+        buffer.rewind()
+        self.assertEqual(self.cpu.save_state(), state)
+
+    def test_rewind_across_resolution_change(self):
+        buffer = rewind.RewindBuffer(self.cpu, keyframe_interval=8)
+        # Draw in CHIP-8 mode, switch to HIRES and draw on both planes, then switch back
+        self.cpu.memory[0x200:0x212] = [0xA0, 0x50, 0xD0, 0x05, 0x00, 0xFF, 0xD0, 0x10, 0xF3, 0x01,
+                                        0xD0, 0x15, 0x00, 0xFE, 0xD0, 0x05, 0x12, 0x12]
+        states = []
+        for _ in range(9):
+            self.cpu.run(1)
+            buffer.push()
+            states.append(self.cpu.save_state())
+
+        for state in reversed(states[:-1]):
+            self.assertTrue(buffer.rewind())
+            self.assertEqual(self.cpu.save_state(), state)
+
+    def test_memory_limit(self):
+        buffer = rewind.RewindBuffer(self.cpu, max_bytes=64 * 1024, keyframe_interval=10)
+        for _ in range(1000):
+            self.cpu.run(10)
+            buffer.push()
+        self.assertLessEqual(buffer.size, 64 * 1024)
+        self.assertGreater(len(buffer), 10)
+        self.assertEqual(buffer.size, sum(buffer.group_size(group) for group in buffer.groups))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import tempfile
+import unittest
+import cpu
+import headless
+import spectate
+from settings import *
+
+async def receive(address, count, delay=0):
+    """ Connects as a spectator and returns the first count frames received, reading slowly if delay is set """
+    if isinstance(address, str):
+        reader, writer = await asyncio.open_unix_connection(address)
+    else:
+        reader, writer = await asyncio.open_connection(*address)
+    frames = []
+    async for frame in spectate.read_frames(reader):
+        frames.append(frame)
+        if len(frames) == count:
+            break
+        await asyncio.sleep(delay)
+    writer.close()
+    return frames
+
+class Test_Spectate(unittest.TestCase):
+    """ Test file containing unit tests for spectate.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.machine = headless.load_machine("breakout.ch8", seed=0)
+        self.server = spectate.SpectatorServer()
+        self.server.start()
+
+    def tearDown(self):
+        """ Cleanup performed after each test """
+        self.server.stop()
+
+    def frames(self, count):
+        """ Returns the packed displays of the machine after each of count frames """
+        frames = []
+        for _ in range(count):
+            headless.run_cycles(self.machine, CYCLES_PER_FRAME)
+            frames.append(self.machine.display_bytes())
+        return frames
+
+    def test_port_in_use(self):
+        # Binding the port the running server already listens on fails, which start reports
+        server = spectate.SpectatorServer(port=self.server.port)
+        with self.assertRaises(OSError):
+            server.start()
+        self.assertFalse(server.thread.is_alive())
+        server.stop()
+
+    def test_encode_and_decode(self):
+        previous, frame = self.frames(2)[0], self.frames(30)[-1]
+        message = spectate.encode_delta(7, previous, frame, False)
+        kind, hires, sequence, length = spectate.MESSAGE_HEADER.unpack_from(message)
+        self.assertEqual((kind, hires, sequence), (spectate.DELTA, False, 7))
+        self.assertEqual(spectate.decode(kind, hires, message[spectate.MESSAGE_HEADER.size:], previous), frame)
+        self.assertLess(len(message), len(spectate.encode_keyframe(7, frame, False)))
+
+        message = spectate.encode_keyframe(8, frame, False)
+        self.assertEqual(spectate.decode(spectate.KEYFRAME, False, message[spectate.MESSAGE_HEADER.size:], None), frame)
+
+    def test_keyframe_then_deltas(self):
+        frames = self.frames(20)
+        self.server.publish(frames[0])
+
+        async def spectate_frames():
+            spectator = asyncio.ensure_future(receive(("127.0.0.1", self.server.port), 5))
+            await asyncio.sleep(0.1)
+            for frame in frames[1:]:
+                self.server.publish(frame)
+                await asyncio.sleep(0.01)
+            return await asyncio.wait_for(spectator, 10)
+
+        received = asyncio.run(spectate_frames())
+        self.assertEqual([sequence for (sequence, _, _) in received], [1, 2, 3, 4, 5])
+        self.assertFalse(any(hires for (_, hires, _) in received))
+        unique = [frames[0]] + [frame for (previous, frame) in zip(frames, frames[1:]) if frame != previous]
+        self.assertEqual([frame for (_, _, frame) in received], unique[:5])
+
+    def test_slow_spectator_skips_frames(self):
+        frames = self.frames(200)
+        self.server.publish(frames[0])
+
+        async def spectate_frames():
+            spectator = asyncio.ensure_future(receive(("127.0.0.1", self.server.port), 1000, delay=0.05))
+            await asyncio.sleep(0.1)
+            for frame in frames[1:]:
+                self.server.publish(frame)
+            await asyncio.sleep(0.3)
+            self.server.stop()
+            return await asyncio.wait_for(spectator, 10)
+
+        received = asyncio.run(spectate_frames())
+        self.assertLess(len(received), self.server.sequence)
+        self.assertEqual(received[-1][0], self.server.sequence)
+        self.assertEqual(received[-1][2], self.server.published)
+
+    def test_unix_socket_hires(self):
+        path = os.path.join(tempfile.mkdtemp(), "spectate.sock")
+        server = spectate.server_for_address(path)
+        server.start()
+        machine = cpu.Cpu()
+        machine.high_resolution()
+        machine.display[100][50] = 3
+        server.publish(machine.display_bytes(), machine.hires)
+        (sequence, hires, frame), = asyncio.run(receive(path, 1))
+        server.stop()
+        os.remove(path)
+        self.assertTrue(hires)
+        self.assertEqual(frame, machine.display_bytes())
+
+if __name__ == "__main__":
+    unittest.main()
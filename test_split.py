@@ -0,0 +1,100 @@
+import os
+import tempfile
+import time
+import unittest
+import numpy as np
+import multiprocessing
+from settings import *
+
+# The frontend module imports PyGame, which is never given a real window or sound here
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import split
+
+class Test_Split(unittest.TestCase):
+    """ Test file containing unit tests for split.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.shared = split.SharedState()
+
+    def tearDown(self):
+        """ Cleanup performed after each test """
+        self.shared.close(unlink=True)
+
+    def test_publish_and_read(self):
+        attached = split.SharedState(self.shared.memory.name)
+        frame = bytes(i % 256 for i in range(split.FRAME_BYTES))
+        self.shared.publish(frame, True)
+        read = np.zeros(split.FRAME_BYTES, dtype=np.uint8)
+        self.assertEqual(attached.read(read), (2, True, split.FRAME_BYTES))
+        self.assertEqual(read.tobytes(), frame)
+
+        # Smaller frames only fill the start of the buffer
+        self.shared.publish(bytes(HEIGHT * WIDTH // 8))
+        self.assertEqual(attached.read(read), (4, False, HEIGHT * WIDTH // 8))
+        self.assertFalse(read[: HEIGHT * WIDTH // 8].any())
+        attached.close()
+
+    def test_read_while_publishing(self):
+        read = np.zeros(split.FRAME_BYTES, dtype=np.uint8)
+        self.shared.sequence[0] = 3
+        self.assertIsNone(self.shared.read(read))
+
+    def test_shared_cpu(self):
+        cpu = split.SharedCpu(self.shared)
+        self.assertFalse(cpu.get_display().any())
+        display = np.zeros((WIDTH, HEIGHT), dtype=np.uint8)
+        display[5][7] = 1
+        self.shared.publish(np.packbits(display.T).tobytes())
+        self.assertTrue(np.array_equal(cpu.get_display(), display))
+
+        # HIRES frames with a second plane are unpacked into plane bitmasks
+        planes = np.zeros((2, HIRES_WIDTH, HIRES_HEIGHT), dtype=np.uint8)
+        planes[0][100][60] = planes[1][100][60] = planes[1][3][2] = 1
+        self.shared.publish(b"".join(np.packbits(plane.T).tobytes() for plane in planes), True)
+        display = cpu.get_display()
+        self.assertEqual(display.shape, (HIRES_WIDTH, HIRES_HEIGHT))
+        self.assertEqual((display[100][60], display[3][2], display.sum()), (3, 2, 5))
+        cpu.set_key(0xA, True)
+        self.assertEqual(self.shared.keypad[0xA], 1)
+        self.shared.control[split.CONTROL_HALTED] = 1
+        self.assertTrue(cpu.halted)
+
+    def test_emulate(self):
+        control = self.shared.control
+        control[split.CONTROL_RUNNING] = 1
+        control[split.CONTROL_CYCLES] = CYCLES_PER_FRAME
+        context = multiprocessing.get_context("spawn")
+        emulator = context.Process(target=split.emulate, args=(self.shared.memory.name, "breakout.ch8"))
+        emulator.start()
+
+        # Wait for the emulator to draw the bricks
+        cpu = split.SharedCpu(self.shared)
+        deadline = time.perf_counter() + 10
+        while cpu.get_display().sum() < 100 and time.perf_counter() < deadline:
+            time.sleep(0.01)
+        control[split.CONTROL_RUNNING] = 0
+        emulator.join(JOIN_TIMEOUT)
+        if emulator.is_alive():
+            emulator.kill()
+
+        self.assertGreaterEqual(cpu.get_display().sum(), 100)
+        self.assertEqual(emulator.exitcode, 0)
+
+    def test_frontend_quits_when_emulator_dies(self):
+        # The rom's first instruction is invalid, so the emulator raises on its first frame
+        rom = os.path.join(tempfile.mkdtemp(), "invalid.ch8")
+        with open(rom, "wb") as game:
+            game.write(bytes([0xFF, 0xFF]))
+        frontend = split.SplitChip8(rom, False)
+        self.assertIsInstance(frontend.cpu, split.SharedCpu)
+        self.assertIsNone(frontend.debugger)
+
+        frontend.emulator.join(JOIN_TIMEOUT * 2)
+        with self.assertRaises(SystemExit):
+            frontend.run()
+        self.assertNotEqual(frontend.emulator.exitcode, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import os
+import tempfile
+import unittest
+import cpu
+import headless
+import profiler
+import tracer
+
+class Test_Tracer(unittest.TestCase):
+    """ Test file containing unit tests for tracer.py """
+
+    def setUp(self):
+        """ Setup performed before each test """
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "trace.bin")
+        self.cpu = cpu.Cpu()
+
+    def tearDown(self):
+        """ Cleanup performed after each test """
+        self.directory.cleanup()
+
+    def trace_program(self, program, cycles, **options):
+        """ Runs a program under a tracer, returning the records in its trace """
+        self.cpu.memory[0x200 : 0x200 + len(program)] = program
+        machine_tracer = tracer.Tracer(self.cpu, self.path, **options)
+        machine_tracer.attach()
+        self.cpu.run(cycles)
+        machine_tracer.close()
+        return list(tracer.read_trace(self.path))
+
+    def test_records_changes_and_writes(self):
+        # V0 = 0xFE, V1 = 0x01, I = 0x300, BCD of V0, store V0 to V1, jump to self
+        program = [0x60, 0xFE, 0x61, 0x01, 0xA3, 0x00, 0xF0, 0x33, 0xF1, 0x55, 0x12, 0x0A]
+        records = self.trace_program(program, 6)
+        self.assertEqual([record.pc for record in records], [0x200, 0x202, 0x204, 0x206, 0x208, 0x20A])
+        self.assertEqual([record.cycle for record in records], list(range(6)))
+        self.assertEqual(records[0].opcode, 0x60FE)
+        self.assertEqual(records[0].registers, ((0x0, 0xFE),))
+        self.assertEqual(records[2].registers, ((tracer.REGISTER_I, 0x300),))
+        self.assertEqual(records[3].writes, ((0x300, 2), (0x301, 5), (0x302, 4)))
+        self.assertEqual(records[4].writes, ((0x300, 0xFE), (0x301, 0x01)))
+        self.assertEqual(records[5].registers, ())
+        self.assertEqual(self.cpu.pc, 0x20A)
+
+    def test_cycles_after_halt(self):
+        # V0 = 1, wait for a key into V1, then count up in V0. The cycles spent halted pass idle
+        self.cpu.memory[0x200:0x208] = [0x60, 0x01, 0xF1, 0x0A, 0x70, 0x01, 0x12, 0x04]
+        machine_tracer = tracer.Tracer(self.cpu, self.path)
+        machine_tracer.attach()
+        headless.run_cycles(self.cpu, 20)
+        self.cpu.set_key(0x5, True)
+        headless.run_cycles(self.cpu, 5)
+        self.cpu.execute_cycle()
+        machine_tracer.close()
+
+        records = list(tracer.read_trace(self.path))
+        self.assertEqual([record.cycle for record in records], [0, 1, 20, 21, 22, 23, 24, 25])
+        self.assertEqual(records[2].pc, 0x204)
+        self.assertEqual(records[-1].cycle, self.cpu.cycle_count - 1)
+
+    def test_sample(self):
+        records = self.trace_program([0x70, 0x01, 0x12, 0x00], 10, sample=3)
+        self.assertEqual([record.cycle for record in records], [2, 5, 8])
+        self.assertEqual([record.pc for record in records], [0x200, 0x202, 0x200])
+        self.assertEqual(records[0].registers, ((0x0, 2),))
+
+    def test_ring_keeps_latest(self):
+        self.cpu.memory[0x200:0x204] = [0x70, 0x01, 0x12, 0x00]
+        machine_tracer = tracer.Tracer(self.cpu, ring_size=4)
+        machine_tracer.attach()
+        self.cpu.run(10)
+        machine_tracer.close()
+        machine_tracer.dump(self.path)
+        records = list(tracer.read_trace(self.path))
+        self.assertEqual([record.cycle for record in records], [6, 7, 8, 9])
+        self.assertEqual(records[2].registers, ((0x0, 5),))
+
+    def test_wraps_profiler(self):
+        machine_profiler = profiler.Profiler(self.cpu)
+        machine_profiler.attach()
+        records = self.trace_program([0x70, 0x01, 0x12, 0x00], 10)
+        self.assertEqual(len(records), 10)
+        self.assertEqual(machine_profiler.stats()["families"]["7XNN"]["count"], 5)
+        self.assertEqual(self.cpu.decoder, machine_profiler.decode)
+
+    def test_first_divergence(self):
+        paths = []
+        for seed in (1, 1, 2):
+            paths.append(os.path.join(self.directory.name, "trace" + str(len(paths)) + ".bin"))
+            machine = headless.load_machine("pong.ch8", seed=seed)
+            machine_tracer = tracer.Tracer(machine, paths[-1])
+            machine_tracer.attach()
+            headless.run_cycles(machine, 2000)
+            machine_tracer.close()
+
+        self.assertIsNone(tracer.first_divergence(paths[0], paths[1]))
+        a, b = tracer.first_divergence(paths[0], paths[2])
+        self.assertEqual((a.cycle, a.pc, a.opcode), (b.cycle, b.pc, b.opcode))
+        self.assertEqual(a.opcode & 0xF000, 0xC000)
+        self.assertNotEqual(a.registers, b.registers)
+
+    def test_read_trace_rejects_other_files(self):
+        with open(self.path, "wb") as output:
+            output.write(b"ROM!\x01")
+        with self.assertRaises(ValueError):
+            list(tracer.read_trace(self.path))
+
+if __name__ == "__main__":
+    unittest.main()
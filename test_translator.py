@@ -0,0 +1,149 @@
+import unittest
+import cpu
+import headless
+import translator
+import numpy as np
+from settings import *
+
+class Test_Translator(unittest.TestCase):
+    """ Test file containing unit tests for translator.py. Compares against the cpu.py interpreter """
+
+    def run_both(self, rom, cycles):
+        """ Runs the rom on both engines with the same random seed """
+        machines = []
+        for engine in (cpu.Cpu(seed=rom), translator.TranslatingCpu(seed=rom)):
+            engine.load_file_to_memory("fontset.bin", 0x050)
+            engine.load_file_to_memory("roms/" + rom, 0x200)
+            if isinstance(engine, translator.TranslatingCpu):
+                executed = engine.run(cycles)
+                self.assertEqual(executed, cycles)
+            else:
+                for _ in range(cycles):
+                    engine.execute_cycle()
+            machines.append(engine)
+        return machines
+
+    def assert_same_state(self, interpreter, translated):
+        self.assertEqual(interpreter.pc, translated.pc)
+        self.assertEqual(interpreter.I, translated.I)
+        self.assertEqual(list(interpreter.V), list(translated.V))
+        self.assertEqual(interpreter.sp, translated.sp)
+        self.assertEqual(interpreter.delay_timer, translated.delay_timer)
+        self.assertEqual(interpreter.sound_timer, translated.sound_timer)
+        self.assertEqual(interpreter.timer_countdown, translated.timer_countdown)
+        self.assertEqual(list(interpreter.memory), list(translated.memory))
+        self.assertTrue(np.array_equal(interpreter.display, translated.display))
+
+    def test_pong(self):
+        self.assert_same_state(*self.run_both("pong.ch8", 20000))
+
+    def test_breakout(self):
+        self.assert_same_state(*self.run_both("breakout.ch8", 20000))
+
+    def test_tetris(self):
+        self.assert_same_state(*self.run_both("tetris.ch8", 20000))
+
+    def test_scripted_run_state_matches(self):
+        # Whole save states match after long runs with input, including the last opcode executed
+        script = [[cycle, cycle // 5000 % 16, cycle % 10000 == 0] for cycle in range(5000, 300000, 5000)]
+        for rom in ("breakout.ch8", "tetris.ch8"):
+            states = []
+            for engine in (cpu.Cpu(seed=0), translator.TranslatingCpu(seed=0)):
+                engine.load_file_to_memory("fontset.bin", 0x050)
+                engine.load_file_to_memory("roms/" + rom, 0x200)
+                headless.run_script(engine, 300000, script)
+                states.append(engine.save_state())
+            self.assertEqual(states[0], states[1])
+
+    def test_exact_cycle_counts(self):
+        engine = translator.TranslatingCpu()
+        engine.memory[0x200:0x208] = [0x60, 0x01, 0x61, 0x02, 0x62, 0x03, 0x12, 0x00]
+        for cycles in range(1, 10):
+            engine.pc = 0x200
+            self.assertEqual(engine.run(cycles), cycles)
+            self.assertEqual(engine.pc, 0x200 + 2 * (cycles % 4))
+
+    def test_untranslated_block_counted_once(self):
+        # V0 = 5, delay timer = V0, call 0x300, which starts with F00A and can't be translated
+        machines = []
+        for engine in (cpu.Cpu(cycles_per_timer_tick=10), translator.TranslatingCpu(cycles_per_timer_tick=10)):
+            engine.memory[0x200:0x206] = [0x60, 0x05, 0xF0, 0x15, 0x23, 0x00]
+            engine.memory[0x300:0x306] = [0xF0, 0x0A, 0x70, 0x01, 0x13, 0x02]
+            self.assertEqual(engine.run(10), 4)
+            engine.idle(3)
+            engine.set_key(0x7, True)
+            self.assertEqual(engine.run(10), 10)
+            machines.append(engine)
+
+        interpreter, translated = machines
+        self.assertEqual(interpreter.cycle_count, translated.cycle_count)
+        self.assertEqual(interpreter.timer_countdown, translated.timer_countdown)
+        self.assertEqual(interpreter.delay_timer, translated.delay_timer)
+        self.assertEqual(interpreter.V[0], translated.V[0])
+        self.assertEqual(interpreter.pc, translated.pc)
+
+    def run_program(self, program, cycles):
+        """ Runs the program loaded at 0x200 on both engines for cycles in batches, as the frontend does """
+        machines = []
+        for engine in (cpu.Cpu(seed=0), translator.TranslatingCpu(seed=0)):
+            engine.memory[0x200 : 0x200 + len(program)] = program
+            headless.run_cycles(engine, cycles)
+            machines.append(engine)
+        return machines
+
+    def test_blocks_run_past_timer_ticks(self):
+        # A 15 instruction loop with no timer access runs whole over the ticks every 10 cycles, while
+        # the loop setting and reading the delay timer stops at each tick
+        untimed = bytes.fromhex("7001810482138324640583447501" * 2 + "1200")
+        timed = bytes.fromhex("7001F015F2078324640583447501" * 2 + "1200")
+        for program in (untimed, timed):
+            interpreter, translated = self.run_program(program, 1003)
+            self.assert_same_state(interpreter, translated)
+            self.assertEqual(interpreter.cycle_count, translated.cycle_count)
+            self.assertEqual(interpreter.save_state(), translated.save_state())
+
+    def test_idle_loop_skipped(self):
+        # Waits for the delay timer to reach 0, then sets V1 and waits forever
+        program = bytes.fromhex("6030F015F007300012046101120C")
+        interpreter, translated = self.run_program(program, 5000)
+        self.assertEqual(interpreter.save_state(), translated.save_state())
+        self.assertEqual(translated.V[1], 1)
+
+        # The cycles spent waiting forever are skipped rather than dispatched as blocks
+        function, length, timed = translated.block_cache[0x20C]
+        calls = []
+        def counted():
+            calls.append(translated.pc)
+            function()
+        translated.block_cache[0x20C] = (counted, length, timed)
+        self.assertEqual(translated.run(100 * CYCLES_PER_TIMER_TICK), 100 * CYCLES_PER_TIMER_TICK)
+        self.assertLess(len(calls), 10)
+
+    def test_cycles_counted_when_block_raises(self):
+        # V0 = 1, I = 0xFFF, store V0-V1 beyond memory, so the block raises on its third instruction
+        machines = []
+        for engine in (cpu.Cpu(), translator.TranslatingCpu()):
+            engine.memory[0x200:0x206] = [0x60, 0x01, 0xAF, 0xFF, 0xF1, 0x55]
+            with self.assertRaises(IndexError):
+                engine.run(10)
+            machines.append(engine)
+
+        interpreter, translated = machines
+        self.assertEqual(translated.cycle_count, 2)
+        self.assertEqual(interpreter.cycle_count, translated.cycle_count)
+        self.assertEqual(interpreter.timer_countdown, translated.timer_countdown)
+        self.assertEqual((interpreter.pc, interpreter.opcode), (translated.pc, translated.opcode))
+
+    def test_block_invalidated_by_memory_write(self):
+        # V0 = 0x00, V1 = 0xE0, I = 0x20A, store V0-V1 over 6BCC, which becomes 00E0
+        engine = translator.TranslatingCpu()
+        engine.memory[0x200:0x20E] = [0x60, 0x00, 0x61, 0xE0, 0xA2, 0x0A, 0xF1, 0x55,
+                                      0x12, 0x0A, 0x6B, 0xCC, 0x12, 0x0A]
+        engine.translate(0x20A)
+        engine.display[0][0] = 1
+        engine.run(6)
+        self.assertEqual(engine.V[0xB], 0x00)
+        self.assertEqual(engine.display[0][0], 0)
+
+if __name__ == "__main__":
+    unittest.main()
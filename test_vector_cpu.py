@@ -0,0 +1,132 @@
+import random
+import numpy as np
+import unittest
+import cpu
+import headless
+import vector_cpu
+
+# Opcode templates used to generate random programs, with the registers, values and addresses filled
+# in at random. I is kept away from the end of memory, where Cpu's bytearray slices would grow or
+# shrink memory and registers rather than raise
+FUZZ_TEMPLATES = [
+    0x00E0, 0x00EE, 0x0123, 0x1000, 0x2000, 0x3000, 0x4000, 0x5000, 0x6000, 0x7000, 0x8000, 0x8001,
+    0x8002, 0x8003, 0x8004, 0x8005, 0x8006, 0x8007, 0x800E, 0x9000, 0xA300, 0xB000, 0xC000, 0xD000,
+    0xE09E, 0xE0A1, 0xE000, 0xF007, 0xF00A, 0xF015, 0xF018, 0xF01E, 0xF029, 0xF033, 0xF055, 0xF065
+]
+
+# Invalid opcodes, which are generated occasionally so that some programs fault
+FUZZ_INVALID = [0x8008, 0xF0FF]
+
+def random_program(rng, length):
+    """ Returns a random program of opcodes built from FUZZ_TEMPLATES """
+    program = bytearray()
+    for _ in range(length):
+        opcode = rng.choice(FUZZ_INVALID if rng.random() < 0.01 else FUZZ_TEMPLATES)
+        msb = opcode >> 12
+        if msb in (0x1, 0x2, 0xB):
+            opcode |= 0x200 + 2 * rng.randrange(length)
+        elif msb == 0xA:
+            opcode |= rng.randrange(0x100)
+        elif msb != 0x0:
+            opcode |= rng.randrange(16) << 8
+            if msb in (0x3, 0x4, 0x6, 0x7, 0xC):
+                opcode |= rng.randrange(0x100)
+            elif msb in (0x5, 0x8, 0x9, 0xD):
+                opcode |= rng.randrange(16) << 4
+            if msb == 0xD:
+                opcode |= rng.randrange(16)
+        program += opcode.to_bytes(2, "big")
+    return program
+
+class Test_VectorCpu(unittest.TestCase):
+    """ Test file containing unit tests for vector_cpu.py """
+
+    def assertMatches(self, machines, index, machine):
+        """ Asserts that an instance of the vector engine has the same state as a Cpu """
+        instance = machines.instance(index)
+        self.assertEqual(bytes(instance.V), bytes(machine.V))
+        self.assertEqual((instance.I, instance.pc, instance.sp), (machine.I, machine.pc, machine.sp))
+        self.assertEqual(list(instance.stack), list(machine.stack))
+        self.assertEqual((instance.delay_timer, instance.sound_timer),
+                         (machine.delay_timer, machine.sound_timer))
+        self.assertEqual(instance.cycle_count, machine.cycle_count)
+        self.assertEqual(instance.memory, machine.memory)
+        self.assertEqual(instance.display_hash(), machine.display_hash())
+        self.assertEqual(instance.rng.getstate(), machine.rng.getstate())
+
+    def test_roms_match_cpu(self):
+        seeds = list(range(8))
+        for rom in ("pong.ch8", "breakout.ch8", "tetris.ch8"):
+            machines = vector_cpu.VectorCpu(len(seeds), seeds=seeds)
+            machines.load_file_to_memory("fontset.bin", 0x050)
+            machines.load_file_to_memory(headless.rom_path(rom), 0x200)
+            for index in range(len(seeds)):
+                machines.keypad[index, index] = 1
+            self.assertEqual(machines.run(3000), 3000)
+
+            for (index, seed) in enumerate(seeds):
+                machine = headless.load_machine(rom, seed=seed)
+                machine.keypad[index] = 1
+                machine.run(3000)
+                self.assertMatches(machines, index, machine)
+                self.assertEqual(machines.instance(index).save_state(), machine.save_state())
+
+    def test_random_programs_match_cpu(self):
+        rng = random.Random(0)
+        count = 64
+        machines = vector_cpu.VectorCpu(count, seeds=range(count))
+        machines.load_file_to_memory("fontset.bin", 0x050)
+        programs = [random_program(rng, 64) for _ in range(count)]
+        for (index, program) in enumerate(programs):
+            machines.memory[index, 0x200 : 0x200 + len(program)] = list(program)
+            machines.keypad[index] = [rng.randrange(2) for _ in range(16)]
+        machines.run(500)
+
+        faults = 0
+        for (index, program) in enumerate(programs):
+            machine = cpu.Cpu(seed=index)
+            machine.load_file_to_memory("fontset.bin", 0x050)
+            machine.memory[0x200 : 0x200 + len(program)] = program
+            machine.keypad[:] = machines.keypad[index].tobytes()
+            try:
+                machine.idle(500 - machine.run(500))
+                faulted = False
+            except (KeyError, IndexError, ValueError):
+                faulted = True
+            self.assertEqual(machines.faulted[index], faulted)
+            self.assertEqual(machines.halted[index], machine.halted)
+            self.assertMatches(machines, index, machine)
+            faults += faulted
+        self.assertTrue(0 < faults < count)
+        self.assertTrue(machines.halted.any())
+
+    def test_display_sprite_wraps(self):
+        machines = vector_cpu.VectorCpu(2)
+        machines.memory[:, 0x300:0x302] = 0xFF
+        machines.memory[:, 0x200:0x206] = [0xA3, 0x00, 0xD0, 0x12, 0xD0, 0x12]
+        machines.V[1, 0:2] = [60, 31]
+        machines.run(2)
+        display = machines.instance(0).get_display()
+        self.assertEqual(display[0:8, 0:2].sum(), 16)
+        self.assertEqual(display.sum(), 16)
+        display = machines.instance(1).get_display()
+        self.assertEqual(display[np.ix_([60, 61, 62, 63, 0, 1, 2, 3], [31, 0])].sum(), 16)
+        self.assertEqual(display.sum(), 16)
+        self.assertEqual(list(machines.V[:, 0xF]), [0, 0])
+        machines.step()
+        self.assertFalse(machines.display.any())
+        self.assertEqual(list(machines.V[:, 0xF]), [1, 1])
+
+    def test_faults_stop_instance(self):
+        machines = vector_cpu.VectorCpu(2)
+        machines.memory[:, 0x200:0x204] = [0x70, 0x01, 0x12, 0x00]
+        machines.memory[1, 0x200:0x202] = [0x80, 0x08]
+        self.assertEqual(machines.run(10), 10)
+        self.assertEqual(list(machines.faulted), [False, True])
+        self.assertEqual(list(machines.cycle_count), [10, 0])
+        self.assertEqual(machines.pc[1], 0x200)
+        machines.faulted[0] = True
+        self.assertEqual(machines.run(10), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,207 @@
+import argparse
+from collections import deque, namedtuple
+from itertools   import zip_longest
+from struct      import Struct
+
+# Trace file layout. A trace is the header followed by one record per traced instruction. Each record
+# is a header of the cycle, pc, opcode and the number of register changes and memory writes, then
+# the register changes and memory writes themselves
+TRACE_MAGIC     = b"C8TR"
+TRACE_VERSION   = 1
+TRACE_HEADER    = Struct(">4sB")
+RECORD_HEADER   = Struct(">IHHBB")
+REGISTER_CHANGE = Struct(">BH")
+MEMORY_WRITE    = Struct(">HB")
+
+# Register numbers used in register changes. 0x0 to 0xF are V0 to VF
+REGISTER_I           = 16
+REGISTER_DELAY_TIMER = 17
+REGISTER_SOUND_TIMER = 18
+REGISTER_SP          = 19
+REGISTER_NAMES = ["V" + hex(i)[2:].upper() for i in range(16)] + ["I", "DT", "ST", "SP"]
+
+# A traced instruction. registers and writes are tuples of (register, value) and (address, value)
+TraceRecord = namedtuple("TraceRecord", ["cycle", "pc", "opcode", "registers", "writes"])
+
+class Tracer():
+    """
+    Records a compact binary trace of executed instructions: the cycle, pc and opcode of each, the
+    registers it changed and the memory it wrote. Records are streamed to a file through a buffered
+    writer or, in ring mode, only the latest are kept in memory until dump is called. Sampling
+    records only every Nth instruction.
+
+    Recording works by swapping in a decoder which wraps each predecoded operation, as Profiler
+    does. The decoder in use when the tracer is attached is wrapped in turn, so a profiler attached
+    first keeps recording. Traced runs never skip idle loops, so every instruction is seen.
+
+    Attributes:
+        cpu (Cpu): CPU being traced.
+
+        output (file): Buffered file records are streamed to, or None in ring mode.
+        ring (deque) : Latest records, or None if streaming to a file.
+
+        sample (int)      : Only every sample-th instruction is recorded.
+        executed (int)    : Number of instructions executed since the tracer was attached.
+        decoder (function): Decoder which was in use when the tracer was attached.
+
+        batch_cycle (int)   : Cycle count of the CPU when it last changed. Cpu.run only updates it
+                              once per batch, so instructions are stamped with their offset from it.
+        batch_executed (int): Value of executed when batch_cycle was last updated.
+    """
+
+    def __init__(self, cpu, path=None, sample=1, ring_size=None):
+        self.cpu = cpu
+        self.sample = sample
+        self.executed = 0
+        self.decoder = None
+        self.batch_cycle = None
+        self.batch_executed = 0
+
+        if ring_size is None:
+            self.output = open(path, "wb", buffering=1 << 16)
+            self.output.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+            self.ring = None
+        else:
+            self.output = None
+            self.ring = deque(maxlen=ring_size)
+
+    def attach(self):
+        """ Starts recording """
+        self.decoder = self.cpu.decoder
+        self.batch_cycle = None
+        self.executed = 0
+        self.cpu.set_decoder(self.decode)
+
+    def detach(self):
+        """ Stops recording, restores the decoder the tracer wrapped and flushes the trace """
+        self.cpu.set_decoder(self.decoder)
+        if self.output is not None:
+            self.output.flush()
+
+    def close(self):
+        """ Stops recording and closes the trace file """
+        self.detach()
+        if self.output is not None:
+            self.output.close()
+
+    def decode(self, address):
+        """ Decodes the address with the wrapped decoder, wrapping the operation to record it """
+        opcode, operation, advance = self.decoder(address)
+        cpu = self.cpu
+
+        # Only FX33 and FX55 write memory, from I up to 3 bytes or X + 1 bytes on
+        if opcode & 0xF0FF == 0xF033:
+            write_length = 3
+        elif opcode & 0xF0FF == 0xF055:
+            write_length = ((opcode & 0x0F00) >> 8) + 1
+        else:
+            write_length = 0
+
+        def traced():
+            # Stamp the instruction with the cycle it runs on, which includes any cycles that passed
+            # idle or halted since the last one
+            if cpu.cycle_count != self.batch_cycle:
+                self.batch_cycle = cpu.cycle_count
+                self.batch_executed = self.executed
+            cycle = self.batch_cycle + self.executed - self.batch_executed
+            self.executed += 1
+            if self.executed % self.sample:
+                run()
+                return
+
+            V, I, registers = bytes(cpu.V), cpu.I, (cpu.delay_timer, cpu.sound_timer, cpu.sp)
+            write_start = cpu.I
+            try:
+                run()
+            finally:
+                # Record instructions which raise too, such as FX0A halting the CPU
+                changes = [(reg, value) for (reg, (old, value)) in enumerate(zip(V, cpu.V)) if old != value]
+                if cpu.I != I:
+                    changes.append((REGISTER_I, cpu.I))
+                for (reg, old, value) in zip((REGISTER_DELAY_TIMER, REGISTER_SOUND_TIMER, REGISTER_SP),
+                                             registers, (cpu.delay_timer, cpu.sound_timer, cpu.sp)):
+                    if old != value:
+                        changes.append((reg, value))
+                writes = [(a, cpu.memory[a]) for a in range(write_start, write_start + write_length)]
+                self.record(cycle, address, opcode, changes, writes)
+
+        def run():
+            try:
+                operation()
+            except BaseException:
+                # An instruction which raised may not have been counted, so the next one is stamped
+                # from the cycle count alone
+                self.batch_cycle = None
+                raise
+
+        entry = (opcode, traced, advance)
+        cpu.decode_cache[address] = entry
+        return entry
+
+    def record(self, cycle, pc, opcode, changes, writes):
+        """ Packs a record and streams it to the trace file or ring """
+        data = b"".join([RECORD_HEADER.pack(cycle & 0xFFFFFFFF, pc, opcode, len(changes), len(writes))]
+                        + [REGISTER_CHANGE.pack(*change) for change in changes]
+                        + [MEMORY_WRITE.pack(*write) for write in writes])
+        if self.ring is None:
+            self.output.write(data)
+        else:
+            self.ring.append(data)
+
+    def dump(self, path):
+        """ Writes the records kept in ring mode to a trace file """
+        with open(path, "wb") as output:
+            output.write(TRACE_HEADER.pack(TRACE_MAGIC, TRACE_VERSION))
+            output.writelines(self.ring)
+
+def read_trace(path):
+    """ Lazily yields the TraceRecords in a trace file """
+    with open(path, "rb") as trace:
+        magic, version = TRACE_HEADER.unpack(trace.read(TRACE_HEADER.size))
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise ValueError("Not a version " + str(TRACE_VERSION) + " Chip-8 trace")
+
+        while True:
+            header = trace.read(RECORD_HEADER.size)
+            if not header:
+                return
+            cycle, pc, opcode, change_count, write_count = RECORD_HEADER.unpack(header)
+            changes = tuple(REGISTER_CHANGE.iter_unpack(trace.read(change_count * REGISTER_CHANGE.size)))
+            writes = tuple(MEMORY_WRITE.iter_unpack(trace.read(write_count * MEMORY_WRITE.size)))
+            yield TraceRecord(cycle, pc, opcode, changes, writes)
+
+def first_divergence(path_a, path_b):
+    """
+    Returns the first pair of records which differ between two traces, or None if they match. If
+    one trace is shorter, its side of the pair is None
+    """
+    for (a, b) in zip_longest(read_trace(path_a), read_trace(path_b)):
+        if a != b:
+            return (a, b)
+    return None
+
+def format_record(record):
+    """ Returns a record as a line of text """
+    if record is None:
+        return "(end of trace)"
+    changes = " ".join(REGISTER_NAMES[reg] + "=" + hex(value).upper() for (reg, value) in record.registers)
+    writes = " ".join("[" + hex(address).upper() + "]=" + hex(value).upper() for (address, value) in record.writes)
+    return " ".join(part for part in (str(record.cycle).rjust(10), hex(record.pc).upper(),
+                                      "{:04X}".format(record.opcode), changes, writes) if part)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chip-8 Trace Reader")
+    parser.add_argument("traces", type=str, nargs="+", metavar="trace", help="Trace file to print, or two to compare")
+    args = parser.parse_args()
+
+    if len(args.traces) == 1:
+        for record in read_trace(args.traces[0]):
+            print(format_record(record))
+    else:
+        divergence = first_divergence(*args.traces[:2])
+        if divergence is None:
+            print("Traces match")
+        else:
+            print("First divergence:")
+            for record in divergence:
+                print(format_record(record))
@@ -0,0 +1,221 @@
+import cpu
+
+class TranslatingCpu(cpu.Cpu):
+    """
+    Alternative execution engine which translates straight-line runs of Chip-8 instructions into
+    compiled Python functions. Each run (a basic block) ends at a jump, call, return or skip and is
+    executed with a single dispatch instead of one execute_cycle call per instruction.
+
+    Attributes:
+        block_cache (dict): Maps block start addresses to (function, length, timed) entries, where
+                            length is the number of instructions the block executes and timed is
+                            True if it reads or writes the timers. A length of 0 marks an
+                            instruction that is always interpreted.
+
+        block_owners (dict): Maps every address covered by a block to the set of block start
+                             addresses containing it. Used to invalidate blocks on memory writes.
+    """
+
+    # Longest run of instructions translated into a single block
+    MAX_BLOCK_LENGTH = 64
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.block_cache = {}
+        self.block_owners = {}
+
+    def run(self, cycles):
+        """
+        Executes exactly `cycles` instructions, dispatching whole blocks where they fit. Blocks run
+        past timer ticks, which are applied once the block exits, unless they read or write the
+        timers. Whole iterations of idle loops are skipped up to the next timer tick, as Cpu.run does
+        """
+        # Instrumentation wraps individual operations, so instrumented runs are interpreted
+        if self.instrumented():
+            return super().run(cycles)
+
+        blocks = self.block_cache
+        executed = 0
+        idle = None
+        while executed < cycles and not self.halted:
+            # A loop found idle is checked again with the current timers, and again after each timer
+            # tick its skipped iterations reach
+            if idle is not None:
+                skipped = self.skip_idle_loop(idle, min(cycles - executed, self.timer_countdown))
+                if skipped:
+                    executed += skipped
+                    self.idle(skipped)
+                    continue
+                idle = None
+
+            block = blocks.get(self.pc)
+            if block is None:
+                block = self.translate(self.pc)
+
+            # Blocks using the timers never run past a timer tick, so timer reads within them stay
+            # exact. Empty blocks are stepped, since execute_cycle does its own cycle counting
+            function, length, timed = block
+            if 0 < length <= cycles - executed and (not timed or length <= self.timer_countdown):
+                start = self.pc
+                try:
+                    function()
+                except cpu.IdleLoop as loop:
+                    # The block ended with the jump closing an idle loop
+                    idle = loop
+                except Exception:
+                    # Every called operation is preceded by setting the pc to its address, so the
+                    # instructions completed before the failing one are counted as Cpu.run does
+                    self.idle((self.pc - start) // 2)
+                    raise
+                # Apply the timer ticks the block ran past
+                executed += length
+                self.cycle_count += length
+                self.timer_countdown -= length
+                while self.timer_countdown <= 0:
+                    overshoot = self.timer_countdown
+                    self.decrement_timers()
+                    self.timer_countdown += overshoot
+            else:
+                # Step through the block so the cycle count stays exact
+                self.execute_cycle()
+                executed += 1
+        return executed
+
+    def translate(self, address):
+        """ Translates the basic block starting at address into a Python function and caches it """
+        lines = ["def block():", "    V = cpu.V"]
+        namespace = {"cpu": self}
+
+        pc = address
+        length = 0
+        timed = False
+        terminated = False
+        while not terminated and length < self.MAX_BLOCK_LENGTH and pc + 1 < len(self.memory):
+            try:
+                opcode, operation, advance = self.decode(pc)
+            except KeyError:
+                # Invalid opcode, leave it to the interpreter to raise when it's reached
+                break
+            if opcode & 0xF0FF == 0xF00A or opcode == 0x00FD:
+                # FX0A and 00FD halt the CPU, which the interpreter handles
+                break
+
+            terminated = self.translate_opcode(opcode, pc, operation, advance, lines, namespace)
+            timed = timed or opcode & 0xF0FF in (0xF007, 0xF015, 0xF018)
+            last_opcode = opcode
+            pc += 2
+            length += 1
+
+        # Inlined opcodes don't set cpu.opcode, so it's set to the last one once the block exits
+        if length > 0:
+            lines.append("    cpu.opcode = " + hex(last_opcode))
+        if not terminated:
+            lines.append("    cpu.pc = " + hex(pc))
+
+        if length == 0:
+            # Nothing could be translated, run leaves the instruction to the interpreter
+            block = (self.execute_cycle, 0, True)
+        else:
+            source = "\n".join(lines) + "\n"
+            exec(compile(source, "<block " + hex(address) + ">", "exec"), namespace)
+            block = (namespace["block"], length, timed)
+
+        self.block_cache[address] = block
+        for i in range(address, address + 2 * length):
+            self.block_owners.setdefault(i, set()).add(address)
+        return block
+
+    def translate_opcode(self, opcode, pc, operation, advance, lines, namespace):
+        """
+        Appends the Python source for a single opcode to lines. Returns True if the opcode ends the
+        block, in which case the emitted source also sets the pc.
+        """
+        msb = opcode >> 12
+        x   = (opcode & 0x0F00) >> 8
+        y   = (opcode & 0x00F0) >> 4
+        n   = opcode & 0x000F
+        nn  = opcode & 0x00FF
+        nnn = opcode & 0x0FFF
+        emit = lambda line: lines.append("    " + line)
+
+        # Jumps, calls and skips. Jumps which may close an idle loop call the operation checking it
+        if msb == 0x1 and operation == self.jump_to_address:
+            emit("cpu.pc = " + hex(nnn))
+            return True
+        if msb == 0x3:
+            emit("cpu.pc = {} if V[{}] == {} else {}".format(hex(pc + 4), x, nn, hex(pc + 2)))
+            return True
+        if msb == 0x4:
+            emit("cpu.pc = {} if V[{}] != {} else {}".format(hex(pc + 4), x, nn, hex(pc + 2)))
+            return True
+        if msb == 0x5:
+            emit("cpu.pc = {} if V[{}] == V[{}] else {}".format(hex(pc + 4), x, y, hex(pc + 2)))
+            return True
+        if msb == 0x9:
+            emit("cpu.pc = {} if V[{}] != V[{}] else {}".format(hex(pc + 4), x, y, hex(pc + 2)))
+            return True
+
+        # Simple register operations
+        if msb == 0x6:
+            emit("V[{}] = {}".format(x, nn))
+            return False
+        if msb == 0x7:
+            emit("V[{0}] = (V[{0}] + {1}) & 0xFF".format(x, nn))
+            return False
+        if msb == 0xA:
+            emit("cpu.I = " + hex(nnn))
+            return False
+        if msb == 0x8 and n <= 0x3:
+            operator = ["", " | ", " & ", " ^ "][n]
+            source = "V[{1}]" if n == 0x0 else "V[{0}]" + operator + "V[{1}]"
+            emit(("V[{0}] = " + source).format(x, y))
+            return False
+        if msb == 0x8 and n == 0x4:
+            emit("t = V[{}] + V[{}]".format(x, y))
+            emit("V[{}] = t & 0xFF".format(x))
+            emit("V[15] = t > 0xFF")
+            return False
+        if msb == 0x8 and (n == 0x5 or n == 0x7):
+            first, second = (x, y) if n == 0x5 else (y, x)
+            emit("t = V[{}] - V[{}]".format(first, second))
+            emit("V[{}] = t & 0xFF".format(x))
+            emit("V[15] = t >= 0")
+            return False
+        if msb == 0x8 and n == 0x6:
+            emit("V[15] = V[{}] & 0x01".format(x))
+            emit("V[{0}] = V[{0}] >> 1".format(x))
+            return False
+        if msb == 0x8 and n == 0xE:
+            emit("V[15] = (V[{}] & 0x80) >> 7".format(x))
+            emit("V[{0}] = (V[{0}] << 1) & 0xFF".format(x))
+            return False
+
+        # Everything else calls the predecoded operation
+        name = "op_" + hex(pc)
+        namespace[name] = operation
+        emit("cpu.opcode = " + hex(opcode))
+        emit("cpu.pc = " + hex(pc))
+        emit(name + "()")
+
+        # Jumps, calls, returns and computed jumps end the block, as do memory writes since they
+        # may modify the block itself
+        ends_block = msb in (0x0, 0x1, 0x2, 0xB, 0xE) and opcode != 0x00E0
+        ends_block = ends_block or opcode & 0xF0FF in (0xF033, 0xF055)
+        if ends_block:
+            if advance:
+                emit("cpu.pc += 2")
+            return True
+        return False
+
+    def clear_cache(self):
+        """ Drops every predecoded entry and translated block """
+        super().clear_cache()
+        self.block_cache.clear()
+        self.block_owners.clear()
+
+    def invalidate_cache(self, address, length):
+        """ Drops predecoded entries and translated blocks overlapping the written memory range """
+        super().invalidate_cache(address, length)
+        for i in range(address, address + length):
+            for start in self.block_owners.pop(i, ()):
+                self.block_cache.pop(start, None)
@@ -0,0 +1,551 @@
+import cpu
+import numpy as np
+from settings import *
+from array    import array
+from hashlib  import sha1
+from random   import Random
+
+# Offsets of sprite rows, and of the registers and bytes touched by FX33, FX55 and FX65
+SPRITE_ROWS = np.arange(15)
+REGISTERS   = np.arange(16)
+BCD_DIGITS  = np.arange(3)
+
+# Display rows are packed into 64-bit ints with the leftmost pixel as the MSB, as Cpu's packed rows are
+ROW_BITS  = np.uint64(WIDTH)
+ROW_SHIFT = np.uint64(WIDTH - 8)
+
+class VectorCpu():
+    """
+    Lockstep engine running many independent Chip-8 machines at once. The state of every machine is
+    held in NumPy arrays indexed by instance (struct of arrays), and all machines execute one
+    instruction per step. Each step groups the instances by opcode and applies each opcode handler
+    to its whole group as vectorised operations, so the per-instruction Python overhead is shared by
+    every instance executing that opcode.
+
+    Opcode semantics, including the quirks, match Cpu. An instance which would make Cpu raise (an
+    unknown opcode, a stack overflow, a key above 0xF or an access beyond memory) is marked as
+    faulted instead, and stops executing with pc left at the faulting instruction. Only the CHIP-8
+    display is supported, so the SUPER-CHIP and XO-CHIP display opcodes (00CN, 00DN, 00FB to 00FF
+    and FN01) fault too.
+
+    Attributes:
+        count (int): Number of machines.
+
+        memory (np.ndarray): count x 4096 array of memory.
+        opcode (np.ndarray): Opcode each machine last executed.
+
+        V (np.ndarray): count x 16 array of general purpose registers.
+        I (np.ndarray): Index register of each machine.
+
+        delay_timer (np.ndarray): Delay timer of each machine.
+        sound_timer (np.ndarray): Sound timer of each machine.
+
+        cycles_per_timer_tick (int): Number of steps between timer decrements.
+        timer_countdown (int)      : Steps left until the next timer decrement, shared by all machines.
+
+        pc (np.ndarray): Program counter of each machine.
+
+        rngs ([Random]): Random number generator of each machine, used by CXNN.
+
+        cycle_count (np.ndarray) : Number of cycles each machine has run, including cycles passed
+                                   halted.
+        faulted (np.ndarray)     : Set for machines which have stopped on a fault.
+        halted (np.ndarray)      : Set for machines which FX0A has halted to wait for a key.
+        key_register (np.ndarray): Register FX0A stores the next key pressed in for each halted machine.
+
+        stack (np.ndarray): count x 16 array of stacks.
+        sp (np.ndarray)   : Stack pointer of each machine. Negative values index from the top of the
+                            stack, as Python indexing does in Cpu.
+
+        keypad (np.ndarray): count x 16 array of key states.
+
+        display (np.ndarray): count x HEIGHT array of display rows, each packed into a 64-bit int with
+                              the leftmost pixel as the MSB.
+
+        operation_lookup (dict): Opcode handlers indexed by the most significant bit (MSB). Each
+                                 handler takes an array of the instances executing it.
+    """
+
+    def __init__(self, count, cycles_per_timer_tick=CYCLES_PER_TIMER_TICK, seeds=None):
+        self.count = count
+
+        # Memory
+        self.memory = np.zeros((count, 4096), dtype=np.uint8)
+
+        # Current Opcode
+        self.opcode = np.zeros(count, dtype=np.int64)
+
+        # Registers
+        self.V = np.zeros((count, 16), dtype=np.uint8)
+        self.I = np.zeros(count, dtype=np.int64)
+
+        # Timers
+        self.delay_timer = np.zeros(count, dtype=np.uint8)
+        self.sound_timer = np.zeros(count, dtype=np.uint8)
+        self.cycles_per_timer_tick = cycles_per_timer_tick
+        self.timer_countdown = cycles_per_timer_tick
+
+        # Program Counter
+        self.pc = np.full(count, 0x200, dtype=np.int64)
+
+        # Random Number Generators
+        if seeds is None:
+            seeds = [None] * count
+        self.rngs = [Random(seed) for seed in seeds]
+
+        # Execution State
+        self.cycle_count = np.zeros(count, dtype=np.int64)
+        self.faulted = np.zeros(count, dtype=bool)
+        self.halted = np.zeros(count, dtype=bool)
+        self.key_register = np.zeros(count, dtype=np.int64)
+
+        # Stack
+        self.stack = np.zeros((count, 16), dtype=np.uint16)
+        self.sp = np.zeros(count, dtype=np.int64)
+
+        # Keypad
+        self.keypad = np.zeros((count, 16), dtype=np.uint8)
+
+        # Display
+        self.display = np.zeros((count, HEIGHT), dtype=np.uint64)
+
+        # Operation Lookup Table
+        self.operation_lookup = {
+            0x0: self.clear_or_return,
+            0x1: self.jump_to_address,
+            0x2: self.jump_to_subroutine,
+            0x3: self.skip_if_reg_equal_val,
+            0x4: self.skip_if_reg_not_equal_val,
+            0x5: self.skip_if_reg_equal_reg,
+            0x6: self.move_val_to_reg,
+            0x7: self.add_val_to_reg,
+            0x8: self.arithmetic_operation,
+            0x9: self.skip_if_reg_not_equal_reg,
+            0xA: self.load_index_reg_with_val,
+            0xB: self.jump_to_address_plus_reg,
+            0xC: self.generate_random_number,
+            0xD: self.display_sprite,
+            0xE: self.key_operation,
+            0xF: self.misc_operation
+        }
+
+        # Arithmetic Operation Lookup
+        self.arithmetic_operation_lookup = {
+            0x0: self.move_reg_into_reg,
+            0x1: self.or_reg_into_reg,
+            0x2: self.and_reg_into_reg,
+            0x3: self.xor_reg_into_reg,
+            0x4: self.add_reg_into_reg,
+            0x5: self.sub_reg_into_reg,
+            0x6: self.right_shift_reg,
+            0x7: self.rsub_reg_into_reg,
+            0xE: self.left_shift_reg
+        }
+
+        # Miscellaneous Operation Lookup
+        self.misc_operation_lookup = {
+            0x07: self.move_delay_timer_into_reg ,
+            0x0A: self.wait_for_keypress ,
+            0x15: self.move_reg_into_delay_timer ,
+            0x18: self.move_reg_into_sound_timer ,
+            0x1E: self.add_reg_into_index ,
+            0x29: self.load_index_with_reg_sprite ,
+            0x33: self.store_bcd_into_memory ,
+            0x55: self.store_regs_into_memory ,
+            0x65: self.load_memory_into_regs
+        }
+
+    def step(self):
+        """ Executes one instruction on every running machine and returns the number executed """
+        i = np.flatnonzero(self.running())
+
+        # Fetching the last byte of memory as the first half of an opcode faults, as it does in Cpu
+        fetchable = self.pc[i] < 4095
+        self.fault(i[~fetchable])
+        i = i[fetchable]
+
+        pc = self.pc[i]
+        self.opcode[i] = (self.memory[i, pc].astype(np.int64) << 8) | self.memory[i, pc + 1]
+        msb = self.opcode[i] >> 12
+        self.dispatch(i, msb, self.operation_lookup)
+
+        # Advance pc, except after jumps, on the instances which didn't fault
+        completed = ~self.faulted[i]
+        executed, msb = i[completed], msb[completed]
+        self.pc[executed[(msb != 0x1) & (msb != 0x2)]] += 2
+
+        # Decrement timers once every cycles_per_timer_tick cycles. Cycles pass for halted machines
+        # as they do for the rest
+        self.cycle_count[~self.faulted] += 1
+        self.timer_countdown -= 1
+        if self.timer_countdown <= 0:
+            self.decrement_timers()
+
+        return len(executed)
+
+    def run(self, cycles):
+        """
+        Executes up to the given number of steps and returns the number executed. Returns early if
+        every machine has faulted or halted
+        """
+        for executed in range(cycles):
+            if not self.step():
+                return executed
+        return cycles
+
+    def dispatch(self, i, keys, lookup):
+        """ Calls each handler in lookup on the instances whose key selects it """
+        if not len(i):
+            return
+        order = np.argsort(keys, kind="stable")
+        i, keys = i[order], keys[order]
+        starts = np.flatnonzero(np.diff(keys, prepend=-1))
+        ends = np.append(starts[1:], len(keys))
+        for (start, end) in zip(starts, ends):
+            operation = lookup.get(int(keys[start]))
+            if operation is None:
+                self.fault(i[start:end])
+            else:
+                operation(i[start:end])
+
+    def running(self):
+        """ Returns a mask of the machines which are still executing """
+        return ~(self.faulted | self.halted)
+
+    def fault(self, i):
+        """ Stops the instances, as an exception would stop Cpu """
+        self.faulted[i] = True
+
+    def fields(self, i):
+        """ Returns the X and Y registers and the NN value of the instances' opcodes """
+        opcode = self.opcode[i]
+        return ((opcode >> 8) & 0xF, (opcode >> 4) & 0xF, opcode & 0xFF)
+
+    ####################
+    # Opcode Functions #
+    ####################
+
+    def clear_or_return(self, i):
+        """
+        Decodes clear and return opcodes (MSB of 0). SUPER-CHIP and XO-CHIP display opcodes fault,
+        other 0NNN opcodes are no-ops
+        """
+        opcode = self.opcode[i]
+        unsupported = (opcode & 0xFFE0 == 0x00C0) | (opcode >= 0x00FB) & (opcode <= 0x00FF)
+        self.fault(i[unsupported])
+        self.clear_display(i[opcode == 0x00E0])
+        self.return_from_subroutine(i[opcode == 0x00EE])
+
+    def clear_display(self, i):
+        """ 00E0 - Clear display """
+        self.display[i] = 0
+
+    def return_from_subroutine(self, i):
+        """ 00EE - Return from subroutine """
+        sp = self.sp[i] - 1
+        valid = (sp >= -16) & (sp < 16)
+        self.fault(i[~valid])
+        i, sp = i[valid], sp[valid]
+        self.pc[i] = self.stack[i, sp % 16]
+        self.sp[i] = sp
+
+    def jump_to_address(self, i):
+        """ 1NNN - Jumps to address NNN """
+        self.pc[i] = self.opcode[i] & 0x0FFF
+
+    def jump_to_subroutine(self, i):
+        """ 2NNN - Calls subroutine NNN """
+        sp = self.sp[i]
+        valid = (sp >= -16) & (sp < 16)
+        self.fault(i[~valid])
+        i, sp = i[valid], sp[valid]
+        self.stack[i, sp % 16] = self.pc[i]
+        self.sp[i] = sp + 1
+        self.pc[i] = self.opcode[i] & 0x0FFF
+
+    def skip_if_reg_equal_val(self, i):
+        """ 3XNN - Skips next instruction if VX == NN """
+        x, _, val = self.fields(i)
+        self.pc[i[self.V[i, x] == val]] += 2
+
+    def skip_if_reg_not_equal_val(self, i):
+        """ 4XNN - Skips next instruction if VX != NN """
+        x, _, val = self.fields(i)
+        self.pc[i[self.V[i, x] != val]] += 2
+
+    def skip_if_reg_equal_reg(self, i):
+        """ 5XY0 - Skips next instruction if VX == VY """
+        x, y, _ = self.fields(i)
+        self.pc[i[self.V[i, x] == self.V[i, y]]] += 2
+
+    def move_val_to_reg(self, i):
+        """ 6XNN - Sets VX to NN """
+        x, _, val = self.fields(i)
+        self.V[i, x] = val
+
+    def add_val_to_reg(self, i):
+        """ 7XNN - Adds NN to VX (VF unchanged) """
+        x, _, val = self.fields(i)
+        self.V[i, x] = (self.V[i, x] + val) & 0xFF
+
+    def arithmetic_operation(self, i):
+        """ Decodes arithmetic opcodes (MSB of 8) and calls relevant function """
+        self.dispatch(i, self.opcode[i] & 0x000F, self.arithmetic_operation_lookup)
+
+    # Registers are read again after each write, as Cpu does, so these match it when X or Y is F
+
+    def move_reg_into_reg(self, i):
+        """ 8XY0 - Sets VX to VY """
+        x, y, _ = self.fields(i)
+        self.V[i, x] = self.V[i, y]
+
+    def or_reg_into_reg(self, i):
+        """ 8XY1 - Sets VX to VX | VY """
+        x, y, _ = self.fields(i)
+        self.V[i, x] |= self.V[i, y]
+
+    def and_reg_into_reg(self, i):
+        """ 8XY2 - Sets VX to VX & VY """
+        x, y, _ = self.fields(i)
+        self.V[i, x] &= self.V[i, y]
+
+    def xor_reg_into_reg(self, i):
+        """ 8XY3 - Sets VX to VX ^ VY """
+        x, y, _ = self.fields(i)
+        self.V[i, x] ^= self.V[i, y]
+
+    def add_reg_into_reg(self, i):
+        """ 8XY4 - Sets VX to VX + VY. VF set if carry occurs """
+        x, y, _ = self.fields(i)
+        total = self.V[i, x].astype(np.int64) + self.V[i, y]
+        self.V[i, x] = total & 0xFF
+        self.V[i, 0xF] = total > 0xFF
+
+    def sub_reg_into_reg(self, i):
+        """ 8XY5 - Sets VX to VX - VY. VF set if no borrow occurs """
+        x, y, _ = self.fields(i)
+        difference = self.V[i, x].astype(np.int64) - self.V[i, y]
+        self.V[i, x] = difference & 0xFF
+        self.V[i, 0xF] = difference >= 0
+
+    def right_shift_reg(self, i):
+        """ 8XY6 - Stores LSB of VX in VF then shifts VX to the right by 1. """
+        x, _, _ = self.fields(i)
+        self.V[i, 0xF] = self.V[i, x] & 0x01
+        self.V[i, x] = self.V[i, x] >> 1
+
+    def rsub_reg_into_reg(self, i):
+        """ 8XY7 - Sets VX to VY - VX. VF set if no borrow occurs """
+        x, y, _ = self.fields(i)
+        difference = self.V[i, y].astype(np.int64) - self.V[i, x]
+        self.V[i, x] = difference & 0xFF
+        self.V[i, 0xF] = difference >= 0
+
+    def left_shift_reg(self, i):
+        """ 8XYE - Stores MSB of VX in VF then shifts VX to the left by 1. """
+        x, _, _ = self.fields(i)
+        self.V[i, 0xF] = (self.V[i, x] & 0x80) >> 7
+        self.V[i, x] = (self.V[i, x].astype(np.int64) << 1) & 0xFF
+
+    def skip_if_reg_not_equal_reg(self, i):
+        """ 9XY0 - Skips next instruction if VX != VY """
+        x, y, _ = self.fields(i)
+        self.pc[i[self.V[i, x] != self.V[i, y]]] += 2
+
+    def load_index_reg_with_val(self, i):
+        """ ANNN - Sets I to NNN """
+        self.I[i] = self.opcode[i] & 0x0FFF
+
+    def jump_to_address_plus_reg(self, i):
+        """ BNNN - Jumps to V0 + NNN """
+        self.pc[i] = ((self.opcode[i] & 0x0FFF) + self.V[i, 0]) & 0x0FFF
+
+    def generate_random_number(self, i):
+        """ CXNN - Sets VX to bitwise and of NN and random number (0 to 255) """
+        x, _, val = self.fields(i)
+        rngs = self.rngs
+        self.V[i, x] = np.array([rngs[k].randint(0, 255) for k in i], dtype=np.int64) & val
+
+    def display_sprite(self, i):
+        """
+        DXYN - Draws each instance's sprite at coordinate (VX, VY) of width 8 pixels and height N,
+        wrapping around the screen edges. VF set if a pixel changes from 0 to 1
+        """
+        self.V[i, 0xF] = 0
+
+        x, y, _ = self.fields(i)
+        height = self.opcode[i] & 0x000F
+        valid = self.I[i] + height <= 4096
+        self.fault(i[~valid])
+        i, x, y, height = i[valid], x[valid], y[valid], height[valid]
+
+        # Flatten the sprite rows of every instance into one list of (instance, dy) pairs
+        visible = SPRITE_ROWS < height[:, None]
+        instances = np.broadcast_to(i[:, None], visible.shape)[visible]
+        dy = np.broadcast_to(SPRITE_ROWS, visible.shape)[visible]
+        col = np.broadcast_to((self.V[i, x] % WIDTH)[:, None], visible.shape)[visible]
+        rows = (np.broadcast_to(self.V[i, y][:, None], visible.shape)[visible] + dy) % HEIGHT
+
+        # Place each sprite row at the left edge, then rotate it right to col so it wraps around
+        bits = self.memory[instances, self.I[instances] + dy].astype(np.uint64) << ROW_SHIFT
+        col = col.astype(np.uint64)
+        bits = (bits >> col) | (bits << ((ROW_BITS - col) % ROW_BITS))
+
+        pixels = self.display[instances, rows]
+        self.display[instances, rows] = pixels ^ bits
+        self.V[instances[(pixels & bits) != 0], 0xF] = 1
+
+    def key_operation(self, i):
+        """ Decodes keypad opcodes (MSB of E). Other EXNN opcodes are no-ops """
+        operation = self.opcode[i] & 0x00FF
+        self.skip_if_key_pressed(i[operation == 0x9E])
+        self.skip_if_key_not_pressed(i[operation == 0xA1])
+
+    def keys(self, i):
+        """ Faults instances whose VX isn't a key, returning the others and their keys """
+        key = self.V[i, (self.opcode[i] >> 8) & 0xF]
+        valid = key < 16
+        self.fault(i[~valid])
+        return (i[valid], key[valid])
+
+    def skip_if_key_pressed(self, i):
+        """ EX9E - Skips next instruction if key with value VX is pressed """
+        i, key = self.keys(i)
+        self.pc[i[self.keypad[i, key] != 0]] += 2
+
+    def skip_if_key_not_pressed(self, i):
+        """ EXA1 - Skips next instruction if key with value VX is not pressed """
+        i, key = self.keys(i)
+        self.pc[i[self.keypad[i, key] == 0]] += 2
+
+    def misc_operation(self, i):
+        """ Decodes miscellaneous opcodes (MSB of F) and calls relevant function """
+        self.dispatch(i, self.opcode[i] & 0x00FF, self.misc_operation_lookup)
+
+    def move_delay_timer_into_reg(self, i):
+        """ FX07 - Sets VX to delay timer """
+        x, _, _ = self.fields(i)
+        self.V[i, x] = self.delay_timer[i]
+
+    def wait_for_keypress(self, i):
+        """ FX0A - Halts the instances until a key is pressed, which set_key then stores in VX """
+        x, _, _ = self.fields(i)
+        self.key_register[i] = x
+        self.halted[i] = True
+
+    def move_reg_into_delay_timer(self, i):
+        """ FX15 - Sets delay timer to VX """
+        x, _, _ = self.fields(i)
+        self.delay_timer[i] = self.V[i, x]
+
+    def move_reg_into_sound_timer(self, i):
+        """ FX18 - Sets sound timer to VX """
+        x, _, _ = self.fields(i)
+        self.sound_timer[i] = self.V[i, x]
+
+    def add_reg_into_index(self, i):
+        """ FX1E - Sets I to I + VX. VF set if range overflow occurs """
+        x, _, _ = self.fields(i)
+        total = self.I[i] + self.V[i, x]
+        self.I[i] = total & 0x0FFF
+        self.V[i, 0xF] = total > 0x0FFF
+
+    def load_index_with_reg_sprite(self, i):
+        """ FX29 - Sets I to the location of the sprite for the character in VX """
+        x, _, _ = self.fields(i)
+        self.I[i] = 0x050 + 5 * self.V[i, x].astype(np.int64)
+
+    def store_bcd_into_memory(self, i):
+        """ FX33 - Sets I to the binary-coded decimal of VX """
+        valid = self.I[i] + 3 <= 4096
+        self.fault(i[~valid])
+        i = i[valid]
+
+        x, _, _ = self.fields(i)
+        value = self.V[i, x]
+        digits = np.stack((value // 100, value // 10 % 10, value % 10), axis=1)
+        self.memory[i[:, None], self.I[i, None] + BCD_DIGITS] = digits
+
+    def register_range(self, i):
+        """
+        Faults instances whose V0 to VX range would run beyond memory from I, returning the others
+        along with a mask of the registers in each one's range
+        """
+        x, _, _ = self.fields(i)
+        valid = self.I[i] + x + 1 <= 4096
+        self.fault(i[~valid])
+        i = i[valid]
+        return (i, REGISTERS <= x[valid][:, None])
+
+    def store_regs_into_memory(self, i):
+        """ FX55 - Stores V0 to VX (including VX) in memory starting at address I """
+        i, selected = self.register_range(i)
+        instances = np.broadcast_to(i[:, None], selected.shape)[selected]
+        addresses = (self.I[i, None] + REGISTERS)[selected]
+        self.memory[instances, addresses] = self.V[i][selected]
+
+    def load_memory_into_regs(self, i):
+        """ FX65 - Fills V0 to VX (including VX) with values from memory starting at address I """
+        i, selected = self.register_range(i)
+        instances = np.broadcast_to(i[:, None], selected.shape)[selected]
+        addresses = (self.I[i, None] + REGISTERS)[selected]
+        registers = np.broadcast_to(REGISTERS, selected.shape)[selected]
+        self.V[instances, registers] = self.memory[instances, addresses]
+
+    ##################
+    # Misc Functions #
+    ##################
+
+    def decrement_timers(self):
+        """ Ticks the delay and sound timers of machines which haven't faulted and restarts the countdown """
+        running = ~self.faulted
+        self.delay_timer[running & (self.delay_timer > 0)] -= 1
+        self.sound_timer[running & (self.sound_timer > 0)] -= 1
+        self.timer_countdown = self.cycles_per_timer_tick
+
+    def set_key(self, index, key, pressed):
+        """
+        Sets whether a key is pressed on a machine. Pressing a key while FX0A is waiting stores it in
+        VX and resumes execution
+        """
+        self.keypad[index, key] = 1 if pressed else 0
+        if pressed and self.halted[index]:
+            self.V[index, self.key_register[index]] = key
+            self.halted[index] = False
+
+    def load_file_to_memory(self, rom, start_address):
+        """ Reads the file into the memory of every machine at start_address. Raises ValueError if it doesn't fit """
+        with open(rom, "rb") as game:
+            data = np.frombuffer(game.read(), dtype=np.uint8)
+        if len(data) > self.memory.shape[1] - start_address:
+            raise ValueError(rom + " is " + str(len(data)) + " bytes, too large to load at " + hex(start_address).upper())
+        self.memory[:, start_address : start_address + len(data)] = data
+
+    def display_bytes(self, index):
+        """ Returns a machine's display packed row by row, as Cpu.display_bytes does """
+        return self.display[index].astype(">u8").tobytes()
+
+    def display_hash(self, index):
+        """ Returns a hex digest of a machine's packed display """
+        return sha1(self.display_bytes(index)).hexdigest()
+
+    def instance(self, index):
+        """ Returns a Cpu holding a copy of one machine's state, which can be run on from there """
+        machine = cpu.Cpu(cycles_per_timer_tick=self.cycles_per_timer_tick)
+        machine.memory[:] = self.memory[index].tobytes()
+        machine.opcode = int(self.opcode[index])
+        machine.V[:] = self.V[index].tobytes()
+        machine.I = int(self.I[index])
+        machine.delay_timer = int(self.delay_timer[index])
+        machine.sound_timer = int(self.sound_timer[index])
+        machine.timer_countdown = self.timer_countdown
+        machine.pc = int(self.pc[index])
+        machine.rng.setstate(self.rngs[index].getstate())
+        machine.cycle_count = int(self.cycle_count[index])
+        machine.halted = bool(self.halted[index])
+        machine.key_register = int(self.key_register[index]) if self.halted[index] else None
+        machine.stack[:] = array("H", self.stack[index].tolist())
+        machine.sp = int(self.sp[index])
+        machine.keypad[:] = self.keypad[index].tobytes()
+        machine.set_display_bytes(self.display_bytes(index))
+        return machine